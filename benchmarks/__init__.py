@@ -0,0 +1,24 @@
+''' Нагрузочные замеры. Запускаются из корня проекта как модули, например:
+python -m benchmarks.bench_base64_memory '''
+
+import os
+import tempfile
+
+
+def setup_django(blob_root=None):
+    """Настраивает Django для запуска замера вне manage.py (фото пишутся во временный каталог)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sprintProject.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('FSTR_BLOB_ROOT', blob_root or tempfile.mkdtemp(prefix='fstr-bench-'))
+
+    import django
+    django.setup()
+
+
+def setup_test_database():
+    """Создает чистую тестовую БД (для SQLite - в памяти), чтобы замеры не трогали рабочие данные"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
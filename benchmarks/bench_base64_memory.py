@@ -0,0 +1,46 @@
+''' Пиковое потребление памяти при декодировании фото из base64: прежний способ
+(base64.b64decode всей строки) против потокового декодера fstr_app.decoders.
+Память под саму входную строку в замер не входит, она одинакова в обоих случаях '''
+
+import base64
+import os
+import tracemalloc
+
+from benchmarks import setup_django
+
+setup_django()
+
+from fstr_app.decoders import decode_base64_to_storage  # noqa: E402
+from fstr_app.storage import get_blob_storage  # noqa: E402
+
+SIZES_MB = [1, 4, 16, 64]
+
+
+def measure(func, value):
+    tracemalloc.start()
+    func(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def old_decoder(value):
+    _, value = value.split(';base64,')
+    get_blob_storage().save(base64.b64decode(value))
+
+
+def new_decoder(value):
+    decode_base64_to_storage(value, get_blob_storage())
+
+
+def main():
+    print(f"{'размер, МБ':>10} | {'b64decode, МБ':>14} | {'потоковый, МБ':>14}")
+    for size_mb in SIZES_MB:
+        value = 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(size_mb * 1024 * 1024)).decode()
+        old_peak = measure(old_decoder, value)
+        new_peak = measure(new_decoder, value)
+        print(f'{size_mb:>10} | {old_peak / 2 ** 20:>14.2f} | {new_peak / 2 ** 20:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+''' Скорость загрузки перевалов (записей/с): по одному через PerevalAddedSerializer,
+как при POST /submitData/, против массового импорта fstr_app.ingest.import_passes '''
+
+import base64
+import json
+import sys
+import time
+
+from benchmarks import setup_django, setup_test_database
+
+setup_django()
+setup_test_database()
+
+from fstr_app.ingest import import_passes  # noqa: E402
+from fstr_app.serializers import PerevalAddedSerializer, prepare_submit_data  # noqa: E402
+
+IMAGE = 'data:image/png;base64,' + base64.b64encode(b'\x89PNG\r\n\x1a\n' + bytes(range(256))).decode()
+
+
+def make_records(count, prefix):
+    for i in range(count):
+        yield {
+            'beautyTitle': 'пер.', 'title': f'{prefix} {i}', 'other_titles': '', 'connect': '',
+            'user': {'email': f'{prefix}{i % 50}@example.com', 'fam': 'Иванов', 'name': 'Иван',
+                     'otc': 'Иванович', 'phone': '+7 555 55 55'},
+            'coords': {'latitude': 45.0 + i / 1000, 'longitude': 7.0, 'height': 1200},
+            'level': {'winter': '', 'summer': '1А', 'autumn': '', 'spring': ''},
+            'images': [{'data': IMAGE, 'title': 'Седловина'}],
+        }
+
+
+def one_by_one(count):
+    for record in make_records(count, 'single'):
+        serializer = PerevalAddedSerializer(data=prepare_submit_data(record))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+
+def bulk(count):
+    report = import_passes((json.dumps(record) for record in make_records(count, 'bulk')), batch_size=500)
+    assert not report.errors, report.errors
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name, func in [('по одному', one_by_one), ('import_passes', bulk)]:
+        started = time.perf_counter()
+        func(count)
+        elapsed = time.perf_counter() - started
+        print(f'{name:>14}: {count} записей за {elapsed:.2f} с, {count / elapsed:.0f} записей/с')
+
+
+if __name__ == '__main__':
+    main()
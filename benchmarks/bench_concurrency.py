@@ -0,0 +1,118 @@
+''' Нагрузочный тест: сколько медленных загрузок (мобильный клиент в горах) выдерживает сервер
+и как при этом отвечает на обычные запросы. N соединений одновременно отправляют POST /submitData/
+с фото, растягивая тело на --upload-seconds секунд, а в это время отдельный клиент раз в 0.2 с
+запрашивает GET /submitData/<id>/ и замеряет время ответа.
+
+Сервер запускается отдельно, например с двумя воркерами в каждом варианте:
+    gunicorn -w 2 -b 127.0.0.1:8001 sprintProject.wsgi:application
+    FSTR_ASYNC_VIEWS=1 gunicorn -w 2 -k uvicorn_worker.UvicornWorker -b 127.0.0.1:8002 sprintProject.asgi:application
+и тест - против каждого из них:
+    python -m benchmarks.bench_concurrency http://127.0.0.1:8001 --slow 50
+    python -m benchmarks.bench_concurrency http://127.0.0.1:8002 --slow 50
+
+У sync-воркеров каждая медленная загрузка занимает воркер целиком, и быстрые запросы ждут в очереди;
+под ASGI тело принимает цикл событий, и быстрые запросы обслуживаются сразу '''
+
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+IMAGE = Path(__file__).resolve().parent.parent / 'image.jpg'
+
+
+def submission(index):
+    return json.dumps({
+        'beautyTitle': 'пер.', 'title': f'Нагрузка {index}', 'other_titles': '', 'connect': '',
+        'user': {'email': 'load@example.com', 'fam': 'Тестов', 'name': 'Тест', 'otc': '', 'phone': '+7 555'},
+        'coords': {'latitude': '43.35', 'longitude': '42.44', 'height': '3000'},
+        'level': {'summer': '1А'},
+        'images': [{'data': 'data:image/jpeg;base64,' + base64.b64encode(IMAGE.read_bytes()).decode(), 'title': 'Фото'}],
+    }, ensure_ascii=False).encode()
+
+
+async def request(host, port, method, path, body=b'', upload_seconds=0.0, timeout=120.0):
+    """ HTTP/1.1-запрос, тело отправляется 20 порциями за upload_seconds.
+    Возвращает (код ответа, тело); при ошибке соединения или таймауте - (None, b'') """
+    async def send():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            head = (f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+            writer.write(head.encode())
+            pieces = 20 if upload_seconds else 1
+            step = max(1, -(-len(body) // pieces))
+            for start in range(0, len(body), step):
+                writer.write(body[start:start + step])
+                await writer.drain()
+                if upload_seconds:
+                    await asyncio.sleep(upload_seconds / pieces)
+            response = await reader.read()
+        finally:
+            writer.close()
+        status_line, _, rest = response.partition(b'\r\n')
+        return int(status_line.split()[1]), rest.partition(b'\r\n\r\n')[2]
+
+    try:
+        return await asyncio.wait_for(send(), timeout)
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+        return None, b''
+
+
+async def probe(host, port, path, stop, timeout):
+    """Время ответа быстрого GET-запроса (с), пока не выставлен stop; None - таймаут или ошибка"""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        code, _ = await request(host, port, 'GET', path, timeout=timeout)
+        latencies.append(time.perf_counter() - started if code == 200 else None)
+        await asyncio.sleep(0.2)
+    return latencies
+
+
+async def run(url, slow, upload_seconds, timeout):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    code, content = await request(host, port, 'POST', '/submitData/', submission(0))
+    if code != 200:
+        raise SystemExit(f'Не удалось создать перевал: {code} {content[:200]!r}')
+    detail = f"/submitData/{json.loads(content)['id']}/"
+
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(host, port, detail, stop, timeout))
+    started = time.perf_counter()
+    uploads = await asyncio.gather(*(
+        request(host, port, 'POST', '/submitData/', submission(i), upload_seconds, timeout) for i in range(1, slow + 1)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    latencies = await prober
+
+    ok = sum(1 for code, _ in uploads if code == 200)
+    answered = sorted(value for value in latencies if value is not None)
+    print(f'{url}: {slow} медленных загрузок по {upload_seconds:g} с')
+    print(f'  загрузок завершено: {ok} из {slow} за {elapsed:.1f} с')
+    if answered:
+        p95 = answered[min(len(answered) - 1, int(len(answered) * 0.95))]
+        print(f'  GET во время загрузок: {len(answered)} ответов, медиана {statistics.median(answered) * 1000:.0f} мс, '
+              f'p95 {p95 * 1000:.0f} мс, максимум {answered[-1] * 1000:.0f} мс')
+    print(f'  GET без ответа (таймаут {timeout:g} с или ошибка): {len(latencies) - len(answered)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url', help='адрес запущенного сервера, например http://127.0.0.1:8000')
+    parser.add_argument('--slow', type=int, default=50, help='число одновременных медленных загрузок')
+    parser.add_argument('--upload-seconds', type=float, default=10, help='за сколько секунд отправляется тело')
+    parser.add_argument('--timeout', type=float, default=60, help='таймаут одного запроса, с')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.slow, args.upload_seconds, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
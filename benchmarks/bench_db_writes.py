@@ -0,0 +1,95 @@
+''' Пропускная способность записи при одновременных POST /submitData/ для профилей БД
+(settings.FSTR_DB_ENGINE): SQLite без настроек, SQLite в режиме WAL (профиль по умолчанию)
+и PostgreSQL с пулом соединений. Потоки одновременно сохраняют перевалы через PerevalAddedSerializer,
+как это делает POST /submitData/ (без фото - замеряется только БД), и считают сохраненные записи
+и ошибки "database is locked".
+
+Каждый профиль замеряется в отдельном процессе: настройки БД читаются при запуске Django.
+PostgreSQL замеряется, если задан FSTR_DB_HOST, например:
+    docker compose --profile postgres up -d sprint-postgres
+    FSTR_DB_HOST=localhost FSTR_DB_PASS=fstr python -m benchmarks.bench_db_writes --threads 16 '''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROFILES = {
+    'sqlite, rollback journal': {'FSTR_DB_ENGINE': 'sqlite', 'FSTR_SQLITE_TUNED': '0'},
+    'sqlite, WAL': {'FSTR_DB_ENGINE': 'sqlite', 'FSTR_SQLITE_TUNED': '1'},
+    'postgresql, pool': {'FSTR_DB_ENGINE': 'postgresql'},
+}
+
+
+def submission(thread, index):
+    return {
+        'beautyTitle': 'пер.', 'title': f'Запись {thread}-{index}', 'other_titles': '', 'connect': '',
+        'user': {'email': f'writer{thread}@example.com', 'fam': 'Тестов', 'name': 'Тест', 'otc': '', 'phone': '+7 555'},
+        'coords': {'latitude': '43.35', 'longitude': '42.44', 'height': '3000'},
+        'level': {'summer': '1А'},
+        'images': [],
+    }
+
+
+def measure(threads, count):
+    """Запускается в процессе с нужным профилем. Возвращает {'saved', 'errors', 'seconds'}"""
+    from benchmarks import setup_django, setup_test_database
+
+    setup_django()
+    setup_test_database()
+
+    from django.db import OperationalError, connection
+    from fstr_app.serializers import PerevalAddedSerializer, prepare_submit_data
+
+    def write(thread):
+        saved = errors = 0
+        try:
+            for index in range(count):
+                serializer = PerevalAddedSerializer(data=prepare_submit_data(submission(thread, index)))
+                try:
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    saved += 1
+                except OperationalError:
+                    errors += 1
+        finally:
+            connection.close()
+        return saved, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(write, range(threads)))
+    return {'saved': sum(saved for saved, _ in results), 'errors': sum(errors for _, errors in results),
+            'seconds': time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='число одновременно пишущих потоков')
+    parser.add_argument('--count', type=int, default=100, help='перевалов на поток')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.threads, args.count)))
+        return
+
+    print(f"{'профиль':>26} | {'записей/с':>10} | {'сохранено':>10} | {'ошибок':>7}")
+    for name, env in PROFILES.items():
+        if env['FSTR_DB_ENGINE'] == 'postgresql' and not os.getenv('FSTR_DB_HOST'):
+            print(f'{name:>26} | пропущен: не задан FSTR_DB_HOST')
+            continue
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_db_writes', '--measure',
+             '--threads', str(args.threads), '--count', str(args.count)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:>26} | {result['saved'] / result['seconds']:>10.0f} | {result['saved']:>10} | {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
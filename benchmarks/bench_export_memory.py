@@ -0,0 +1,66 @@
+''' Пиковое потребление памяти при выгрузке перевалов: весь список одним ответом
+(PerevalAddedSerializer(many=True) + JSONRenderer) против потоковой выгрузки fstr_app.export.
+У потоковой выгрузки пик должен оставаться примерно одинаковым при любом числе перевалов '''
+
+import sys
+import tracemalloc
+
+from benchmarks import setup_django, setup_test_database
+
+setup_django()
+setup_test_database()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from fstr_app.export import stream_export  # noqa: E402
+from fstr_app.models import User, Coords, PerevalAdded  # noqa: E402
+from fstr_app.serializers import PerevalAddedSerializer  # noqa: E402
+
+BATCH = 5000
+
+
+def populate(count, user):
+    for start in range(0, count, BATCH):
+        size = min(BATCH, count - start)
+        coords = Coords.objects.bulk_create([Coords(latitude=43.0, longitude=42.5, height=3000) for _ in range(size)])
+        PerevalAdded.objects.bulk_create([
+            PerevalAdded(user=user, coords=item, beautyTitle='пер.', title=f'Перевал {start + i}',
+                         other_titles='Безымянный', connect='Долина - Ущелье')
+            for i, item in enumerate(coords)
+        ])
+
+
+def measure(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def whole_list():
+    queryset = PerevalAddedSerializer.query_plan.apply(PerevalAdded.objects.order_by('id'))
+    return len(JSONRenderer().render(PerevalAddedSerializer(queryset, many=True).data))
+
+
+def streamed():
+    # Байты не копятся, как если бы каждый кусок сразу уходил клиенту
+    return sum(len(chunk) for chunk in stream_export(PerevalAdded.objects.all()))
+
+
+def main():
+    sizes = [int(value) for value in sys.argv[1:]] or [10_000, 50_000, 100_000]
+    user = User.objects.create(email='bench@example.com', first_name='Иван', last_name='Иванов',
+                               middle_name='', phone='')
+    total = 0
+    print(f"{'перевалов':>10} | {'одним списком, МБ':>18} | {'потоком, МБ':>12}")
+    for count in sizes:
+        populate(count - total, user)
+        total = count
+        list_peak = measure(whole_list)
+        stream_peak = measure(streamed)
+        print(f'{count:>10} | {list_peak / 2 ** 20:>18.1f} | {stream_peak / 2 ** 20:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+''' Поиск перевалов в радиусе от точки: полный перебор (все координаты из БД + формула
+гаверсинуса) против отбора кандидатов по индексу geohash (fstr_app.geo.nearby).
+По умолчанию 1 000 000 перевалов, случайно разбросанных по горным районам '''
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import setup_django, setup_test_database
+
+setup_django()
+setup_test_database()
+
+from fstr_app import geo  # noqa: E402
+from fstr_app.models import User, Coords, PerevalAdded  # noqa: E402
+
+# Центры районов: Кавказ, Алтай, Альпы, Памир, Тянь-Шань
+REGIONS = [(43.0, 43.0), (50.0, 87.0), (46.0, 8.0), (38.5, 73.0), (42.0, 78.0)]
+BATCH = 10000
+
+
+def populate(count):
+    rnd = random.Random(42)
+    user = User.objects.create(email='bench@example.com', first_name='Иван', last_name='Иванов',
+                               middle_name='', phone='')
+    for start in range(0, count, BATCH):
+        coords = []
+        for _ in range(min(BATCH, count - start)):
+            lat, lon = rnd.choice(REGIONS)
+            item = Coords(latitude=round(lat + rnd.uniform(-3, 3), 6),
+                          longitude=round(lon + rnd.uniform(-5, 5), 6), height=rnd.randint(500, 7000))
+            item.fill_geohash()
+            coords.append(item)
+        coords = Coords.objects.bulk_create(coords)
+        PerevalAdded.objects.bulk_create(
+            [PerevalAdded(user=user, coords=item, beautyTitle='пер.', title=f'Перевал {item.id}',
+                          other_titles='', connect='') for item in coords]
+        )
+
+
+def full_scan(latitude, longitude, radius_km):
+    ids, latitudes, longitudes = zip(*PerevalAdded.objects.values_list('id', 'coords__latitude', 'coords__longitude'))
+    distances = geo.haversine_km(latitude, longitude, latitudes, longitudes)
+    inside = np.flatnonzero(distances <= radius_km)
+    return [(ids[i], float(distances[i])) for i in inside[np.argsort(distances[inside], kind='stable')]]
+
+
+def measure(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    started = time.perf_counter()
+    populate(count)
+    print(f'Заполнение: {count} перевалов за {time.perf_counter() - started:.1f} с')
+
+    queryset = PerevalAdded.objects.all()
+    for radius_km in (5, 25, 100):
+        scan_time, expected = measure(lambda: full_scan(43.35, 42.44, radius_km))
+        index_time, found = measure(lambda: geo.nearby(queryset, 43.35, 42.44, radius_km))
+        assert [pk for pk, _ in found] == [pk for pk, _ in expected]
+        print(f'радиус {radius_km:>3} км, найдено {len(found):>6}: полный перебор {scan_time * 1000:8.1f} мс, '
+              f'geohash {index_time * 1000:8.1f} мс, ускорение x{scan_time / index_time:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+''' Поиск перевалов по названию: перебор с LIKE против полнотекстового индекса (fstr_app.search).
+По умолчанию 500 000 перевалов: название - прилагательное из небольшого списка и случайное
+"топонимическое" слово из слогов (десятки тысяч разных слов, как в настоящем архиве) '''
+
+import random
+import sys
+import time
+
+from benchmarks import setup_django, setup_test_database
+
+setup_django()
+setup_test_database()
+
+from fstr_app import search  # noqa: E402
+from fstr_app.models import User, Coords, PerevalAdded  # noqa: E402
+
+WORDS = ['Ледовый', 'Снежный', 'Каменный', 'Южный', 'Северный', 'Безымянный', 'Черный', 'Белый',
+         'Пхия', 'Хан-Тенгри', 'Туристов', 'Альпинистов', 'Голубой', 'Узкий', 'Ветреный', 'Дальний']
+SYLLABLES = ['ка', 'ра', 'ту', 'ол', 'ши', 'хан', 'тен', 'гри', 'пхи', 'я', 'бел', 'ал', 'даг', 'су', 'ор', 'ки',
+             'ман', 'зу', 'ле', 'нар', 'ба', 'чу', 'ем', 'ты', 'ун', 'гол', 'ри', 'ас']
+BATCH = 10000
+
+
+def toponym(rnd):
+    return ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).capitalize()
+
+
+def populate(count):
+    rnd = random.Random(42)
+    user = User.objects.create(email='bench@example.com', first_name='Иван', last_name='Иванов',
+                               middle_name='', phone='')
+    coords = Coords.objects.create(latitude=43.0, longitude=43.0, height=3000)
+    for start in range(0, count, BATCH):
+        PerevalAdded.objects.bulk_create([
+            PerevalAdded(user=user, coords=coords, beautyTitle='пер.',
+                         title=f'{rnd.choice(WORDS)} {toponym(rnd)}', other_titles=toponym(rnd),
+                         connect=f'{toponym(rnd)} - {toponym(rnd)}')
+            for i in range(min(BATCH, count - start))
+        ])
+
+
+def measure(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def like_scan(word):
+    return list(PerevalAdded.objects.filter(title__icontains=word).order_by('id').values_list('id', flat=True)[:20])
+
+
+def indexed(query):
+    return search.SearchResults(query)[0:20]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    started = time.perf_counter()
+    populate(count)
+    print(f'Заполнение: {count} перевалов за {time.perf_counter() - started:.1f} с')
+    started = time.perf_counter()
+    search.rebuild_index()
+    print(f'Построение индекса: {time.perf_counter() - started:.1f} с')
+
+    # Последний запрос - короткое начало слова, под которое подходит заметная часть архива (худший случай)
+    for query, like in [('Тенгрибел', 'Тенгрибел'), ('Tengribel', 'Tengribel'),
+                        ('ледового Тенгрибел', 'Тенгрибел'), ('Пхия', 'Пхия')]:
+        scan_time, scan = measure(lambda: like_scan(like))
+        index_time, found = measure(lambda: indexed(query))
+        print(f'{query!r:>22}: LIKE {scan_time * 1000:7.1f} мс ({len(scan)} шт.), '
+              f'индекс {index_time * 1000:7.1f} мс ({len(found)} шт.)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+''' Чтение страницы перевалов: PerevalAddedSerializer (объекты моделей + поля DRF) против
+скомпилированной сборки строк из values() (fstr_app.projection). Оба пути должны давать
+одинаковый JSON байт в байт. По умолчанию 10 000 перевалов, у каждого по два фото '''
+
+import sys
+import time
+
+from benchmarks import setup_django, setup_test_database
+
+setup_django()
+setup_test_database()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from fstr_app import projection  # noqa: E402
+from fstr_app.models import User, Coords, PerevalAdded, PerevalImage, PerevalAddedImage  # noqa: E402
+from fstr_app.serializers import PerevalAddedSerializer  # noqa: E402
+
+BATCH = 5000
+
+
+def populate(count):
+    user = User.objects.create(email='bench@example.com', first_name='Иван', last_name='Иванов',
+                               middle_name=None, phone='+7 000 000 00 00')
+    for start in range(0, count, BATCH):
+        size = min(BATCH, count - start)
+        coords = Coords.objects.bulk_create([Coords(latitude=43.0 + i / 1e4, longitude=42.5, height=3000 + i)
+                                             for i in range(size)])
+        perevals = PerevalAdded.objects.bulk_create([
+            PerevalAdded(user=user, coords=item, beautyTitle='пер.', title=f'Перевал {start + i}',
+                         other_titles='', connect='Долина - Ущелье', winter_level='1А')
+            for i, item in enumerate(coords)
+        ])
+        images = PerevalImage.objects.bulk_create([PerevalImage(title=f'Фото {n}', sha256=f'{n:064x}', size=0)
+                                                   for n in range(2 * size)])
+        PerevalAddedImage.objects.bulk_create([PerevalAddedImage(pereval=pereval, image=image)
+                                               for pereval, image in zip(perevals * 2, images)])
+
+
+def measure(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def queryset():
+    return PerevalAdded.objects.order_by('add_time', 'id')
+
+
+def with_serializer():
+    plan = PerevalAddedSerializer.query_plan
+    return JSONRenderer().render(PerevalAddedSerializer(plan.apply(queryset()), many=True).data)
+
+
+def compiled():
+    fields = projection.FULL_FIELDS
+    return JSONRenderer().render(projection.build_rows(projection.project(queryset(), fields), fields))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    populate(count)
+
+    serializer_time, expected = measure(with_serializer)
+    compiled_time, result = measure(compiled)
+    assert result == expected, 'JSON скомпилированного пути отличается от PerevalAddedSerializer'
+
+    print(f'{count} перевалов, {len(expected)} байт JSON (одинаковый)')
+    print(f'PerevalAddedSerializer: {serializer_time:6.2f} с, {count / serializer_time:9.0f} строк/с')
+    print(f'values() + сборка:      {compiled_time:6.2f} с, {count / compiled_time:9.0f} строк/с '
+          f'(x{serializer_time / compiled_time:.1f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FstrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fstr_app'
+
+    def ready(self):
+        # Регистрируем обработчики фоновых заданий (декоратор fstr_app.jobs.job) и сигналов
+        from . import renditions, image_gc, sync, search, stats  # noqa: F401
@@ -0,0 +1,72 @@
+import threading
+from dataclasses import dataclass, field
+
+from .models import PerevalArea, VersionStamp, AREA_TREE_STAMP
+
+
+''' Кэш всего дерева районов (PerevalArea) в памяти процесса. Дерево меняется редко, а читается
+при каждом запросе к /areas/, поэтому процесс держит его целиком и перечитывает только после смены
+номера версии (VersionStamp), который PerevalArea.save()/delete() увеличивают. Проверка версии -
+один легкий запрос, так что изменения, сделанные другими процессами, видны сразу '''
+
+
+@dataclass
+class AreaNode:
+    id: int
+    parent_id: int
+    title: str
+    path: str
+    depth: int
+    children: list = field(default_factory=list)
+
+    def as_dict(self, with_children=True):
+        data = {'id': self.id, 'title': self.title, 'depth': self.depth}
+        if with_children:
+            data['children'] = [child.as_dict() for child in self.children]
+        return data
+
+
+class AreaTree:
+    def __init__(self, version, rows):
+        self.version = version
+        self.nodes = {}
+        self.roots = []
+        # rows упорядочены по path, т.е. родитель всегда идет раньше своих подрайонов
+        for pk, parent_id, title, path, depth in rows:
+            node = self.nodes[pk] = AreaNode(pk, parent_id, title, path, depth)
+            parent = self.nodes.get(parent_id)
+            (parent.children if parent is not None else self.roots).append(node)
+
+    def __contains__(self, pk):
+        return pk in self.nodes
+
+    def breadcrumbs(self, pk):
+        """Районы от корня до pk включительно"""
+        ids = [int(part) for part in self.nodes[pk].path.strip('/').split('/')]
+        return [self.nodes[part] for part in ids if part in self.nodes]
+
+    def subtree(self, pk):
+        return self.nodes[pk]
+
+    def as_list(self):
+        return [root.as_dict() for root in self.roots]
+
+
+_tree = None
+_lock = threading.Lock()
+
+
+def get_area_tree():
+    """Дерево районов из кэша; перестраивается одним запросом, если версия в БД изменилась"""
+    global _tree
+    # Версию читаем до данных: если дерево изменится в промежутке, следующий вызов его перечитает
+    version = VersionStamp.objects.current(AREA_TREE_STAMP)
+    tree = _tree
+    if tree is not None and tree.version == version:
+        return tree
+
+    with _lock:
+        if _tree is None or _tree.version != version:
+            rows = PerevalArea.objects.order_by('path').values_list('id', 'id_parent', 'title', 'path', 'depth')
+            _tree = AreaTree(version, list(rows))
+        return _tree
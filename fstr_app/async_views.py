@@ -0,0 +1,185 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from rest_framework import exceptions, serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .models import PerevalAdded
+from .serializers import PerevalAddedSerializer, prepare_submit_data
+from .pagination import PerevalCursorPagination
+from .projection import FULL_FIELDS, requested_fields, project, abuild_rows
+from .conditional import alist_state, detail_etag, list_etag, not_modified, set_validators
+from .db_router import AsyncReplicaReadMixin
+from .views import PerevalListCreateView, PerevalDetailView, PerevalUpdateView
+from . import response_cache
+
+
+''' Async-варианты GET/POST /submitData/, GET /submitData/<id>/ и PATCH /submitData/<id> для запуска
+под ASGI (uvicorn, FSTR_ASYNC_VIEWS=1). Ответы те же, что у представлений из fstr_app/views.py, байт в байт.
+Под ASGI тело запроса принимает цикл событий (ASGIHandler), и медленная загрузка с мобильного
+не занимает воркер: представление вызывается, когда тело уже получено целиком.
+Чтение идет через async ORM (afirst, aget, aaggregate, async for). Сохранение перевала - код сериализатора
+с transaction.atomic, а транзакции async ORM не поддерживает, поэтому оно выполняется через sync_to_async.
+Так же выбирается страница курсорной пагинации DRF: async ORM сам выполняет запросы через sync_to_async
+в том же потоке, так что отдельная async-реализация пагинации ничего бы не дала '''
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    # Тот же JSON, что у Response DRF с JSONRenderer
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def not_found():
+    return json_response({'detail': exceptions.NotFound.default_detail}, status.HTTP_404_NOT_FOUND)
+
+
+def parse_body(request):
+    # request.read(), а не request.body: у .body предел DATA_UPLOAD_MAX_MEMORY_SIZE, а фото в base64 больше
+    try:
+        data = json.loads(request.read())
+    except ValueError as e:
+        raise serializers.ValidationError(f'JSON parse error - {e}')
+    if not isinstance(data, dict):
+        raise serializers.ValidationError('Тело запроса должно быть JSON-объектом')
+    return data
+
+
+async def read_json(request):
+    """ Тело запроса как JSON. Тело к этому моменту уже принято асинхронно (больше FILE_UPLOAD_MAX_MEMORY_SIZE -
+    во временном файле), а чтение и разбор многомегабайтной строки идут в отдельном потоке,
+    чтобы не останавливать цикл событий """
+    return await sync_to_async(parse_body, thread_sensitive=False)(request)
+
+
+def save_submission(data):
+    serializer = PerevalAddedSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def save_update(instance, data):
+    serializer = PerevalAddedSerializer(instance, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class AsyncJSONView(View):
+    """ Основа async-представлений: как и APIView DRF, без проверки CSRF
+    (клиенты API - мобильные приложения без cookie сессии).
+    drf-spectacular описывает только представления DRF, поэтому в схему OpenAPI эндпоинт попадает
+    через schema_view - sync-представление с теми же запросами и ответами """
+    schema_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = csrf_exempt(super().as_view(**initkwargs))
+        if cls.schema_view is not None:
+            # По атрибутам cls / initkwargs генератор схемы DRF находит представление и его @extend_schema
+            view.cls = cls.schema_view
+            view.initkwargs = {}
+        return view
+
+
+class AsyncPerevalListCreateView(AsyncReplicaReadMixin, AsyncJSONView):
+    schema_view = PerevalListCreateView
+
+    async def get(self, request, *args, **kwargs):
+        email = request.GET.get('user__email')
+        if not email:
+            return json_response({"error": "Параметр user__email обязателен"}, status.HTTP_400_BAD_REQUEST)
+        queryset = PerevalAdded.objects.filter(user__email=email)
+
+        state = await alist_state(queryset)
+        etag = list_etag(request, state)
+        response = not_modified(request, etag, state['last_modified'])
+        if response is not None:
+            return response
+
+        # Request DRF - для query_params и ссылок next / previous пагинатора
+        api_request = Request(request)
+        try:
+            fields = requested_fields(api_request)
+        except serializers.ValidationError as e:
+            return json_response({"error": e.detail[0]}, status.HTTP_400_BAD_REQUEST)
+
+        paginator = PerevalCursorPagination()
+        try:
+            page = await sync_to_async(paginator.paginate_queryset)(project(queryset, fields), api_request)
+        except exceptions.NotFound as e:
+            return json_response({'detail': e.detail}, status.HTTP_404_NOT_FOUND)
+        data = paginator.get_paginated_response(await abuild_rows(page, fields)).data
+        return set_validators(json_response(data), etag, state['last_modified'])
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = prepare_submit_data(await read_json(request))
+            pereval = await sync_to_async(save_submission)(data)
+            return json_response({
+                'status': status.HTTP_200_OK,
+                'message': 'Отправлено успешно',
+                'id': pereval.id,
+            })
+        except serializers.ValidationError as e:
+            return json_response({'status': status.HTTP_400_BAD_REQUEST, 'message': str(e.detail), 'id': None},
+                                 status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return json_response({'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                  'message': f'Ошибка при выполнении операции: {str(e)}', 'id': None},
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def pereval_data(pk):
+    """Данные перевала в виде PerevalAddedSerializer, собранные из values()"""
+    rows = await abuild_rows(project(PerevalAdded.objects.filter(pk=pk), FULL_FIELDS), FULL_FIELDS)
+    if not rows:
+        raise PerevalAdded.DoesNotExist
+    return rows[0]
+
+
+class AsyncPerevalDetailView(AsyncReplicaReadMixin, AsyncJSONView):
+    schema_view = PerevalDetailView
+
+    async def get(self, request, pk, *args, **kwargs):
+        state = await PerevalAdded.objects.filter(pk=pk).values_list('row_token', 'version', 'updated_at').afirst()
+        if state is None:
+            return not_found()
+        row_token, version, updated_at = state
+        etag = detail_etag(request, pk, row_token, version)
+        response = not_modified(request, etag, updated_at)
+        if response is not None:
+            return response
+
+        try:
+            data = await response_cache.aget_or_build(
+                response_cache.detail_key(pk, row_token, version), lambda: pereval_data(pk)
+            )
+        except PerevalAdded.DoesNotExist:
+            # Перевал удалили между двумя запросами
+            return not_found()
+        return set_validators(json_response(data), etag, updated_at)
+
+
+class AsyncPerevalUpdateView(AsyncJSONView):
+    http_method_names = ['patch']
+    schema_view = PerevalUpdateView
+
+    async def patch(self, request, pk, *args, **kwargs):
+        try:
+            instance = await PerevalAdded.objects.select_related('user', 'coords').aget(pk=pk)
+        except PerevalAdded.DoesNotExist:
+            return not_found()
+
+        try:
+            data = await read_json(request)
+            await sync_to_async(save_update)(instance, data)
+            return json_response({'state': 1, 'message': 'Запись успешно обновлена'})
+        except serializers.ValidationError as e:
+            return json_response({'state': 0, 'message': str(e.detail)}, status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return json_response({'state': 0, 'message': f'Ошибка при обновлении: {str(e)}'},
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,69 @@
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+''' Условные GET-запросы: ответы на чтение перевалов содержат ETag и Last-Modified, и клиент,
+у которого уже есть актуальная версия (If-None-Match / If-Modified-Since), получает 304 без тела.
+Проверка не требует сериализации: для одного перевала достаточно его row_token, version и updated_at,
+для списка - одного агрегирующего запроса по той же выборке '''
+
+
+def renderer_format(request):
+    # У async-представлений (fstr_app.async_views) нет согласования формата DRF, они всегда отдают JSON
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer is not None else 'json'
+
+
+def detail_etag(request, pk, row_token, version):
+    return quote_etag(f'{pk}-{row_token}-{version}-{renderer_format(request)}')
+
+
+def state_aggregates():
+    return {'count': Count('id'), 'versions': Sum('version'), 'last_modified': Max('updated_at')}
+
+
+def list_state(queryset):
+    """ Число записей, сумма версий и время последнего изменения выборки. Версии только растут,
+    поэтому сумма меняется при любом изменении записи, а вместе с числом - и при удалении """
+    return queryset.order_by().aggregate(**state_aggregates())
+
+
+async def alist_state(queryset):
+    return await queryset.order_by().aaggregate(**state_aggregates())
+
+
+def list_etag(request, state):
+    # В ETag входят параметры запроса: у разных страниц и размеров страницы разные ответы
+    raw = f"{request.get_full_path()}|{renderer_format(request)}|" \
+          f"{state['count']}|{state['versions']}|{state['last_modified']}"
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def not_modified(request, etag, last_modified):
+    """Ответ 304 (или 412 для If-Match), если у клиента актуальная версия, иначе None"""
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+class ConditionalListMixin:
+    """ Примешивается к спискам перевалов (ListAPIView): ETag и Last-Modified по агрегату
+    выборки get_queryset(), ответ 304 - до пагинации и сериализации """
+
+    def list(self, request, *args, **kwargs):
+        state = list_state(self.get_queryset())
+        etag = list_etag(request, state)
+        response = not_modified(request, etag, state['last_modified'])
+        if response is not None:
+            return response
+        return set_validators(super().list(request, *args, **kwargs), etag, state['last_modified'])
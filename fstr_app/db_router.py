@@ -0,0 +1,149 @@
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+
+from .models import ChangeLog
+from . import metrics
+
+
+''' Чтение с реплик. GET-запросы списков и карточки перевала (представления с ReplicaReadMixin)
+читают с реплики из settings.FSTR_DB_REPLICAS, все остальное - с основной БД. Псевдоним БД для чтений
+запроса хранится в contextvar, поэтому доходит и до запросов async ORM, которые выполняются в потоке
+через sync_to_async. Запись всегда идет в основную БД.
+
+Реплика, которая отстает больше FSTR_DB_REPLICA_MAX_LAG секунд или недоступна, пропускается.
+Отставание - сколько секунд назад было записано самое старое изменение журнала ChangeLog, которого
+на реплике еще нет; замеряется не чаще раза в FSTR_DB_REPLICA_LAG_CHECK_INTERVAL секунд.
+Клиент, который только что что-то записал, должен видеть свою запись: после успешного POST/PATCH
+ответ ставит cookie на FSTR_DB_READ_YOUR_WRITES_SECONDS секунд, и с ней (или с заголовком
+X-Read-Your-Writes) чтения идут с основной БД. Решения и отставание видны в GET /metrics/ '''
+
+PRIMARY = 'default'
+READ_YOUR_WRITES_HEADER = 'X-Read-Your-Writes'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Псевдоним БД для чтений текущего запроса; None - решает Django (основная БД)
+read_alias = ContextVar('fstr_read_alias', default=None)
+
+_lags = {}  # реплика -> (time.monotonic() замера, отставание в секундах или None, если недоступна)
+_turn = itertools.count()
+
+
+def measure_lag(alias):
+    """Отставание реплики alias в секундах, None - реплика недоступна"""
+    try:
+        last_id = ChangeLog.objects.using(alias).order_by('-id').values_list('id', flat=True).first()
+    except DatabaseError:
+        return None
+    missing = ChangeLog.objects.using(PRIMARY).filter(id__gt=last_id or 0).order_by('id')
+    oldest = missing.values_list('created_at', flat=True).first()
+    return 0.0 if oldest is None else max((timezone.now() - oldest).total_seconds(), 0.0)
+
+
+def replica_lag(alias):
+    now = time.monotonic()
+    checked = _lags.get(alias)
+    if checked is None or now - checked[0] >= settings.FSTR_DB_REPLICA_LAG_CHECK_INTERVAL:
+        checked = _lags[alias] = (now, measure_lag(alias))
+        metrics.set_gauge('db_replica_up', int(checked[1] is not None), alias=alias)
+        if checked[1] is not None:
+            metrics.set_gauge('db_replica_lag_seconds', round(checked[1], 3), alias=alias)
+    return checked[1]
+
+
+def wants_primary(request):
+    """Клиент недавно писал (cookie read-your-writes) или сам просит читать с основной БД"""
+    return settings.FSTR_DB_PRIMARY_COOKIE in request.COOKIES or READ_YOUR_WRITES_HEADER in request.headers
+
+
+def choose_read_alias(request):
+    """БД для чтений запроса и причина выбора (метка в метриках)"""
+    replicas = settings.FSTR_DB_REPLICAS
+    if not replicas:
+        return PRIMARY, 'no_replicas'
+    if request.method not in ('GET', 'HEAD'):
+        return PRIMARY, 'write'
+    if wants_primary(request):
+        return PRIMARY, 'read_your_writes'
+    # По кругу, начиная со следующей реплики; отстающие и недоступные пропускаются
+    start = next(_turn)
+    for offset in range(len(replicas)):
+        alias = replicas[(start + offset) % len(replicas)]
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.FSTR_DB_REPLICA_MAX_LAG:
+            return alias, 'replica'
+    return PRIMARY, 'replica_lag'
+
+
+def route_reads(request):
+    alias, reason = choose_read_alias(request)
+    metrics.incr('db_read_routing_total', target=alias, reason=reason)
+    return alias
+
+
+@contextmanager
+def reading_from(alias):
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Роутер БД (settings.DATABASE_ROUTERS)"""
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной БД, объекты из них можно связывать
+        return True
+
+
+class ReplicaReadMixin:
+    """Примешивается к представлениям DRF: чтения GET-запроса идут с реплики, если это возможно"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with reading_from(route_reads(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncReplicaReadMixin:
+    """То же для async-представлений (fstr_app.async_views)"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Замер отставания - запросы к БД, в async-контексте они выполняются в потоке
+        alias = await sync_to_async(route_reads)(request)
+        with reading_from(alias):
+            return await super().dispatch(request, *args, **kwargs)
+
+
+def remember_write(request, response):
+    if (settings.FSTR_DB_REPLICAS and request.method not in SAFE_METHODS
+            and response.status_code < 400):
+        response.set_cookie(settings.FSTR_DB_PRIMARY_COOKIE, '1', max_age=settings.FSTR_DB_READ_YOUR_WRITES_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@sync_and_async_middleware
+def read_your_writes_middleware(get_response):
+    """После успешной записи ставит cookie, по которой следующие чтения клиента идут с основной БД"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return remember_write(request, await get_response(request))
+    else:
+        def middleware(request):
+            return remember_write(request, get_response(request))
+    return middleware
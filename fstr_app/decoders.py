@@ -0,0 +1,70 @@
+import binascii
+import re
+
+from .storage import BlobTooLarge, CHUNK_SIZE
+
+
+''' Потоковый декодер base64 для фото, присланных строкой в images[].data.
+Строка декодируется порциями по CHUNK_SIZE символов (кратно 4), и каждая порция сразу уходит
+в хранилище или файл, поэтому в памяти не появляется вторая полная копия фото в байтах '''
+
+DATA_URI_RE = re.compile(r'data:(image/[\w.+-]+);base64,')
+NON_BASE64_RE = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+class Base64DecodeError(ValueError):
+    pass
+
+
+def parse_data_uri(value: str):
+    """ Проверяет заголовок data:image/...;base64, и возвращает (MIME-тип, позиция начала данных).
+    Строка без заголовка считается "голым" base64 """
+    if not value.startswith('data:'):
+        return None, 0
+    match = DATA_URI_RE.match(value)
+    if match is None:
+        raise Base64DecodeError('Некорректный заголовок data URI, ожидается data:image/<тип>;base64,')
+    return match.group(1), match.end()
+
+
+def estimate_decoded_size(value: str, start: int = 0) -> int:
+    """Размер данных после декодирования (оценка сверху, без учета пробелов и переносов)"""
+    return (len(value) - start) * 3 // 4 - value.count('=', max(start, len(value) - 2))
+
+
+def iter_base64_chunks(value: str, start: int = 0, chunk_size: int = CHUNK_SIZE):
+    """ Декодирует строку порциями. Символы вне алфавита base64 (переносы строк и т.п.)
+    отбрасываются, как это делает base64.b64decode без validate """
+    chunk_size -= chunk_size % 4
+    carry = ''
+    for pos in range(start, len(value), chunk_size):
+        part = carry + NON_BASE64_RE.sub('', value[pos:pos + chunk_size])
+        aligned = len(part) - len(part) % 4
+        carry = part[aligned:]
+        if aligned:
+            try:
+                yield binascii.a2b_base64(part[:aligned])
+            except binascii.Error as e:
+                raise Base64DecodeError(str(e))
+    if carry:
+        raise Base64DecodeError('Некорректный формат Base64: длина данных не кратна 4')
+
+
+def checked_chunks(value: str, max_size=None):
+    """ Порции декодированных данных строки base64 (с заголовком data URI или без).
+    Слишком большие данные отклоняются (BlobTooLarge) еще до начала декодирования """
+    _, start = parse_data_uri(value)
+    if max_size is not None and estimate_decoded_size(value, start) > max_size:
+        raise BlobTooLarge(f'Размер фото превышает {max_size} байт')
+    return iter_base64_chunks(value, start)
+
+
+def decode_base64_to_storage(value: str, storage, max_size=None):
+    """Декодирует строку base64 сразу в хранилище. Возвращает StoredBlob"""
+    return storage.save_stream(checked_chunks(value, max_size), max_size=max_size)
+
+
+def stage_base64(value: str, storage, max_size=None):
+    """ То же, но файл записывается только во временный каталог хранилища. Возвращает StagedBlob,
+    в хранилище файл переносится методом storage.promote """
+    return storage.stage_stream(checked_chunks(value, max_size), max_size=max_size)
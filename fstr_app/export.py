@@ -0,0 +1,126 @@
+import datetime
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from rest_framework import serializers
+
+from .models import PerevalAdded, subtree_filter
+from .area_tree import get_area_tree
+from .projection import FULL_FIELDS, project, build_rows
+
+
+''' Выгрузка архива перевалов потоком: GET /submitData/export/ отдает JSON Lines или JSON-массив
+через StreamingHttpResponse. Перевалы читаются серверным курсором (.iterator(chunk_size)) порциями
+по FSTR_EXPORT_CHUNK_SIZE, каждая порция собирается в строки (fstr_app.projection.build_rows,
+фото - одним запросом на порцию), кодируется и сразу уходит клиенту. В памяти одновременно
+только одна порция, сколько бы перевалов ни выгружалось. Под ASGI ответу нужен async-итератор:
+sync-итератор StreamingHttpResponse сначала собрал бы в список целиком (sync_to_async(list)) '''
+
+EXPORT_FIELDS = ('id',) + FULL_FIELDS
+EXPORT_FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+}
+STATUSES = [value for value, _ in PerevalAdded.STATUS_CHOICES]
+
+
+def parse_day(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise serializers.ValidationError(f"Параметр {name} должен быть датой в формате ГГГГ-ММ-ДД")
+    # Начало суток в текущем часовом поясе: условие по add_time, а не по add_time__date, работает по индексу
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def export_queryset(params):
+    """ Перевалы для выгрузки по фильтрам user__email, status (через запятую), area (район
+    вместе с подрайонами), date_from / date_to (по add_time, обе даты включительно) """
+    queryset = PerevalAdded.objects.all()
+
+    email = params.get('user__email')
+    if email:
+        queryset = queryset.filter(user__email=email)
+
+    if params.get('status'):
+        statuses = [value.strip() for value in params['status'].split(',') if value.strip()]
+        unknown = [value for value in statuses if value not in STATUSES]
+        if unknown:
+            raise serializers.ValidationError(f"Неизвестный статус: {', '.join(unknown)}. Доступны: {', '.join(STATUSES)}")
+        queryset = queryset.filter(status__in=statuses)
+
+    if params.get('area'):
+        tree = get_area_tree()
+        try:
+            area = int(params['area'])
+        except ValueError:
+            area = None
+        if area not in tree:
+            raise serializers.ValidationError("Район area не найден")
+        queryset = queryset.filter(subtree_filter(tree.subtree(area).path, field='area__path'))
+
+    date_from = parse_day(params, 'date_from')
+    if date_from is not None:
+        queryset = queryset.filter(add_time__gte=date_from)
+    date_to = parse_day(params, 'date_to')
+    if date_to is not None:
+        queryset = queryset.filter(add_time__lt=date_to + datetime.timedelta(days=1))
+    return queryset
+
+
+def iter_chunks(queryset, chunk_size=None):
+    """Строки выгрузки порциями (списками) по chunk_size, в порядке id"""
+    chunk_size = chunk_size or settings.FSTR_EXPORT_CHUNK_SIZE
+    rows = project(queryset.order_by('id'), EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield build_rows(chunk, EXPORT_FIELDS, with_urls=False)
+
+
+def encode(row):
+    # Как JSONRenderer DRF: без экранирования кириллицы и без пробелов
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_jsonl(chunks):
+    for chunk in chunks:
+        yield ''.join(encode(row) + '\n' for row in chunk).encode('utf-8')
+
+
+def stream_json_array(chunks):
+    yield b'['
+    separator = ''
+    for chunk in chunks:
+        yield (separator + ','.join(encode(row) for row in chunk)).encode('utf-8')
+        separator = ','
+    yield b']'
+
+
+def stream_export(queryset, fmt='jsonl', chunk_size=None):
+    """Итератор байтов выгрузки в формате fmt (jsonl или json)"""
+    chunks = iter_chunks(queryset, chunk_size)
+    return stream_jsonl(chunks) if fmt == 'jsonl' else stream_json_array(chunks)
+
+
+async def astream_export(queryset, fmt='jsonl', chunk_size=None):
+    """ То же для ASGI: порции по одной читаются из stream_export в потоке sync_to_async. Поток - один
+    и тот же (thread_sensitive), поэтому серверный курсор остается на своем соединении с БД """
+    parts = stream_export(queryset, fmt, chunk_size)
+    next_part = sync_to_async(next)
+    try:
+        while (part := await next_part(parts, None)) is not None:
+            yield part
+    finally:
+        await sync_to_async(parts.close)()
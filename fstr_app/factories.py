@@ -2,6 +2,7 @@ from factory.django import DjangoModelFactory
 from factory import SubFactory
 
 from .models import User, Coords, PerevalAdded, PerevalImage, PerevalAddedImage
+from .storage import get_blob_storage
 from .views import image_to_base64
 
 from base64 import b64decode
@@ -48,6 +49,13 @@ class PerevalImageFactory(DjangoModelFactory):
     # Открываем заглушку image.jpg как base64-строку и преобразуем в байты
     img = b64decode(image_to_base64('image.jpg'))
 
+    @classmethod
+    def _create(cls, model_class, *args, **kwargs):
+        # Байты фото кладем в хранилище, в модель передаем только ссылку на них
+        blob = get_blob_storage().save(kwargs.pop('img'))
+        kwargs.update(blob.as_fields())
+        return super()._create(model_class, *args, **kwargs)
+
 
 class PerevalAddedImageFactory(DjangoModelFactory):
     class Meta:
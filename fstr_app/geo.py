@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+from django.db.models import Q
+
+
+''' Поиск перевалов по координатам без PostGIS. У каждой записи Coords хранится geohash
+(строка, у близких точек - общий префикс) с обычным B-tree индексом. Область поиска
+покрывается небольшим набором ячеек geohash, кандидаты выбираются диапазонными запросами
+по индексу, а точное расстояние (формула гаверсинуса) считается numpy сразу для всех кандидатов '''
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # точность хранимого geohash, ячейка ~5 x 5 м
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+MAX_CELLS = 32  # сколько ячеек geohash допускается в одном запросе
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # четные биты кодируют долготу, нечетные - широту
+    while len(chars) < precision:
+        value, rng = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (rng[0] + rng[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            rng[0] = middle
+        else:
+            bits = bits * 2
+            rng[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Размер ячейки geohash в градусах: (по широте, по долготе)"""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def split_antimeridian(min_lon, max_lon):
+    """Область, пересекающая 180-й меридиан (min_lon > max_lon), делится на две"""
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def cover_bbox(min_lat, min_lon, max_lat, max_lon):
+    """Набор префиксов geohash, ячейки которых целиком покрывают прямоугольник"""
+    lon_ranges = split_antimeridian(min_lon, max_lon)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor(max_lat / lat_step) - math.floor(min_lat / lat_step) + 1
+        columns = sum(math.floor(hi / lon_step) - math.floor(lo / lon_step) + 1 for lo, hi in lon_ranges)
+        if rows * columns <= MAX_CELLS or precision == 1:
+            break
+
+    cells = set()
+    for lo, hi in lon_ranges:
+        for row in range(rows):
+            latitude = min(min_lat + row * lat_step, max_lat)
+            lon_columns = math.floor(hi / lon_step) - math.floor(lo / lon_step) + 1
+            for column in range(lon_columns):
+                longitude = min(lo + column * lon_step, hi)
+                cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def prefix_upper_bound(prefix):
+    """Наименьшая строка, которая больше всех строк с данным префиксом (в алфавите geohash)"""
+    while prefix:
+        position = BASE32.index(prefix[-1])
+        if position + 1 < len(BASE32):
+            return prefix[:-1] + BASE32[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def geohash_filter(cells, field='geohash'):
+    """ Условие "geohash начинается с одного из префиксов" в виде диапазонов >= / <,
+    чтобы и SQLite, и PostgreSQL использовали обычный B-tree индекс (LIKE 'abc%' этого не гарантирует) """
+    condition = Q()
+    for cell in cells:
+        upper = prefix_upper_bound(cell)
+        cell_condition = Q(**{f'{field}__gte': cell})
+        if upper is not None:
+            cell_condition &= Q(**{f'{field}__lt': upper})
+        condition |= cell_condition
+    return condition
+
+
+def circle_bbox(latitude, longitude, radius_km):
+    """Прямоугольник, описанный вокруг круга радиуса radius_km"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    lon_delta = 180.0 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    if lon_delta >= 180.0 or max_lat == 90.0 or min_lat == -90.0:
+        return min_lat, -180.0, max_lat, 180.0  # вблизи полюса берем все долготы
+
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Расстояния (км) от точки до массива точек, вычисляются векторно"""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(longitudes, dtype=np.float64)) - math.radians(longitude)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bbox_filter(min_lat, min_lon, max_lat, max_lon, prefix='coords__'):
+    """Условие на перевалы (или координаты при prefix='') внутри прямоугольника, с отбором по индексу geohash"""
+    condition = geohash_filter(cover_bbox(min_lat, min_lon, max_lat, max_lon), field=f'{prefix}geohash')
+    condition &= Q(**{f'{prefix}latitude__gte': min_lat, f'{prefix}latitude__lte': max_lat})
+    lon_condition = Q()
+    for lo, hi in split_antimeridian(min_lon, max_lon):
+        lon_condition |= Q(**{f'{prefix}longitude__gte': lo, f'{prefix}longitude__lte': hi})
+    return condition & lon_condition
+
+
+def nearby(queryset, latitude, longitude, radius_km):
+    """ Перевалы из queryset в радиусе radius_km от точки: список (id, расстояние в км),
+    отсортированный по расстоянию. Из БД читаются только id и координаты кандидатов """
+    min_lat, min_lon, max_lat, max_lon = circle_bbox(latitude, longitude, radius_km)
+    candidates = list(
+        queryset.filter(bbox_filter(min_lat, min_lon, max_lat, max_lon))
+        .values_list('id', 'coords__latitude', 'coords__longitude')
+    )
+    if not candidates:
+        return []
+
+    ids, latitudes, longitudes = zip(*candidates)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[np.argsort(distances[inside], kind='stable')]
+    return [(ids[i], float(distances[i])) for i in order]
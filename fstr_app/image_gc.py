@@ -0,0 +1,116 @@
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import PerevalAdded, PerevalImage, PerevalAddedImage
+from .storage import get_blob_storage
+from .renditions import delete_renditions
+from .jobs import job
+
+
+''' Сборщик отвязанных фото. PATCH и удаление перевала не удаляют фото сами, а только помечают
+(orphaned_at) те из них, что потеряли последнюю связь с перевалами, - запрос затрагивает
+лишь отвязанные в нем записи. Помеченные фото удаляются пачками командой
+manage.py gc_images (или заданием очереди images.gc) после задержки FSTR_IMAGE_GC_GRACE.
+Файл в хранилище удаляется, когда на его хэш больше не ссылается ни одна запись '''
+
+logger = logging.getLogger(__name__)
+
+
+def unlinked(image_ids):
+    """Подзапрос: какие из image_ids не привязаны ни к одному перевалу"""
+    linked = PerevalAddedImage.objects.filter(image_id__in=image_ids).values('image_id')
+    return PerevalImage.objects.filter(id__in=image_ids).exclude(id__in=linked)
+
+
+def mark_orphans(image_ids):
+    """Помечает фото из image_ids, оставшиеся без перевалов. Возвращает число помеченных"""
+    image_ids = list(image_ids)
+    if not image_ids:
+        return 0
+    return unlinked(image_ids).filter(orphaned_at__isnull=True).update(orphaned_at=timezone.now())
+
+
+def unmark_orphans(image_ids):
+    """Снимает пометку с фото, снова привязанных к перевалу"""
+    image_ids = list(image_ids)
+    if not image_ids:
+        return 0
+    return PerevalImage.objects.filter(id__in=image_ids, orphaned_at__isnull=False).update(orphaned_at=None)
+
+
+@receiver(pre_delete, sender=PerevalAdded)
+def remember_pereval_images(sender, instance, **kwargs):
+    # Связи с фото удаляются каскадно раньше самого перевала, поэтому фото запоминаем заранее
+    instance._image_ids = list(PerevalAddedImage.objects.filter(pereval=instance).values_list('image_id', flat=True))
+
+
+@receiver(post_delete, sender=PerevalAdded)
+def mark_pereval_images(sender, instance, **kwargs):
+    mark_orphans(getattr(instance, '_image_ids', []))
+
+
+@dataclass
+class CollectReport:
+    images: int = 0
+    blobs: int = 0
+    reclaimed_bytes: int = 0
+
+
+def collect_batch(cutoff, batch_size, report):
+    """Удаляет одну пачку помеченных фото. Возвращает False, когда помеченных больше нет"""
+    candidates = list(
+        PerevalImage.objects.filter(orphaned_at__lte=cutoff)
+        .order_by('orphaned_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not candidates:
+        return False
+
+    with transaction.atomic():
+        # Повторная проверка: за время задержки фото могли снова привязать к перевалу
+        relinked = set(candidates) - set(unlinked(candidates).values_list('id', flat=True))
+        unmark_orphans(relinked)
+
+        orphans = PerevalImage.objects.filter(id__in=set(candidates) - relinked)
+        doomed = dict(orphans.values_list('sha256', 'size'))
+        _, deleted = orphans.delete()
+        report.images += deleted.get(PerevalImage._meta.label, 0)
+
+        # Файлы, на хэш которых больше никто не ссылается
+        still_used = set(PerevalImage.objects.filter(sha256__in=doomed).values_list('sha256', flat=True))
+        unused = {sha256: size for sha256, size in doomed.items() if sha256 not in still_used}
+
+    storage = get_blob_storage()
+    for sha256, size in unused.items():
+        try:
+            if storage.modified_time(sha256) > cutoff.timestamp():
+                continue  # такое же фото только что загрузили заново, запись о нем появится в БД
+        except FileNotFoundError:
+            continue
+        storage.delete(sha256)
+        delete_renditions(sha256)
+        report.blobs += 1
+        report.reclaimed_bytes += size
+    return True
+
+
+@job('images.gc')
+def collect_orphans(batch_size=500, grace_seconds=None):
+    """Удаляет помеченные фото и неиспользуемые файлы пачками. Возвращает CollectReport"""
+    if grace_seconds is None:
+        grace_seconds = settings.FSTR_IMAGE_GC_GRACE
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+
+    report = CollectReport()
+    while collect_batch(cutoff, batch_size, report):
+        pass
+    logger.info('Удалено фото: %s, файлов: %s, освобождено байт: %s',
+                report.images, report.blobs, report.reclaimed_bytes)
+    return report
@@ -0,0 +1,131 @@
+import json
+from dataclasses import dataclass, field
+
+from django.db import DatabaseError
+
+from rest_framework import serializers
+
+from .models import User, Coords, PerevalAdded, PerevalImage, PerevalAddedImage, ChangeLog
+from .serializers import PerevalAddedSerializer, atomic_with_blobs, prepare_submit_data
+from .renditions import schedule_renditions
+from .search import index_perevals
+from . import stats
+
+
+''' Массовый импорт перевалов из JSON Lines: одна строка - один перевал в том же формате,
+что и тело POST /submitData/. Записи валидируются пачками одним экземпляром сериализатора
+(поля DRF строятся один раз на весь импорт, а не на каждую запись), в БД пишутся тоже пачками:
+пользователи - одним upsert, координаты, перевалы и фото - bulk_create, все в одной транзакции на пачку '''
+
+USER_UPDATE_FIELDS = ['first_name', 'last_name', 'middle_name', 'phone']
+
+
+@dataclass
+class ImportReport:
+    lines: int = 0
+    created: int = 0
+    created_ids: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'lines': self.lines, 'created': self.created, 'errors': self.errors}
+
+
+def save_batch(batch):
+    """Сохраняет пачку провалидированных записей (validated_data сериализатора). Возвращает id перевалов"""
+    with atomic_with_blobs() as promote_blobs:
+        # Пользователи: при повторе email в пачке побеждает последняя запись
+        users_data = {item['user']['email']: item['user'] for item in batch}
+        User.objects.upsert_rows(users_data.values(), USER_UPDATE_FIELDS)
+        users = User.objects.only('id', 'email').in_bulk(list(users_data), field_name='email')
+
+        coords = [Coords(**item['coords']) for item in batch]
+        for item_coords in coords:
+            item_coords.fill_geohash()  # bulk_create не вызывает save()
+        coords = Coords.objects.bulk_create(coords)
+
+        perevals = PerevalAdded.objects.bulk_create([
+            PerevalAdded(
+                user=users[item['user']['email']],
+                coords=item_coords,
+                **{key: value for key, value in item.items() if key not in ('user', 'coords', 'pereval_images')}
+            )
+            for item, item_coords in zip(batch, coords)
+        ])
+
+        images = []
+        owners = []
+        for item, pereval in zip(batch, perevals):
+            for image_data in promote_blobs(item.get('pereval_images', [])):
+                images.append(PerevalImage(title=image_data['title'], **image_data['data'].as_fields()))
+                owners.append(pereval)
+        images = PerevalImage.objects.bulk_create(images)
+        PerevalAddedImage.objects.bulk_create(
+            [PerevalAddedImage(pereval=pereval, image=image) for pereval, image in zip(owners, images)]
+        )
+
+        ChangeLog.objects.record('pereval', [pereval.id for pereval in perevals])
+        ChangeLog.objects.record('image', [image.id for image in images])
+        schedule_renditions(image.sha256 for image in images)
+        index_perevals(perevals)
+        stats.record_created(perevals)
+
+    return [pereval.id for pereval in perevals]
+
+
+def validate_batch(validator, records, report):
+    """Валидирует записи [(номер строки, данные)], ошибки пишет в отчет, возвращает годные"""
+    valid = []
+    for line_number, data in records:
+        try:
+            valid.append((line_number, validator.run_validation(data)))
+        except serializers.ValidationError as e:
+            report.add_error(line_number, e.detail)
+    return valid
+
+
+def import_passes(lines, batch_size=500):
+    """Импортирует перевалы из итератора строк JSON Lines. Ошибки собираются в отчет с номерами строк"""
+    report = ImportReport()
+    validator = PerevalAddedSerializer()
+    records = []
+
+    def flush():
+        batch = validate_batch(validator, records, report)
+        records.clear()
+        if not batch:
+            return
+        try:
+            ids = save_batch([item for _, item in batch])
+        except DatabaseError as e:
+            # Транзакция пачки откатилась целиком, сообщаем об ошибке для каждой ее строки
+            for line_number, _ in batch:
+                report.add_error(line_number, f'Ошибка записи в БД: {e}')
+        else:
+            report.created += len(ids)
+            report.created_ids += ids
+
+    for line_number, line in enumerate(lines, start=1):
+        report.lines = line_number
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+
+        try:
+            records.append((line_number, prepare_submit_data(json.loads(line))))
+        except ValueError as e:
+            report.add_error(line_number, f'Некорректный JSON: {e}')
+        except (AttributeError, TypeError):
+            report.add_error(line_number, 'Запись должна быть JSON-объектом в формате POST /submitData/')
+
+        if len(records) >= batch_size:
+            flush()
+
+    if records:
+        flush()
+    report.errors.sort(key=lambda error: error['line'])
+    return report
@@ -0,0 +1,125 @@
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+''' Легкая очередь фоновых заданий поверх таблицы jobs. Обработчики регистрируются декоратором
+@job('вид задания'), ставятся в очередь функцией enqueue() и выполняются воркером
+(manage.py run_jobs). Неудачные задания повторяются с экспоненциальной задержкой '''
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class UnknownJobKind(Exception):
+    pass
+
+
+def job(kind):
+    """Регистрирует функцию как обработчик заданий вида kind. Аргументы задания передаются как **payload"""
+    def decorator(func):
+        _registry[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    """ Ставит задание в очередь. Повторный вызов с тем же idempotency_key не создает
+    дубликат, а возвращает уже существующее задание """
+    fields = {
+        'kind': kind,
+        'payload': payload or {},
+        'run_after': timezone.now() + timedelta(seconds=delay),
+        'max_attempts': max_attempts or settings.FSTR_JOB_MAX_ATTEMPTS,
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    job_obj, _ = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+    return job_obj
+
+
+def enqueue_many(kind, payloads_by_key, max_attempts=None):
+    """ Ставит в очередь сразу несколько заданий одним INSERT. payloads_by_key - словарь
+    {idempotency_key: payload}, задания с уже существующим ключом пропускаются """
+    now = timezone.now()
+    Job.objects.bulk_create(
+        [
+            Job(kind=kind, payload=payload, idempotency_key=key, run_after=now,
+                max_attempts=max_attempts or settings.FSTR_JOB_MAX_ATTEMPTS)
+            for key, payload in payloads_by_key.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def make_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def claim(worker_id, limit=10):
+    """ Забирает в работу до limit готовых заданий. В PostgreSQL строки блокируются через
+    SELECT ... FOR UPDATE SKIP LOCKED, и параллельные воркеры не ждут друг друга. В SQLite запись
+    в БД и так идет по очереди, а от двойного захвата защищает условие status='queued' в UPDATE """
+    now = timezone.now()
+    # Задания, "зависшие" у упавшего воркера, возвращаем в очередь
+    stale_before = now - timedelta(seconds=settings.FSTR_JOB_LOCK_TIMEOUT)
+
+    with transaction.atomic():
+        queryset = Job.objects.filter(
+            Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=stale_before)
+        ).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:limit])
+
+        Job.objects.filter(
+            Q(status='queued') | Q(status='running', locked_at__lt=stale_before), id__in=ids
+        ).update(status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+
+    return list(Job.objects.filter(id__in=ids, status='running', locked_by=worker_id, locked_at=now))
+
+
+def run(job_obj):
+    """Выполняет захваченное задание и записывает результат"""
+    try:
+        handler = _registry.get(job_obj.kind)
+        if handler is None:
+            raise UnknownJobKind(f'Нет обработчика для заданий вида {job_obj.kind}')
+        handler(**job_obj.payload)
+    except Exception:
+        job_obj.last_error = traceback.format_exc()
+        if job_obj.attempts >= job_obj.max_attempts:
+            job_obj.status = 'failed'
+            logger.error('Задание %s не выполнено после %s попыток', job_obj, job_obj.attempts)
+        else:
+            job_obj.status = 'queued'
+            delay = settings.FSTR_JOB_RETRY_DELAY * 2 ** (job_obj.attempts - 1)
+            job_obj.run_after = timezone.now() + timedelta(seconds=delay)
+    else:
+        job_obj.status = 'done'
+        job_obj.last_error = ''
+
+    job_obj.locked_by = ''
+    job_obj.locked_at = None
+    job_obj.save(update_fields=['status', 'last_error', 'run_after', 'locked_by', 'locked_at', 'updated_at'])
+    return job_obj
+
+
+def run_pending(worker_id=None, limit=10):
+    """Один проход воркера: забрать пачку заданий и выполнить. Возвращает число обработанных"""
+    worker_id = worker_id or make_worker_id()
+    jobs = claim(worker_id, limit)
+    for job_obj in jobs:
+        run(job_obj)
+    return len(jobs)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from fstr_app.image_gc import collect_orphans
+
+
+class Command(BaseCommand):
+    help = 'Удаляет фото, отвязанные от перевалов, и неиспользуемые файлы в хранилище'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько фото удалять за одну транзакцию')
+        parser.add_argument('--grace-seconds', type=int, default=None,
+                            help='Удалять фото, отвязанные не менее указанного числа секунд назад '
+                                 '(по умолчанию FSTR_IMAGE_GC_GRACE)')
+
+    def handle(self, *args, **options):
+        report = collect_orphans(batch_size=options['batch_size'], grace_seconds=options['grace_seconds'])
+        self.stdout.write(
+            f'Удалено фото: {report.images}, файлов: {report.blobs}, освобождено байт: {report.reclaimed_bytes}'
+        )
@@ -0,0 +1,31 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from fstr_app.ingest import import_passes
+
+
+class Command(BaseCommand):
+    help = 'Импорт перевалов из файла JSON Lines (формат строки - как тело POST /submitData/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу .jsonl ('-' - читать из stdin)")
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько записей сохранять за одну транзакцию')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['path'] == '-':
+            report = import_passes(sys.stdin, batch_size=options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as f:
+                report = import_passes(f, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors:
+            self.stderr.write(f"строка {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(
+            f'Строк: {report.lines}, загружено перевалов: {report.created}, ошибок: {len(report.errors)}, '
+            f'{elapsed:.1f} с ({report.created / elapsed if elapsed else 0:.0f} записей/с)'
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from fstr_app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает полнотекстовый индекс названий перевалов'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(f'Проиндексировано перевалов: {count}')
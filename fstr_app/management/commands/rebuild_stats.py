@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from fstr_app.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики статистики (GET /stats/) по всему архиву перевалов'
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(f'Статистика пересчитана, перевалов: {count}')
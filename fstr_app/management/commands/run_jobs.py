@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from fstr_app import jobs
+from fstr_app.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновой очереди заданий (построение превью фото и т.п.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать готовые задания и завершиться')
+        parser.add_argument('--batch-size', type=int, default=10, help='Сколько заданий забирать за раз')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза (сек.), когда очередь пуста')
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help='Удалить выполненные задания старше указанного числа дней и завершиться')
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted, _ = Job.objects.filter(
+                status='done', updated_at__lt=timezone.now() - timedelta(days=options['purge_days'])
+            ).delete()
+            self.stdout.write(f'Удалено выполненных заданий: {deleted}')
+            return
+
+        worker_id = jobs.make_worker_id()
+        self.stdout.write(f'Воркер {worker_id} запущен')
+        try:
+            while True:
+                processed = jobs.run_pending(worker_id, options['batch_size'])
+                if options['once'] and not processed:
+                    break
+                if not processed:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Воркер остановлен')
@@ -0,0 +1,50 @@
+import threading
+from collections import Counter
+
+
+''' Счетчики приложения (попадания в кэш и т.п.) в памяти процесса. Отдаются в текстовом формате
+Prometheus по адресу /metrics/; при нескольких процессах каждый считает свои, суммирует сборщик метрик.
+Метки передаются именованными аргументами: incr('db_read_routing_total', target='replica1') '''
+
+_counters = Counter()
+_gauges = {}
+_lock = threading.Lock()
+
+
+def series(name, labels):
+    """Ключ ряда: имя метрики, а при метках - имя{метка="значение",...}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+def incr(name, value=1, **labels):
+    with _lock:
+        _counters[series(name, labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    """Текущее значение (например, отставание реплики), а не накопленный счетчик"""
+    with _lock:
+        _gauges[series(name, labels)] = value
+
+
+def snapshot():
+    with _lock:
+        return {**_counters, **_gauges}
+
+
+def render_prometheus():
+    with _lock:
+        rows = [(key, value, 'counter') for key, value in _counters.items()]
+        rows += [(key, value, 'gauge') for key, value in _gauges.items()]
+    lines = []
+    typed = set()
+    # Ряды одной метрики должны идти подряд, после ее строки # TYPE
+    for key, value, kind in sorted(rows, key=lambda row: (row[0].split('{', 1)[0], row[0])):
+        name = key.split('{', 1)[0]
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE fstr_{name} {kind}')
+        lines.append(f'fstr_{key} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+from fstr_app.storage import get_blob_storage
+
+
+def move_images_to_storage(apps, schema_editor):
+    """Переносит байты из BinaryField img в хранилище, в таблице остается хэш, размер и MIME-тип"""
+    PerevalImage = apps.get_model('fstr_app', 'PerevalImage')
+    storage = get_blob_storage()
+    for image in PerevalImage.objects.only('id', 'img').iterator(chunk_size=100):
+        blob = storage.save(bytes(image.img or b''))
+        PerevalImage.objects.filter(pk=image.pk).update(img=None, **blob.as_fields())
+
+
+def move_images_to_database(apps, schema_editor):
+    PerevalImage = apps.get_model('fstr_app', 'PerevalImage')
+    storage = get_blob_storage()
+    for image in PerevalImage.objects.only('id', 'sha256').iterator(chunk_size=100):
+        PerevalImage.objects.filter(pk=image.pk).update(img=storage.read(image.sha256))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perevalimage',
+            name='img',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='perevalimage',
+            name='sha256',
+            field=models.CharField(db_index=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='perevalimage',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perevalimage',
+            name='mime_type',
+            field=models.CharField(default='application/octet-stream', max_length=100),
+        ),
+        migrations.RunPython(move_images_to_storage, move_images_to_database),
+        migrations.RemoveField(
+            model_name='perevalimage',
+            name='img',
+        ),
+    ]
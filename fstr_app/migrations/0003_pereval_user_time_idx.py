@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0002_move_images_to_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perevaladded',
+            index=models.Index(fields=['user', 'add_time', 'id'], name='pereval_user_time_idx'),
+        ),
+    ]
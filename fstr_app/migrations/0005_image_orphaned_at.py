@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0004_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perevalimage',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
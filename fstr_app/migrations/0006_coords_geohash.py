@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+from fstr_app.geo import encode
+
+
+def fill_geohash(apps, schema_editor):
+    Coords = apps.get_model('fstr_app', 'Coords')
+    batch = []
+    for coords in Coords.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        coords.geohash = encode(coords.latitude, coords.longitude)
+        batch.append(coords)
+        if len(batch) == 2000:
+            Coords.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Coords.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0005_image_orphaned_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coords',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
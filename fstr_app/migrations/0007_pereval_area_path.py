@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    """Строит пути по id_parent обходом от корней. Записи, не достижимые от корня (цикл), становятся корнями"""
+    PerevalArea = apps.get_model('fstr_app', 'PerevalArea')
+    parents = dict(PerevalArea.objects.values_list('id', 'id_parent'))
+    children = {}
+    for pk, parent in parents.items():
+        children.setdefault(parent if parent in parents else 0, []).append(pk)
+
+    paths = {}
+    pending = [(pk, '/') for pk in children.get(0, [])]
+    while len(paths) < len(parents):
+        if not pending:
+            pk = min(set(parents) - set(paths))
+            pending.append((pk, '/'))
+        pk, parent_path = pending.pop()
+        if pk in paths:
+            continue
+        paths[pk] = f'{parent_path}{pk}/'
+        pending += [(child, paths[pk]) for child in children.get(pk, []) if child not in paths]
+
+    areas = [PerevalArea(id=pk, path=path, depth=path.count('/') - 2) for pk, path in paths.items()]
+    PerevalArea.objects.bulk_update(areas, ['path', 'depth'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0006_coords_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('version', models.CharField(default='', max_length=32)),
+            ],
+            options={
+                'db_table': 'version_stamps',
+            },
+        ),
+        migrations.AddField(
+            model_name='perevaladded',
+            name='area',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='perevals', to='fstr_app.perevalarea'),
+        ),
+        migrations.AddField(
+            model_name='perevalarea',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perevalarea',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
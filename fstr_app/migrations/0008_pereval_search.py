@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from fstr_app.search import get_backend, rebuild_index
+
+
+def create_search_index(apps, schema_editor):
+    PerevalAdded = apps.get_model('fstr_app', 'PerevalAdded')
+    connection = schema_editor.connection
+    rebuild_index(connection, PerevalAdded.objects.using(connection.alias))
+
+
+def drop_search_index(apps, schema_editor):
+    get_backend(schema_editor.connection).drop()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0007_pereval_area_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0008_pereval_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perevaladded',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+def fill_change_log(apps, schema_editor):
+    """Уже существующие перевалы и фото попадают в журнал, чтобы их получил клиент с курсором 0"""
+    ChangeLog = apps.get_model('fstr_app', 'ChangeLog')
+    for entity, model_name in [('pereval', 'PerevalAdded'), ('image', 'PerevalImage')]:
+        Model = apps.get_model('fstr_app', model_name)
+        batch = []
+        for pk in Model.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=2000):
+            batch.append(ChangeLog(entity=entity, object_id=pk))
+            if len(batch) == 2000:
+                ChangeLog.objects.bulk_create(batch)
+                batch = []
+        ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0010_pereval_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Создан или изменен'), ('delete', 'Удален')], default='upsert', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'change_log',
+            },
+        ),
+        migrations.RunPython(fill_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0011_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perevaladded',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='perevaladded',
+            name='moderator',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='perevaladded',
+            index=models.Index(fields=['status', 'add_time', 'id'], name='pereval_status_time_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:59
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_stats(apps, schema_editor):
+    """Начальные значения счетчиков по уже существующим перевалам (как fstr_app.stats.rebuild)"""
+    PerevalAdded = apps.get_model('fstr_app', 'PerevalAdded')
+    PerevalStat = apps.get_model('fstr_app', 'PerevalStat')
+    counts = Counter({('total', ''): PerevalAdded.objects.count()})
+    for dimension, column in [('status', 'status'), ('summer_level', 'summer_level'), ('winter_level', 'winter_level'),
+                              ('autumn_level', 'autumn_level'), ('spring_level', 'spring_level'),
+                              ('area', 'area_id'), ('user', 'user_id')]:
+        for value, count in PerevalAdded.objects.order_by().values_list(column).annotate(count=Count('id')):
+            counts[dimension, '' if value is None else str(value)] += count
+    PerevalStat.objects.bulk_create(
+        [PerevalStat(dimension=dimension, key=key, count=count) for (dimension, key), count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0012_moderation_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerevalStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'pereval_stats',
+                'indexes': [models.Index(fields=['dimension', '-count', 'key'], name='pereval_stats_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='pereval_stats_dimension_key_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
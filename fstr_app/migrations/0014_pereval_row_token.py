@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:23
+
+import fstr_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fstr_app', '0013_pereval_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perevaladded',
+            name='row_token',
+            field=models.CharField(default=fstr_app.models.new_row_token, editable=False, max_length=32),
+        ),
+    ]
@@ -1,4 +1,66 @@
-from django.db import models
+import uuid
+
+from django.db import connections, models, router, transaction
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+
+from .storage import get_blob_storage
+from . import geo
+
+
+class UserManager(models.Manager):
+    def upsert_rows(self, rows, update_fields):
+        """ Вставляет пользователей (словари полей) или обновляет update_fields существующих с тем же email
+        одним запросом INSERT ... ON CONFLICT (email) DO UPDATE ... WHERE ... IS DISTINCT FROM ... RETURNING id
+        (PostgreSQL, SQLite 3.35+). Строка, у которой ни одно поле не изменилось, не перезаписывается.
+        Перевалам пользователей, чьи данные изменились, повышается версия - пользователь входит в ответ
+        GET /submitData/<id>/, его кэш и ETag. Возвращает id вставленных и измененных строк """
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        users = [self.model(**row) for row in rows]
+        if not users:
+            return []
+
+        table = quote(opts.db_table)
+        values = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(users))
+        params = [field.get_db_prep_save(getattr(user, field.attname), connection)
+                  for user in users for field in fields]
+        columns = [quote(opts.get_field(name).column) for name in update_fields]
+        # Сравнение с учетом NULL: IS DISTINCT FROM в SQLite появился только в 3.39, а IS NOT работает так же
+        distinct = 'IS NOT' if connection.vendor == 'sqlite' else 'IS DISTINCT FROM'
+        if columns:
+            action = 'DO UPDATE SET {} WHERE {}'.format(
+                ', '.join(f'{column} = excluded.{column}' for column in columns),
+                ' OR '.join(f'{table}.{column} {distinct} excluded.{column}' for column in columns),
+            )
+        else:
+            action = 'DO NOTHING'
+        sql = (f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) VALUES {values} '
+               f'ON CONFLICT ({quote(opts.get_field("email").column)}) {action} RETURNING {quote(opts.pk.column)}')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+
+        # У только что вставленных пользователей перевалов нет, выборка находит перевалы измененных
+        if ids and columns:
+            PerevalAdded.objects.bump_version(
+                PerevalAdded.objects.filter(user_id__in=ids).values_list('id', flat=True)
+            )
+        return ids
+
+    def upsert(self, email, **fields):
+        """ Создает пользователя или обновляет переданные поля существующего (см. upsert_rows).
+        В отличие от проверки exists() с последующим create() не падает с IntegrityError при
+        одновременных запросах с одним email. У возвращенного объекта заполнены id и переданные поля """
+        user = self.model(email=email, **fields)
+        ids = self.upsert_rows([{'email': email, **fields}], list(fields))
+        # RETURNING пуст, если пользователь уже был и его данные не изменились
+        user.pk = ids[0] if ids else self.filter(email=email).values_list('pk', flat=True).get()
+        return user
 
 
 class User(models.Model):
@@ -8,6 +70,8 @@ class User(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20)
 
+    objects = UserManager()
+
     class Meta:
         db_table = 'users'
 
@@ -15,6 +79,39 @@ class User(models.Model):
         return f'{self.first_name}, {self.last_name}, {self.email}'
 
 
+class VersionStampManager(models.Manager):
+    def current(self, name):
+        return self.filter(name=name).values_list('version', flat=True).first() or ''
+
+    def bump(self, name):
+        """Выдает набору данных новую версию одним запросом INSERT ... ON CONFLICT (как UserManager.upsert)"""
+        self.bulk_create(
+            [self.model(name=name, version=uuid.uuid4().hex)],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['version'],
+        )
+
+
+class VersionStamp(models.Model):
+    """ Версия набора данных, меняется при каждом его изменении. По ней процессы понимают, что их кэш
+    в памяти устарел (например, кэш дерева районов fstr_app/area_tree.py). Версия - случайная строка,
+    а не счетчик: после отката транзакции или восстановления БД из копии номер не повторится """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.CharField(max_length=32, default='')
+
+    objects = VersionStampManager()
+
+    class Meta:
+        db_table = 'version_stamps'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+AREA_TREE_STAMP = 'pereval_areas'
+
+
 ''' Таблица с Названиями больших районов, горных систем (например, Альпы и т.п.) и т.п., выстроенная по иерархии.
 Например, 1-я запись с полями: id=1, id_parent=0, title = "Земля". 
 2-я запись с полями: id=2, id_parent=1 (условная ссылка на планету Земля ), title = "Анды".
@@ -25,22 +122,123 @@ class PerevalArea(models.Model):
     id_parent = models.BigIntegerField()
     title = models.TextField()
 
+    # Материализованный путь от корня: "/1/2/3/" для Мачу Пикчу из примера выше. Поддерево района -
+    # все записи с путем, начинающимся с его пути, поэтому выбирается одним запросом по индексу
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    depth = models.PositiveIntegerField(default=0)
+
     class Meta:
         db_table = 'pereval_areas'
 
+    def __str__(self):
+        return self.title
+
+    def parent_path(self):
+        """Путь родителя. Район с id_parent=0 (или с несуществующим родителем) считается корнем"""
+        if not self.id_parent:
+            return '/'
+        return PerevalArea.objects.filter(pk=self.id_parent).values_list('path', flat=True).first() or '/'
+
+    def save(self, *args, **kwargs):
+        """Пересчитывает путь района, а при переносе в другую ветку - и пути всех его подрайонов"""
+        with transaction.atomic():
+            parent_path = self.parent_path()
+            old_path = None
+            if self.pk is not None:
+                if f'/{self.pk}/' in parent_path:
+                    raise ValueError('Район нельзя перенести в его собственный подрайон')
+                old_path = PerevalArea.objects.filter(pk=self.pk).values_list('path', flat=True).first()
+                self.path = f'{parent_path}{self.pk}/'
+            self.depth = parent_path.count('/') - 1
+
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'path', 'depth'}
+            super().save(*args, **kwargs)
+
+            if old_path is None:
+                # Новая запись: id стал известен только после INSERT
+                self.path = f'{parent_path}{self.pk}/'
+                PerevalArea.objects.filter(pk=self.pk).update(path=self.path)
+            elif old_path and old_path != self.path:
+                # Перенос: пути подрайонов меняются одним UPDATE (замена префикса)
+                PerevalArea.objects.filter(subtree_filter(old_path)).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1),
+                                output_field=models.CharField()),
+                    depth=F('depth') + (self.depth - old_path.count('/') + 2),
+                )
+            VersionStamp.objects.bump(AREA_TREE_STAMP)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            VersionStamp.objects.bump(AREA_TREE_STAMP)
+        return result
+
+    def get_descendants(self, include_self=True):
+        """Все подрайоны на любую глубину, одним запросом"""
+        queryset = PerevalArea.objects.filter(subtree_filter(self.path)).order_by('path')
+        return queryset if include_self else queryset.exclude(pk=self.pk)
+
+    def get_ancestors(self, include_self=False):
+        """Цепочка районов от корня («хлебные крошки»), одним запросом"""
+        ids = [int(pk) for pk in self.path.strip('/').split('/') if pk]
+        if not include_self:
+            ids = ids[:-1]
+        areas = PerevalArea.objects.in_bulk(ids)
+        return [areas[pk] for pk in ids if pk in areas]
+
+    def get_perevals(self):
+        """Перевалы района и всех его подрайонов, одним запросом"""
+        return PerevalAdded.objects.filter(subtree_filter(self.path, field='area__path'))
+
+
+def subtree_filter(path, field='path'):
+    """ Условие "путь начинается с path" (LIKE 'path%'). Диапазон >= / < здесь не годится: он верен только
+    при побайтовом сравнении строк, а в PostgreSQL с collation вроде en_US.utf8 символ "/" не учитывается
+    при сортировке, и пути поддерева перемежаются с чужими ("/1/2/" оказывается после "/10/").
+    В PostgreSQL LIKE с префиксом идет по индексу varchar_pattern_ops, который Django создает для
+    CharField с db_index (pereval_areas_path_..._like) """
+    return Q(**{f'{field}__startswith': path})
+
 
 class Coords(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     height = models.IntegerField()
 
+    # Пространственный индекс для поиска перевалов рядом с точкой (fstr_app/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)
+
     class Meta:
         db_table = 'coords'
 
+    def fill_geohash(self):
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+
+    def save(self, *args, **kwargs):
+        self.fill_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.latitude}, {self.longitude}, {self.height}'
 
 
+def new_row_token():
+    return uuid.uuid4().hex
+
+
+class PerevalAddedManager(models.Manager):
+    def bump_version(self, ids):
+        """Увеличивает version перевалов, измененных в обход save() (queryset.update, привязка фото)"""
+        ids = list(ids)
+        ChangeLog.objects.record('pereval', ids)
+        return self.filter(id__in=ids).update(version=F('version') + 1, updated_at=timezone.now())
+
+
 class PerevalAdded(models.Model):
     STATUS_CHOICES = [
         ('new', 'Новый'),
@@ -61,23 +259,77 @@ class PerevalAdded(models.Model):
     autumn_level = models.CharField(max_length=10, blank=True, null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='new')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    area = models.ForeignKey(PerevalArea, on_delete=models.SET_NULL, blank=True, null=True, related_name='perevals')
+
+    # Номер версии записи и время изменения, меняются при каждом изменении перевала и его пользователя. По ним строятся ключ кэша ответов
+    # (fstr_app/response_cache.py) и заголовки ETag / Last-Modified (fstr_app/conditional.py)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Случайная метка записи (как у VersionStamp): id после удаления или отката транзакции может достаться
+    # новому перевалу, и без нее он получил бы ключ кэша и ETag старого
+    row_token = models.CharField(max_length=32, default=new_row_token, editable=False)
+
+    # Кто из модераторов и когда взял перевал в работу (fstr_app/moderation.py)
+    moderator = models.CharField(max_length=100, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    objects = PerevalAddedManager()
 
     class Meta:
         db_table = 'pereval_added'
+        indexes = [
+            # Для keyset-пагинации списка перевалов пользователя (fstr_app.pagination)
+            models.Index(fields=['user', 'add_time', 'id'], name='pereval_user_time_idx'),
+            # Очередь модерации (перевалы new / pending в порядке поступления) и выгрузка по статусу
+            models.Index(fields=['status', 'add_time', 'id'], name='pereval_status_time_idx'),
+        ]
 
     def __str__(self):
         return f'{self.beautyTitle}, {self.title}, {self.other_titles}'
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            ChangeLog.objects.record('pereval', [self.pk])
+            return
+        ChangeLog.objects.record('pereval', [self.pk])
+        # Увеличиваем в самом UPDATE, чтобы параллельные сохранения не получили одну и ту же версию
+        self.version = F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
 
 class PerevalImage(models.Model):
     date_added = models.DateTimeField(auto_now_add=True)
-    img = models.BinaryField()
+
+    # Само фото лежит в хранилище (fstr_app.storage), в таблице только его адрес и метаданные
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    mime_type = models.CharField(max_length=100, default='application/octet-stream')
+
     title = models.CharField(max_length=50, default='Без названия')
     pereval = models.ManyToManyField(PerevalAdded, through='PerevalAddedImage', related_name='pereval_images')
 
+    # Когда фото перестало быть привязанным к перевалам. Такие записи удаляет сборщик (fstr_app/image_gc.py)
+    orphaned_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     class Meta:
         db_table = 'pereval_images'
 
+    @property
+    def img(self):
+        """Байты фото из хранилища (раньше хранились в BinaryField с таким же именем)"""
+        return get_blob_storage().read(self.sha256)
+
+    def attach_blob(self, blob):
+        """Привязывает к записи фото, уже сохраненное в хранилище"""
+        self.sha256 = blob.sha256
+        self.size = blob.size
+        self.mime_type = blob.mime_type
+
 
 class PerevalAddedImage(models.Model):
     pereval = models.ForeignKey(PerevalAdded, on_delete=models.CASCADE, related_name='image')
@@ -85,3 +337,135 @@ class PerevalAddedImage(models.Model):
 
     class Meta:
         db_table = 'pereval_added_images'
+
+
+class Job(models.Model):
+    """ Задание фоновой очереди (fstr_app/jobs.py). Очередь хранится в самой БД,
+    внешний брокер не нужен. Задания выполняет команда manage.py run_jobs """
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    idempotency_key = models.CharField(max_length=200, unique=True, blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='jobs_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+class ChangeLogManager(models.Manager):
+    def record(self, entity, ids, action='upsert'):
+        """ Записывает в журнал изменение объектов entity ('pereval' / 'image') с id из ids.
+        В PostgreSQL id последовательности выдаются в момент INSERT, а видны после COMMIT, и транзакция
+        с меньшим id может зафиксироваться позже. Поэтому у записи есть номер транзакции (txid), и журнал
+        читается в порядке (txid, id) только до самой старой незавершенной транзакции (см. committed).
+        В SQLite пишущая транзакция и так одна, txid = 0 """
+        ids = list(ids)
+        if not ids:
+            return
+        connection = connections[router.db_for_write(self.model)]
+        txid = 0
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_current_xact_id()::text::bigint')
+                txid = cursor.fetchone()[0]
+        self.bulk_create([self.model(entity=entity, object_id=pk, action=action, txid=txid) for pk in ids])
+
+    def committed(self, since):
+        """ Записи после курсора since (id записи) в порядке (txid, id). В PostgreSQL - только транзакций
+        старше самой старой незавершенной (pg_snapshot_xmin): все транзакции, которые зафиксируются позже,
+        имеют номер не меньше него, и их записи окажутся после курсора, даже если их id меньше """
+        txid = self.filter(pk=since).values_list('txid', flat=True).first() or 0
+        queryset = self.filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=since))
+        if connections[router.db_for_read(self.model)].vendor == 'postgresql':
+            queryset = queryset.filter(txid__lt=RawSQL(
+                'pg_snapshot_xmin(pg_current_snapshot())::text::bigint', [], output_field=models.BigIntegerField()))
+        return queryset.order_by('txid', 'id')
+
+
+class ChangeLog(models.Model):
+    """ Журнал изменений перевалов и фото для синхронизации офлайн-клиентов (GET /sync/?since=).
+    id записи - курсор: клиент запоминает последний полученный и в следующий раз получает только
+    то, что изменилось после него (fstr_app/sync.py) """
+    ACTION_CHOICES = [
+        ('upsert', 'Создан или изменен'),
+        ('delete', 'Удален'),
+    ]
+
+    entity = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='upsert')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Номер транзакции PostgreSQL, в которой сделана запись (pg_current_xact_id); в SQLite - 0
+    txid = models.BigIntegerField(default=0)
+
+    objects = ChangeLogManager()
+
+    class Meta:
+        db_table = 'change_log'
+        indexes = [models.Index(fields=['txid', 'id'], name='change_log_txid_id_idx')]
+
+    def __str__(self):
+        return f'#{self.pk} {self.entity} {self.object_id} {self.action}'
+
+
+
+class PerevalStatManager(models.Manager):
+    def apply(self, deltas):
+        """ Прибавляет к счетчикам изменения deltas {(dimension, key): +-n} одним запросом
+        INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count (SQLite и PostgreSQL).
+        Счетчики идут в порядке ключей, чтобы параллельные транзакции блокировали строки в одном порядке """
+        rows = sorted((dimension, key, delta) for (dimension, key), delta in deltas.items() if delta)
+        if not rows:
+            return
+        connection = connections[router.db_for_write(self.model)]
+        table, dimension, key, count = map(connection.ops.quote_name, (self.model._meta.db_table, 'dimension', 'key', 'count'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({dimension}, {key}, {count}) VALUES {", ".join(["(%s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT ({dimension}, {key}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}',
+                [value for row in rows for value in row],
+            )
+
+
+class PerevalStat(models.Model):
+    """ Счетчик перевалов в разрезе (dimension): по статусу, уровню сложности, району, автору.
+    Поддерживается на ходу при создании, редактировании, модерации и удалении перевалов
+    (fstr_app/stats.py), поэтому GET /stats/ не считает GROUP BY по всему архиву """
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=100, blank=True, default='')
+    count = models.BigIntegerField(default=0)
+
+    objects = PerevalStatManager()
+
+    class Meta:
+        db_table = 'pereval_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='pereval_stats_dimension_key_uniq'),
+        ]
+        indexes = [
+            # Самые активные авторы (GET /stats/) - первые строки индекса, без сортировки всех авторов
+            models.Index(fields=['dimension', '-count', 'key'], name='pereval_stats_top_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension}={self.key}: {self.count}'
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PerevalAdded, ChangeLog
+from .export import EXPORT_FIELDS
+from .projection import project, build_rows
+from . import stats
+
+
+''' Очередь модерации. Модератор забирает пачку новых перевалов (GET /moderation/queue/): они
+переходят в статус pending и закрепляются за ним (moderator, claimed_at), затем принимаются или
+отклоняются пачкой одним UPDATE. Несколько модераторов работают одновременно и не ждут друг друга:
+в PostgreSQL строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, в SQLite выбор и захват -
+один оператор UPDATE, а записи в SQLite и так идут по очереди. Перевал, который модератор взял,
+но не решил за FSTR_MODERATION_CLAIM_TIMEOUT секунд, снова попадает в очередь '''
+
+DECISIONS = ('accepted', 'rejected')
+
+
+def stale_before(now):
+    return now - timedelta(seconds=settings.FSTR_MODERATION_CLAIM_TIMEOUT)
+
+
+def held_by(moderator, now):
+    """Перевалы, которые модератор уже взял и еще не решил"""
+    return PerevalAdded.objects.filter(status='pending', moderator=moderator, claimed_at__gte=stale_before(now))
+
+
+def claim_rows(condition, limit, changes):
+    """ Берет в работу до limit перевалов, подходящих под condition, в порядке поступления.
+    Возвращает число взятых """
+    candidates = PerevalAdded.objects.filter(condition).order_by('add_time', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        return PerevalAdded.objects.filter(id__in=ids).update(**changes)
+    # Выбор и захват - один оператор UPDATE ... WHERE id IN (SELECT ... LIMIT): транзакция SQLite
+    # начинается сразу с записи и не упирается в "database is locked" при повышении блокировки
+    return PerevalAdded.objects.filter(id__in=candidates.values('id')[:limit]).update(**changes)
+
+
+def claim_new(moderator, limit, now):
+    """ Берет в работу до limit перевалов из очереди: сначала брошенные другими модераторами
+    (pending без захвата или с просроченным), затем новые. Возвращает их id """
+    changes = {'status': 'pending', 'moderator': moderator, 'claimed_at': now,
+               'version': F('version') + 1, 'updated_at': now}
+    abandoned = Q(status='pending') & (Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale_before(now)))
+    with transaction.atomic():
+        claimed = claim_rows(abandoned, limit, changes)
+        if claimed < limit:
+            stats.record_status_change('new', 'pending', claim_rows(Q(status='new'), limit - claimed, changes))
+        ids = list(PerevalAdded.objects.filter(status='pending', moderator=moderator, claimed_at=now)
+                   .order_by('add_time', 'id').values_list('id', flat=True))
+        ChangeLog.objects.record('pereval', ids)
+    return ids
+
+
+def claim(moderator, limit=None):
+    """ Закрепляет за модератором до limit перевалов (вместе с уже взятыми им ранее)
+    и возвращает их id """
+    limit = min(limit or settings.FSTR_MODERATION_BATCH_SIZE, settings.FSTR_MODERATION_MAX_BATCH_SIZE)
+    now = timezone.now()
+    held = list(held_by(moderator, now).order_by('add_time', 'id').values_list('id', flat=True)[:limit])
+    if len(held) >= limit:
+        return held
+    return held + claim_new(moderator, limit - len(held), now)
+
+
+def queue_rows(ids):
+    """Перевалы очереди в том же виде, что и в выгрузке, с превью фото, в порядке ids"""
+    rows = build_rows(project(PerevalAdded.objects.filter(id__in=ids), EXPORT_FIELDS), EXPORT_FIELDS, with_urls=True)
+    position = {pk: index for index, pk in enumerate(ids)}
+    return sorted(rows, key=lambda row: position[row['id']])
+
+
+def decide(moderator, ids, decision):
+    """ Принимает или отклоняет (decision - accepted / rejected) перевалы, взятые модератором,
+    одним UPDATE. Возвращает id перевалов, которые действительно изменились """
+    if decision not in DECISIONS:
+        raise ValueError(f'Неизвестное решение: {decision}')
+    now = timezone.now()
+    with transaction.atomic():
+        # Просроченный захват тоже годится, пока перевал не взял другой модератор
+        PerevalAdded.objects.filter(status='pending', moderator=moderator, id__in=ids).update(
+            status=decision, claimed_at=None, version=F('version') + 1, updated_at=now)
+        decided = sorted(PerevalAdded.objects.filter(id__in=ids, status=decision, moderator=moderator, updated_at=now)
+                         .values_list('id', flat=True))
+        ChangeLog.objects.record('pereval', decided)
+        stats.record_status_change('pending', decision, len(decided))
+    return decided
@@ -0,0 +1,19 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class PerevalCursorPagination(CursorPagination):
+    """ Keyset-пагинация списка перевалов по (add_time, id). Следующая страница выбирается
+    условием add_time > <позиция из курсора> по индексу (user_id, add_time, id), поэтому стоимость
+    запроса зависит только от размера страницы, а не от ее номера, как при OFFSET """
+    ordering = ('add_time', 'id')
+    page_size = settings.FSTR_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.FSTR_MAX_PAGE_SIZE
+
+
+class PerevalLimitOffsetPagination(LimitOffsetPagination):
+    """Для выборок, упорядоченных не по полям таблицы (например, по расстоянию до точки)"""
+    default_limit = settings.FSTR_PAGE_SIZE
+    max_limit = settings.FSTR_MAX_PAGE_SIZE
@@ -0,0 +1,201 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from .models import PerevalAddedImage
+from .serializers import PerevalAddedSerializer
+
+
+''' Быстрое чтение списков перевалов без машинерии DRF. Выбираются только нужные колонки (values()),
+а строка ответа собирается функцией, которая генерируется один раз на набор полей: в ней нет циклов
+по полям, to_representation и вложенных сериализаторов - только литерал словаря. Полный набор полей
+дает тот же JSON (байт в байт), что и PerevalAddedSerializer, ?view=summary и ?fields= - компактные
+строки. Фото перевалов на странице загружаются одним дополнительным запросом, в ответ попадают только
+их id и названия (в компактных строках - еще и ссылки на превью) '''
+
+# Колонки values(), из которых собирается каждое поле ответа
+FIELD_COLUMNS = {
+    'id': ['id'],
+    'beautyTitle': ['beautyTitle'],
+    'title': ['title'],
+    'other_titles': ['other_titles'],
+    'connect': ['connect'],
+    'add_time': ['add_time'],
+    'winter_level': ['winter_level'],
+    'summer_level': ['summer_level'],
+    'autumn_level': ['autumn_level'],
+    'spring_level': ['spring_level'],
+    'status': ['status'],
+    'area': ['area_id'],
+    'user': ['user__email', 'user__first_name', 'user__last_name', 'user__middle_name', 'user__phone'],
+    'coords': ['coords__latitude', 'coords__longitude', 'coords__height'],
+    'images': [],  # отдельным запросом
+}
+
+# Полный ответ - поля PerevalAddedSerializer в его порядке
+FULL_FIELDS = tuple(PerevalAddedSerializer.Meta.fields)
+SUMMARY_FIELDS = ('id', 'beautyTitle', 'title', 'other_titles', 'status', 'winter_level', 'summer_level',
+                  'autumn_level', 'spring_level', 'coords', 'images')
+
+# Колонки, без которых не работает курсорная пагинация (fstr_app.pagination) - выбираются всегда
+ORDERING_COLUMNS = ('add_time', 'id')
+
+
+def format_datetime(value):
+    # Как DateTimeField DRF: в текущем часовом поясе, UTC обозначается буквой Z
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def to_float(value):
+    return None if value is None else float(value)
+
+
+def to_int(value):
+    return None if value is None else int(value)
+
+
+# Преобразования колонок, как у соответствующих полей DRF; остальные колонки отдаются как есть
+CONVERTERS = {
+    'add_time': format_datetime,
+    'coords__latitude': to_float,
+    'coords__longitude': to_float,
+    'coords__height': to_int,
+}
+
+
+def requested_fields(request):
+    """ Поля из ?view=summary / ?fields=, без параметров - FULL_FIELDS.
+    Неизвестное поле или view - ValidationError """
+    view = request.query_params.get('view')
+    fields = request.query_params.get('fields')
+    if view is not None and view != 'summary':
+        raise serializers.ValidationError("Параметр view может быть только summary")
+    if fields is None:
+        return SUMMARY_FIELDS if view is not None else FULL_FIELDS
+
+    fields = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELD_COLUMNS]
+    if unknown or not fields:
+        raise serializers.ValidationError(
+            f"Неизвестные поля: {', '.join(unknown) or '-'}. Доступны: {', '.join(FIELD_COLUMNS)}"
+        )
+    return fields
+
+
+def project(queryset, fields):
+    """values()-выборка только с колонками для fields (и для сортировки)"""
+    columns = {column: None for column in ORDERING_COLUMNS}
+    for name in fields:
+        columns.update(dict.fromkeys(FIELD_COLUMNS[name]))
+    return queryset.values(*columns)
+
+
+def column_source(column):
+    value = f'row[{column!r}]'
+    converter = CONVERTERS.get(column)
+    return f'{converter.__name__}({value})' if converter else value
+
+
+@lru_cache(maxsize=64)
+def compile_row_builder(fields):
+    """ Функция build(row, images) -> dict для набора полей fields (кортеж). Исходный код
+    собирается и компилируется один раз, на каждую строку остается только построение словаря """
+    items = []
+    for name in fields:
+        if name == 'images':
+            items.append("'images': images[row['id']]")
+        elif name in ('user', 'coords'):
+            # Вложенный объект: ключи - имена колонок без префикса user__ / coords__
+            nested = ', '.join(f'{column.split("__", 1)[1]!r}: {column_source(column)}' for column in FIELD_COLUMNS[name])
+            items.append(f'{name!r}: {{{nested}}}')
+        else:
+            items.append(f'{name!r}: {column_source(FIELD_COLUMNS[name][0])}')
+    source = 'def build(row, images):\n    return {' + ', '.join(items) + '}\n'
+
+    namespace = {converter.__name__: converter for converter in CONVERTERS.values()}
+    exec(compile(source, f'<projection: {",".join(fields)}>', 'exec'), namespace)
+    return namespace['build']
+
+
+def image_url(image_id):
+    """Ссылка на самое маленькое превью фото"""
+    return reverse('image-rendition', kwargs={'pk': image_id, 'size': min(settings.FSTR_RENDITION_SIZES), 'fmt': 'webp'})
+
+
+def image_rows(pereval_ids):
+    return (PerevalAddedImage.objects.filter(pereval_id__in=pereval_ids).order_by('image_id')
+            .values_list('pereval_id', 'image_id', 'image__title'))
+
+
+def image_item(image_id, title, with_urls):
+    image = {'id': image_id, 'title': title}
+    if with_urls:
+        image['url'] = image_url(image_id)
+    return image
+
+
+def load_images(pereval_ids, with_urls=True):
+    """Фото перевалов {id перевала: [{'id', 'title'[, 'url']}]} одним запросом, в порядке id фото"""
+    images = {pk: [] for pk in pereval_ids}
+    for pereval_id, image_id, title in image_rows(pereval_ids):
+        images[pereval_id].append(image_item(image_id, title, with_urls))
+    return images
+
+
+async def aload_images(pereval_ids, with_urls=True):
+    """load_images для async-представлений: тот же запрос, строки читаются async-итерацией"""
+    images = {pk: [] for pk in pereval_ids}
+    async for pereval_id, image_id, title in image_rows(pereval_ids):
+        images[pereval_id].append(image_item(image_id, title, with_urls))
+    return images
+
+
+def build_rows(rows, fields, with_urls=None):
+    """ Строки ответа из словарей values(). По умолчанию ссылки на превью фото есть только
+    в компактных строках: в полном ответе их нет, как у ImageSerializer """
+    fields = tuple(fields)
+    rows = list(rows)
+    if with_urls is None:
+        with_urls = fields != FULL_FIELDS
+    images = {}
+    if 'images' in fields:
+        images = load_images([row['id'] for row in rows], with_urls=with_urls)
+    build = compile_row_builder(fields)
+    return [build(row, images) for row in rows]
+
+
+async def abuild_rows(rows, fields, with_urls=None):
+    """ build_rows для async-представлений. rows - готовый список словарей или values()-выборка,
+    которая читается async-итерацией """
+    fields = tuple(fields)
+    if hasattr(rows, '__aiter__'):
+        rows = [row async for row in rows]
+    if with_urls is None:
+        with_urls = fields != FULL_FIELDS
+    images = {}
+    if 'images' in fields:
+        images = await aload_images([row['id'] for row in rows], with_urls=with_urls)
+    build = compile_row_builder(fields)
+    return [build(row, images) for row in rows]
+
+
+class SparseFieldsMixin:
+    """ Примешивается к спискам перевалов (ListAPIView): страница строится из values() через
+    build_rows - полная (как у PerevalAddedSerializer) или компактная при ?view=summary / ?fields= """
+
+    def list(self, request, *args, **kwargs):
+        try:
+            fields = requested_fields(request)
+        except serializers.ValidationError as e:
+            return Response({"error": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(project(self.get_queryset(), fields))
+        return self.get_paginated_response(build_rows(page, fields))
@@ -0,0 +1,31 @@
+''' План запроса к БД, который объявляет сериализатор (атрибут query_plan), а представления
+применяют автоматически через QueryPlanMixin. Так вложенные user, coords и images
+загружаются фиксированным числом запросов, а не отдельным запросом на каждую строку (N+1) '''
+
+
+class QueryPlan:
+    def __init__(self, select_related=(), prefetch_related=(), only=()):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.only = tuple(only)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+class QueryPlanMixin:
+    """ Примешивается к generic-представлениям DRF. План применяется в filter_queryset,
+    который вызывают и list(), и get_object(), поэтому работает и при переопределенном get_queryset """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        plan = getattr(self.get_serializer_class(), 'query_plan', None)
+        if plan is not None:
+            queryset = plan.apply(queryset)
+        return queryset
@@ -0,0 +1,119 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Job
+from .storage import get_blob_storage
+from .jobs import job, enqueue_many
+
+
+''' Превью фото фиксированных размеров (settings.FSTR_RENDITION_SIZES) в форматах WebP и JPEG.
+Строятся в фоне после сохранения перевала (очередь заданий fstr_app.jobs или пул потоков),
+кэшируются на диске по хэшу оригинала: <FSTR_RENDITION_ROOT>/ab/<sha256>/<размер>.<формат> '''
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+class RenditionError(Exception):
+    """Не удалось построить превью (например, в хранилище не изображение)"""
+
+
+def rendition_path(sha256: str, size: int, fmt: str) -> Path:
+    return Path(settings.FSTR_RENDITION_ROOT) / sha256[:2] / sha256 / f'{size}.{fmt}'
+
+
+def render(sha256: str, size: int, fmt: str) -> Path:
+    """Возвращает путь к превью, при необходимости строит его из оригинала"""
+    path = rendition_path(sha256, size, fmt)
+    if path.exists():
+        return path
+
+    pil_format, _ = RENDITION_FORMATS[fmt]
+    try:
+        with get_blob_storage().open(sha256) as f, Image.open(f) as original:
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail((size, size))
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            # Пишем во временный файл и переименовываем, чтобы не отдать недописанное превью
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, pil_format, quality=85)
+            os.replace(tmp_path, path)
+    # DecompressionBombError (слишком много пикселей, Image.MAX_IMAGE_PIXELS) - не OSError
+    except (FileNotFoundError, UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise RenditionError(str(e))
+    return path
+
+
+def job_key(sha256: str) -> str:
+    return f'renditions:{sha256}'
+
+
+def delete_renditions(sha256: str) -> None:
+    """ Удаляет превью фото, файл которого удален из хранилища, и задание на их построение:
+    иначе ключ идемпотентности не дал бы поставить задание, если такое же фото загрузят снова """
+    shutil.rmtree(rendition_path(sha256, 0, 'webp').parent, ignore_errors=True)
+    Job.objects.filter(idempotency_key=job_key(sha256)).delete()
+
+
+@job('renditions.generate')
+def generate_renditions(sha256: str) -> None:
+    for size in settings.FSTR_RENDITION_SIZES:
+        for fmt in RENDITION_FORMATS:
+            try:
+                render(sha256, size, fmt)
+            except RenditionError as e:
+                logger.warning('Не удалось построить превью %s (%s px, %s): %s', sha256, size, fmt, e)
+                return
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.FSTR_RENDITION_WORKERS,
+                                           thread_name_prefix='renditions')
+        return _executor
+
+
+def schedule_renditions(sha256_list) -> None:
+    """ Откладывает построение превью, поэтому время ответа на POST/PATCH не зависит от числа фото.
+    При FSTR_JOB_QUEUE_ENABLED задания уходят в очередь в той же транзакции, что и сам перевал,
+    иначе превью строятся в пуле потоков после фиксации транзакции (при FSTR_RENDITION_WORKERS = 0 - сразу) """
+    hashes = set(sha256_list)
+    if not hashes:
+        return
+
+    if settings.FSTR_JOB_QUEUE_ENABLED:
+        enqueue_many('renditions.generate', {job_key(sha256): {'sha256': sha256} for sha256 in hashes})
+        return
+
+    def submit():
+        for sha256 in hashes:
+            if settings.FSTR_RENDITION_WORKERS:
+                get_executor().submit(generate_renditions, sha256)
+            else:
+                generate_renditions(sha256)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,45 @@
+from django.core.cache import caches
+
+from . import metrics
+
+
+''' Кэш готовых данных ответа GET /submitData/<id>/ (перевал вместе с user, coords и фото).
+Бэкенд - кэш Django с псевдонимом "responses" (LRU в памяти, файлы или Redis, см. settings.FSTR_RESPONSE_CACHE).
+В ключ входит PerevalAdded.version, которая растет при каждом изменении перевала (PATCH,
+смена статуса модерации, привязка фото) и его пользователя (UserManager.upsert_rows), и PerevalAdded.row_token,
+уникальная на время жизни записи. Поэтому устаревшая запись просто перестает запрашиваться
+и со временем вытесняется - отдельно удалять ее не нужно '''
+
+CACHE_ALIAS = 'responses'
+
+
+def detail_key(pk, row_token, version):
+    return f'pereval:{pk}:{row_token}:v{version}'
+
+
+def get_or_build(key, build):
+    """Данные из кэша, а при промахе - результат build(), который сохраняется в кэш"""
+    cache = caches[CACHE_ALIAS]
+    data = cache.get(key)
+    if data is not None:
+        metrics.incr('response_cache_hits_total')
+        return data
+
+    metrics.incr('response_cache_misses_total')
+    data = dict(build())
+    cache.set(key, data)
+    return data
+
+
+async def aget_or_build(key, build):
+    """То же для async-представлений: build - корутинная функция"""
+    cache = caches[CACHE_ALIAS]
+    data = await cache.aget(key)
+    if data is not None:
+        metrics.incr('response_cache_hits_total')
+        return data
+
+    metrics.incr('response_cache_misses_total')
+    data = dict(await build())
+    await cache.aset(key, data)
+    return data
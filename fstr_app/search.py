@@ -0,0 +1,275 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.db import connection as default_connection, connections, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import PerevalAdded
+
+
+''' Полнотекстовый поиск по названиям перевалов. Индекс - отдельная таблица pereval_search:
+в SQLite виртуальная таблица FTS5, в PostgreSQL колонка tsvector с GIN-индексом. Текст перед
+записью в индекс и запрос перед поиском приводятся к одному виду: кириллица транслитерируется
+в латиницу (поэтому "Пхия" находится и по "Phiya"), у слов отрезаются русские окончания.
+Стемминг свой, а не встроенный в БД, чтобы SQLite и PostgreSQL искали одинаково.
+Индекс обновляется при создании, редактировании и удалении перевала, полностью перестраивается
+командой manage.py rebuild_search_index '''
+
+SEARCH_TABLE = 'pereval_search'
+INDEX_BATCH_SIZE = 500
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+# Разные латинские написания одних звуков (Khan-Tengri / Han-Tengri, Jalovchat / Yalovchat)
+LATIN_FOLDING = [('shch', 'sch'), ('kh', 'h'), ('j', 'y')]
+
+# Русские окончания в транслитерации
+ENDINGS = [
+    'yami', 'ami', 'ogo', 'ego', 'omu', 'emu', 'aya', 'yaya', 'uyu', 'yuyu', 'yh', 'ih', 'ym', 'im',
+    'yy', 'iy', 'oy', 'ey', 'ov', 'ev', 'am', 'yam', 'ah', 'yah', 'om', 'em', 'oe', 'ee', 'ye', 'ie',
+    'ya', 'yu', 'a', 'o', 'e', 'y', 'i', 'u',
+]
+MIN_STEM = 3
+# Самая короткая основа (не короче MIN_STEM), т.е. самое длинное из подходящих окончаний
+ENDING_RE = re.compile(rf'^(.{{{MIN_STEM},}}?)(?:{"|".join(ENDINGS)})$')
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def transliterate(text):
+    text = text.lower().translate(TRANSLIT_TABLE)
+    if not text.isascii():
+        # Диакритика латиницы (Mönch -> monch); кириллица уже заменена, поэтому "й" не пострадает
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    for source, target in LATIN_FOLDING:
+        text = text.replace(source, target)
+    return text
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    if word.isdigit():
+        return word
+    match = ENDING_RE.match(word)
+    return match.group(1) if match else word
+
+
+def normalize(text):
+    """Список основ слов текста в виде, в котором они хранятся в индексе"""
+    return [stem(word) for word in WORD_RE.findall(transliterate(text or ''))]
+
+
+def document(beauty_title, title, other_titles, connect):
+    """Колонки индекса по убыванию веса: название, другие названия, что соединяет"""
+    return (
+        ' '.join(normalize(f'{beauty_title or ""} {title or ""}')),
+        ' '.join(normalize(other_titles)),
+        ' '.join(normalize(connect)),
+    )
+
+
+class SearchBackend:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def prepare(self, query):
+        """Слова запроса в том виде, в котором их ищет count()/page()"""
+        return normalize(query)
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def remove(self, pk):
+        # В PostgreSQL строку индекса удаляет внешний ключ с ON DELETE CASCADE
+        pass
+
+
+class SqliteSearchBackend(SearchBackend):
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                           f"USING fts5(title, other_titles, connect, tokenize='unicode61')")
+
+    def index(self, rows):
+        with self.connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', [row[0] for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, other_titles, connect) VALUES (%s, %s, %s, %s)',
+                [(pk, *document(*fields)) for pk, *fields in rows],
+            )
+
+    def remove(self, pk):
+        # У виртуальной таблицы FTS5 нет внешних ключей, строку удаляем сами
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [pk])
+
+    def match(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def count(self, terms):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [self.match(terms)])
+            return cursor.fetchone()[0]
+
+    def page(self, terms, offset, limit):
+        # bm25 тем меньше, чем лучше совпадение; веса колонок как у setweight A/B/C в PostgreSQL
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -bm25({SEARCH_TABLE}, 10.0, 4.0, 1.0) AS score FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s ORDER BY score DESC, rowid LIMIT %s OFFSET %s',
+                [self.match(terms), limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(SearchBackend):
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+                f'pereval_id bigint PRIMARY KEY REFERENCES {PerevalAdded._meta.db_table} (id) ON DELETE CASCADE, '
+                f'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)')
+
+    def index(self, rows):
+        # Текст уже нормализован, поэтому конфигурация simple - без стемминга на стороне БД
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (pereval_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+                f"setweight(to_tsvector('simple', %s), 'C')) "
+                f"ON CONFLICT (pereval_id) DO UPDATE SET document = EXCLUDED.document",
+                [(pk, *document(*fields)) for pk, *fields in rows],
+            )
+
+    def match(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def count(self, terms):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+                           [self.match(terms)])
+            return cursor.fetchone()[0]
+
+    def page(self, terms, offset, limit):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT pereval_id, ts_rank(document, query) AS score "
+                f"FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                f"WHERE document @@ query ORDER BY score DESC, pereval_id LIMIT %s OFFSET %s",
+                [self.match(terms), limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class ScanSearchBackend(SearchBackend):
+    """Для остальных БД: индекса нет, поиск перебором по LIKE (без транслитерации и ранжирования)"""
+
+    def prepare(self, query):
+        return query.split()
+
+    def create(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def index(self, rows):
+        pass
+
+    def queryset(self, terms):
+        queryset = PerevalAdded.objects.using(self.connection.alias)
+        for term in terms:
+            queryset = queryset.filter(title__icontains=term)
+        return queryset
+
+    def count(self, terms):
+        return self.queryset(terms).count()
+
+    def page(self, terms, offset, limit):
+        ids = self.queryset(terms).order_by('id').values_list('id', flat=True)[offset:offset + limit]
+        return [(pk, 0.0) for pk in ids]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, ScanSearchBackend)(connection)
+
+
+def index_rows(rows, connection=None):
+    """Записывает в индекс строки (id, beautyTitle, title, other_titles, connect)"""
+    backend = get_backend(connection)
+    rows = list(rows)
+    with transaction.atomic(using=backend.connection.alias):
+        for start in range(0, len(rows), INDEX_BATCH_SIZE):
+            backend.index(rows[start:start + INDEX_BATCH_SIZE])
+
+
+def index_perevals(perevals):
+    """Обновляет индекс для созданных или отредактированных перевалов"""
+    index_rows((p.id, p.beautyTitle, p.title, p.other_titles, p.connect) for p in perevals)
+
+
+@receiver(post_delete, sender=PerevalAdded)
+def unindex_pereval(sender, instance, using, **kwargs):
+    """Убирает из индекса удаленный перевал (сигнал - потому что перевалы удаляются и каскадно)"""
+    get_backend(connections[using]).remove(instance.pk)
+
+
+def rebuild_index(connection=None, queryset=None):
+    """ Пересоздает индекс целиком в одной транзакции (в SQLite без нее каждая вставка
+    фиксировалась бы отдельно). Возвращает число проиндексированных перевалов """
+    backend = get_backend(connection)
+    queryset = queryset if queryset is not None else PerevalAdded.objects.all()
+    rows = queryset.order_by('id').values_list('id', 'beautyTitle', 'title', 'other_titles', 'connect')
+    count = 0
+    batch = []
+    with transaction.atomic(using=backend.connection.alias):
+        backend.drop()
+        backend.create()
+        for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) == INDEX_BATCH_SIZE:
+                backend.index(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            backend.index(batch)
+            count += len(batch)
+    return count
+
+
+class SearchResults:
+    """ Результаты поиска для LimitOffsetPagination: count() и срез [a:b] - по одному запросу
+    к индексу, элементы - пары (id перевала, релевантность) """
+
+    def __init__(self, query, connection=None):
+        self.backend = get_backend(connection)
+        self.terms = self.backend.prepare(query)
+
+    def count(self):
+        return self.backend.count(self.terms) if self.terms else 0
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('Поддерживаются только срезы вида [a:b]')
+        if not self.terms:
+            return []
+        offset = item.start or 0
+        return self.backend.page(self.terms, offset, item.stop - offset)
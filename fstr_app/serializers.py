@@ -1,24 +1,89 @@
-import binascii
+from contextlib import contextmanager
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
 
 from rest_framework import serializers
-from .models import User, Coords, PerevalAdded, PerevalImage, PerevalAddedImage
-
-import base64
-from django.core.files.base import ContentFile
-
+from .models import User, Coords, PerevalAdded, PerevalArea, PerevalImage, PerevalAddedImage, ChangeLog
+from .storage import get_blob_storage, BlobTooLarge
+from .decoders import Base64DecodeError, stage_base64
+from .query_plan import QueryPlan
+from .renditions import schedule_renditions
+from .image_gc import mark_orphans, unmark_orphans
+from .search import index_perevals
+from . import stats
+
+def prepare_submit_data(data):
+    """ Преобразует тело запроса на добавление перевала (формат из ТЗ: level, user с ключами
+    fam/name/otc) в формат, ожидаемый PerevalAddedSerializer """
+    data = data.copy()
+    data['beautyTitle'] = data.pop('beautyTitle', '')
+
+    # Обрабатываем уровень сложности
+    level_data = data.pop('level', {})
+    data['winter_level'] = level_data.get('winter', '')
+    data['summer_level'] = level_data.get('summer', '')
+    data['autumn_level'] = level_data.get('autumn', '')
+    data['spring_level'] = level_data.get('spring', '')
+
+    # Обрабатываем пользователя
+    user_data = data.pop('user', {})
+    data['user'] = {
+        'email': user_data.get('email', ''),
+        'first_name': user_data.get('name', ''),
+        'last_name': user_data.get('fam', ''),
+        'middle_name': user_data.get('otc', ''),
+        'phone': user_data.get('phone', '')
+    }
+    return data
+
+
+def create_image(blob, title):
+    """Создает запись PerevalImage со ссылкой на фото, уже записанное в хранилище"""
+    image = PerevalImage.objects.create(title=title, **blob.as_fields())
+    ChangeLog.objects.record('image', [image.id])
+    return image
+
+
+@contextmanager
+def atomic_with_blobs():
+    """ transaction.atomic для сохранения с новыми фото. Фото из validated_data пока лежат во временном
+    каталоге хранилища (StagedBlob); функция promote_blobs, которую отдает блок with, переносит их в хранилище
+    и подставляет в images_data StoredBlob. Если транзакция откатится, файлы, которые впервые появились
+    в хранилище в этом блоке, удаляются """
+    storage = get_blob_storage()
+    promoted = []  # (sha256, время записи файла)
+
+    def promote_blobs(images_data):
+        for image_data in images_data:
+            staged = image_data['data']
+            if storage.promote(staged):
+                promoted.append((staged.blob.sha256, storage.modified_time(staged.blob.sha256)))
+            image_data['data'] = staged.blob
+        return images_data
 
-def decode_base64_image(data):
-    if isinstance(data, str) and data.startswith('data:image'):
-        # format: data:image/png;base64,XXXX
-        header, data = data.split(';base64,')
-        try:
-            decoded_data = base64.b64decode(data)
-            return ContentFile(decoded_data, 'upload.png')
-        except TypeError:
-            return None
-    return None
+    try:
+        with transaction.atomic():
+            yield promote_blobs
+    except BaseException:
+        for sha256, written in promoted:
+            try:
+                if storage.modified_time(sha256) > written:
+                    continue  # такое же фото тем временем сохранил другой запрос
+            except FileNotFoundError:
+                continue
+            storage.delete(sha256)
+        raise
+
+
+def bulk_create_images(images_data):
+    """То же для списка фото из validated_data (ключи data и title) - одним INSERT"""
+    images = PerevalImage.objects.bulk_create(
+        [PerevalImage(title=image_data['title'], **image_data['data'].as_fields()) for image_data in images_data]
+    )
+    ChangeLog.objects.record('image', [image.id for image in images])
+    return images
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -44,14 +109,19 @@ class ImageSerializer(serializers.ModelSerializer):
         model = PerevalImage
         fields = ['id', 'data', 'title']
 
-    def validate_data(self, value):
-        # Удаляем префикс data:image/...;base64, если есть
-        if isinstance(value, str) and value.startswith('data:image'):
-            _, value = value.split(';base64,')
+    # При чтении нужны только id и название, метаданные фото не загружаем
+    query_plan = QueryPlan(only=('id', 'title'))
 
+    def validate_data(self, value):
+        ''' Строка base64 (с префиксом data:image/...;base64, или без него) декодируется порциями
+         во временный каталог хранилища. Возвращаем не байты, а ссылку на записанный файл (StagedBlob);
+         в само хранилище он переносится при сохранении (atomic_with_blobs), а если запрос не прошел
+         валидацию, временный файл удаляется '''
         try:
-            return base64.b64decode(value)  # Декодируем в байты
-        except (TypeError, binascii.Error):
+            return stage_base64(value, get_blob_storage(), max_size=settings.FSTR_IMAGE_MAX_SIZE)
+        except BlobTooLarge as e:
+            raise serializers.ValidationError(str(e))
+        except Base64DecodeError:
             raise serializers.ValidationError("Некорректный формат Base64")
 
     def create(self, validated_data):
@@ -61,48 +131,41 @@ class ImageSerializer(serializers.ModelSerializer):
 
         # Создаём объект изображения
 
-        ''' Присваиваем полю "img" значения ключа, поскольку согласно ТЗ в эндпоинт из тела
-         запроса передается ключ "data" '''
-        return PerevalImage.objects.create(
-            img=image_data,
-            title=title
-        )
+        ''' Фото из ключа "data" (согласно ТЗ в эндпоинт из тела запроса передается именно он)
+         уже декодировано при валидации, переносим его в хранилище, а в БД сохраняем только ссылку на него '''
+        with atomic_with_blobs() as promote_blobs:
+            [image_data] = promote_blobs([{'data': image_data}])
+            return create_image(image_data['data'], title)
 
 class PerevalAddedSerializer(serializers.ModelSerializer):
     user = UserSerializer()
     coords = CoordsSerializer()
     images = ImageSerializer(many=True, source='pereval_images')
+    area = serializers.PrimaryKeyRelatedField(queryset=PerevalArea.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = PerevalAdded
         fields = ['beautyTitle', 'title', 'other_titles', 'connect',
                   'add_time', 'user', 'coords', 'winter_level', 'summer_level',
-                  'autumn_level', 'spring_level', 'images', 'status']
+                  'autumn_level', 'spring_level', 'images', 'status', 'area']
+
+    # user и coords подтягиваем JOIN-ом, фото - одним дополнительным запросом на всю выборку (в порядке id,
+    # как и в fstr_app/projection.load_images)
+    query_plan = QueryPlan(
+        select_related=('user', 'coords'),
+        prefetch_related=(
+            Prefetch('pereval_images', queryset=ImageSerializer.query_plan.apply(PerevalImage.objects.order_by('id'))),
+        ),
+    )
 
     def create(self, validated_data):
-        # Обработка пользователя
-        user_data = validated_data.pop('user')
-        if User.objects.filter(email=user_data.get('email')).exists():
-            user = User.objects.get(email=user_data.get('email'))
-
-            # Если у пользователя поменялись какие-либо поля, то обновляем его
-            has_changes = any(
-                getattr(user, field) != value
-                for field, value in user_data.items()
-            )
-            if has_changes:
-                print('есть замена')
-                for field, value in user_data.items():
-                    setattr(user, field, value)
-                user.save()
-        else:  # если пользователя с таким email нет, то создаем его
-            user = User.objects.create(
-                email=user_data['email'],
-                first_name=user_data.get('first_name', ''),
-                last_name=user_data.get('last_name', ''),
-                middle_name=user_data.get('middle_name', ''),
-                phone=user_data.get('phone', ''),
-            )
+        with atomic_with_blobs() as promote_blobs:
+            return self.create_pereval(validated_data, promote_blobs)
+
+    def create_pereval(self, validated_data, promote_blobs):
+        # Обработка пользователя: создаем нового или обновляем поля существующего одним запросом
+        user_data = dict(validated_data.pop('user'))
+        user = User.objects.upsert(**user_data)
 
         # Обработка координат
         coords_data = validated_data.pop('coords')
@@ -118,24 +181,26 @@ class PerevalAddedSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-        # Добавление изображений
-        for image_data in images_data:
-            img = PerevalImage.objects.create(
-                img=image_data['data'],
-                title=image_data['title']
-            )
-            PerevalAddedImage.objects.create(
-                pereval=pereval,
-                image=img
-            )
+        # Добавление изображений: фото и связи с перевалом вставляются одним запросом каждые
+        images = bulk_create_images(promote_blobs(images_data))
+        PerevalAddedImage.objects.bulk_create(
+            [PerevalAddedImage(pereval=pereval, image=img) for img in images]
+        )
 
+        # Превью фото строятся в фоне, ответ на запрос их не ждет
+        schedule_renditions(img.sha256 for img in images)
+
+        index_perevals([pereval])
         return pereval
 
     def update(self, instance, validated_data):
-        with transaction.atomic():
-
-            if instance.status != 'new':
+        with atomic_with_blobs() as promote_blobs:
+            # instance загружен до начала транзакции, и модератор мог успеть взять перевал в работу.
+            # Статус проверяем на строке, заблокированной до конца транзакции, и сохраняем ее же
+            pereval = PerevalAdded.objects.select_for_update().get(pk=instance.pk)
+            if pereval.status != 'new':
                 raise serializers.ValidationError("Редактирование запрещено. Поменялся статус записи")
+            stat_keys = stats.keys_of(pereval)
 
             # Обработка координат
             if 'coords' in validated_data:
@@ -144,34 +209,45 @@ class PerevalAddedSerializer(serializers.ModelSerializer):
             # Обработка изображений
             if 'pereval_images' in validated_data:
                 images_data = validated_data.pop('pereval_images')
-                images_to_keep = []
-
-                for img_data in images_data:
-                    print(img_data)
-                    if 'id' in img_data:  # Существующее изображение
-                        img = PerevalImage.objects.get(id=img_data['id'])
-                        if 'title' in img_data:
-                            img.title = img_data['title']
-                        img.save()
-                        images_to_keep.append(img)
-                    else:  # Новое изображение
-                        if 'data' not in img_data:
-                            raise serializers.ValidationError("Для нового изображения обязательно поле 'data'")
-                        img = PerevalImage.objects.create(
-                            img=img_data['data'],
-                            title=img_data['title']
-                        )
-                        images_to_keep.append(img)
+                kept_data = [img_data for img_data in images_data if 'id' in img_data]
+                new_data = [img_data for img_data in images_data if 'id' not in img_data]
+                if any('data' not in img_data for img_data in new_data):
+                    raise serializers.ValidationError("Для нового изображения обязательно поле 'data'")
+
+                # Существующие изображения загружаем одним запросом, названия обновляем одним UPDATE
+                kept = PerevalImage.objects.only('id', 'title').in_bulk([img_data['id'] for img_data in kept_data])
+                missing = {img_data['id'] for img_data in kept_data} - set(kept)
+                if missing:
+                    raise serializers.ValidationError(f"Изображения с id {sorted(missing)} не найдены")
+                renamed = []
+                for img_data in kept_data:
+                    img = kept[img_data['id']]
+                    if 'title' in img_data and img.title != img_data['title']:
+                        img.title = img_data['title']
+                        renamed.append(img)
+                if renamed:
+                    PerevalImage.objects.bulk_update(renamed, ['title'])
+                    ChangeLog.objects.record('image', [img.id for img in renamed])
+
+                # Новые изображения
+                new_images = bulk_create_images(promote_blobs(new_data))
+                schedule_renditions(img.sha256 for img in new_images)
+                images_to_keep = list(kept.values()) + new_images
 
                 # Обновляем связи перевала с изображениями
-                instance.pereval_images.set(images_to_keep)
+                old_ids = set(PerevalAddedImage.objects.filter(pereval=pereval).values_list('image_id', flat=True))
+                pereval.pereval_images.set(images_to_keep)
 
-                # Удаляем отвязанные изображения
-                PerevalImage.objects.filter(perevaladdedimage__isnull=True).delete()
+                # Отвязанные фото не удаляем сразу, а помечаем для сборщика мусора (fstr_app/image_gc.py)
+                mark_orphans(old_ids - set(kept))
+                unmark_orphans(kept)
 
             # Обновляем остальные поля
             for attr, value in validated_data.items():
-                setattr(instance, attr, value)
+                setattr(pereval, attr, value)
 
-            instance.save()
-            return instance
+            # Только переданные поля: статус, модератор и claimed_at не перезаписываются
+            pereval.save(update_fields=list(validated_data))
+            index_perevals([pereval])
+            stats.record_changed(stat_keys, pereval)
+            return pereval
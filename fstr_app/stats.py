@@ -0,0 +1,126 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import PerevalAdded, PerevalArea, PerevalStat, User
+
+
+''' Статистика архива для дашбордов: число перевалов по статусу, уровням сложности, районам и авторам.
+Считается не GROUP BY по pereval_added на каждый запрос, а хранится в таблице счетчиков pereval_stats,
+которые меняются вместе с данными: при создании перевала (сигнал post_save и импорт), редактировании
+через сериализатор, модерации и удалении. GET /stats/ читает готовые счетчики, и время ответа не зависит от размера архива.
+Если счетчики разошлись с данными (например, после правки БД вручную), их пересчитывает команда
+manage.py rebuild_stats '''
+
+# Разрез статистики -> колонка перевала
+DIMENSIONS = {
+    'status': 'status',
+    'summer_level': 'summer_level',
+    'winter_level': 'winter_level',
+    'autumn_level': 'autumn_level',
+    'spring_level': 'spring_level',
+    'area': 'area_id',
+    'user': 'user_id',
+}
+TOTAL = ('total', '')
+TOP_AUTHORS = 20
+
+
+def stat_key(value):
+    # Пустой уровень сложности и перевал без района считаются под ключом ''
+    return '' if value is None else str(value)
+
+
+def keys_of(pereval):
+    """Счетчики, в которые входит перевал"""
+    return [TOTAL] + [(dimension, stat_key(getattr(pereval, column))) for dimension, column in DIMENSIONS.items()]
+
+
+def count_keys(perevals, sign=1):
+    deltas = Counter()
+    for pereval in perevals:
+        for key in keys_of(pereval):
+            deltas[key] += sign
+    return deltas
+
+
+def record_created(perevals):
+    PerevalStat.objects.apply(count_keys(perevals))
+
+
+def record_deleted(perevals):
+    PerevalStat.objects.apply(count_keys(perevals, sign=-1))
+
+
+def record_changed(before, pereval):
+    """before - keys_of(перевал) до изменения"""
+    deltas = Counter(keys_of(pereval))
+    deltas.subtract(before)
+    PerevalStat.objects.apply(deltas)
+
+
+def record_status_change(old, new, count):
+    """count перевалов перешли из статуса old в new одним UPDATE (модерация)"""
+    if count and old != new:
+        PerevalStat.objects.apply({('status', old): -count, ('status', new): count})
+
+
+@receiver(post_save, sender=PerevalAdded)
+def count_pereval_create(sender, instance, created, **kwargs):
+    # Создание через save() (сериализатор, админка); bulk_create в импорте учитывается явно
+    if created:
+        record_created([instance])
+
+
+@receiver(post_delete, sender=PerevalAdded)
+def count_pereval_delete(sender, instance, **kwargs):
+    record_deleted([instance])
+
+
+@receiver(pre_delete, sender=PerevalArea)
+def count_area_delete(sender, instance, **kwargs):
+    # Перевалы удаляемого района остаются без района (SET_NULL выполняется UPDATE-ом, без сигналов)
+    count = PerevalStat.objects.filter(dimension='area', key=stat_key(instance.pk)).values_list('count', flat=True).first()
+    if count:
+        PerevalStat.objects.apply({('area', stat_key(instance.pk)): -count, ('area', ''): count})
+
+
+def rebuild():
+    """Пересчитывает все счетчики по pereval_added в одной транзакции. Возвращает число перевалов"""
+    with transaction.atomic():
+        PerevalStat.objects.all().delete()
+        counts = Counter({TOTAL: PerevalAdded.objects.count()})
+        for dimension, column in DIMENSIONS.items():
+            # NULL и пустая строка попадают под один ключ '', поэтому складываем
+            for value, count in PerevalAdded.objects.order_by().values_list(column).annotate(count=Count('id')):
+                counts[dimension, stat_key(value)] += count
+        PerevalStat.objects.bulk_create(
+            [PerevalStat(dimension=dimension, key=key, count=count) for (dimension, key), count in counts.items()],
+            batch_size=1000,
+        )
+    return counts[TOTAL]
+
+
+def get_stats(top=TOP_AUTHORS):
+    """ Все счетчики, кроме авторов - их может быть сколько угодно, поэтому отдаются только top
+    самых активных (по индексу pereval_stats_top_idx) """
+    dimensions = [dimension for dimension in DIMENSIONS if dimension != 'user']
+    result = {'total': 0, **{dimension: {} for dimension in dimensions}, 'top_authors': []}
+    rows = PerevalStat.objects.filter(dimension__in=[TOTAL[0], *dimensions], count__gt=0)
+    for dimension, key, count in rows.values_list('dimension', 'key', 'count'):
+        if (dimension, key) == TOTAL:
+            result['total'] = count
+        else:
+            result[dimension][key] = count
+
+    authors = list(PerevalStat.objects.filter(dimension='user', count__gt=0).order_by('-count', 'key')
+                   .values_list('key', 'count')[:top])
+    emails = User.objects.only('id', 'email').in_bulk([int(key) for key, _ in authors])
+    result['top_authors'] = [
+        {'user_id': int(key), 'email': emails[int(key)].email if int(key) in emails else None, 'count': count}
+        for key, count in authors
+    ]
+    return result
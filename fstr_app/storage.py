@@ -0,0 +1,224 @@
+import hashlib
+import os
+import tempfile
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+''' Хранилище бинарных данных фотографий. Файлы адресуются по SHA-256 от содержимого,
+поэтому одинаковые фото физически хранятся один раз, а в таблице pereval_images
+остаются только хэш, размер и MIME-тип. Бэкенд задается в settings.BLOB_STORAGE '''
+
+# Сигнатуры (magic bytes) распространенных форматов изображений
+MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+# Размер порции при потоковой записи файлов
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobTooLarge(Exception):
+    """Файл превышает допустимый размер, запись прервана"""
+
+
+def guess_mime_type(head: bytes) -> str:
+    """Определяет MIME-тип по первым байтам файла"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return DEFAULT_MIME_TYPE
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    sha256: str
+    size: int
+    mime_type: str
+
+    def as_fields(self):
+        """Значения полей модели PerevalImage"""
+        return {'sha256': self.sha256, 'size': self.size, 'mime_type': self.mime_type}
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class StagedBlob:
+    """ Файл, записанный во временный каталог (BaseBlobStorage.stage_stream), но еще не перенесенный
+    в хранилище (promote). Если перенос не состоялся, временный файл удаляется вместе с объектом """
+
+    def __init__(self, path, blob: StoredBlob):
+        self.path = path
+        self.blob = blob
+        self._finalizer = weakref.finalize(self, remove_file, path)
+
+    def discard(self):
+        self._finalizer()
+
+
+class StagingFile:
+    """ Временный файл в directory (None - системный каталог), в который порции дописываются по мере
+    поступления с подсчетом хэша на лету. Если задан max_size и он превышен, write прерывает запись
+    исключением BlobTooLarge, а временный файл удаляется """
+
+    def __init__(self, directory=None, max_size=None):
+        self.max_size = max_size
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        fd, self.path = tempfile.mkstemp(dir=directory)
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        if len(self.head) < 16:
+            self.head += chunk[:16 - len(self.head)]
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            self.abort()
+            raise BlobTooLarge(f'Размер файла превышает {self.max_size} байт')
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self) -> StagedBlob:
+        self.file.close()
+        blob = StoredBlob(sha256=self.hasher.hexdigest(), size=self.size, mime_type=guess_mime_type(self.head))
+        return StagedBlob(self.path, blob)
+
+    def abort(self):
+        self.file.close()
+        remove_file(self.path)
+
+
+class BaseBlobStorage:
+    """Базовый класс бэкенда. Наследники реализуют save_stream, open, exists и delete"""
+
+    def save(self, data: bytes, max_size=None) -> StoredBlob:
+        return self.save_stream([data], max_size=max_size)
+
+    def save_stream(self, chunks, max_size=None) -> StoredBlob:
+        """ Записывает файл, поступающий порциями (итератор байтов), с подсчетом хэша на лету.
+        Если задан max_size и он превышен, запись прерывается исключением BlobTooLarge """
+        raise NotImplementedError
+
+    def open_staging(self, max_size=None) -> StagingFile:
+        """Временный файл для stage_stream и загрузки multipart (fstr_app.uploads). По умолчанию - локальный"""
+        return StagingFile(max_size=max_size)
+
+    def stage_stream(self, chunks, max_size=None) -> StagedBlob:
+        """ Записывает файл только во временный каталог: в хранилище он появится после promote.
+        Так фото из запроса, который не прошел валидацию, не попадает в хранилище """
+        staging = self.open_staging(max_size=max_size)
+        try:
+            for chunk in chunks:
+                staging.write(chunk)
+        except BaseException:
+            staging.abort()
+            raise
+        return staging.finish()
+
+    def promote(self, staged: StagedBlob) -> bool:
+        """Переносит файл в хранилище. Возвращает True, если файла с таким хэшем в хранилище еще не было"""
+        created = not self.exists(staged.blob.sha256)
+        with open(staged.path, 'rb') as f:
+            self.save_stream(iter(lambda: f.read(CHUNK_SIZE), b''))
+        staged.discard()
+        return created
+
+    def open(self, sha256: str):
+        raise NotImplementedError
+
+    def exists(self, sha256: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, sha256: str) -> None:
+        raise NotImplementedError
+
+    def modified_time(self, sha256: str) -> float:
+        """Время (timestamp) последней записи файла, в т.ч. повторной записи такого же фото"""
+        raise NotImplementedError
+
+    def read(self, sha256: str) -> bytes:
+        with self.open(sha256) as f:
+            return f.read()
+
+
+class FileSystemBlobStorage(BaseBlobStorage):
+    """ Файлы раскладываются по каталогам <location>/ab/cd/<sha256>, чтобы
+    в одном каталоге не накапливались сотни тысяч файлов """
+
+    def __init__(self, location):
+        self.location = Path(location)
+
+    def path(self, sha256: str) -> Path:
+        return self.location / sha256[:2] / sha256[2:4] / sha256
+
+    def save_stream(self, chunks, max_size=None) -> StoredBlob:
+        staged = self.stage_stream(chunks, max_size=max_size)
+        self.promote(staged)
+        return staged.blob
+
+    def open_staging(self, max_size=None) -> StagingFile:
+        # Временный каталог внутри location: перенос в хранилище - os.replace в пределах одной ФС
+        tmp_dir = self.location / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return StagingFile(tmp_dir, max_size=max_size)
+
+    def promote(self, staged: StagedBlob) -> bool:
+        final_path = self.path(staged.blob.sha256)
+        if final_path.exists():  # такое фото уже есть, копию не храним
+            staged.discard()
+            os.utime(final_path)  # отмечаем свежую запись, чтобы сборщик мусора не удалил файл
+            return False
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged.path, final_path)
+        return True
+
+    def open(self, sha256: str):
+        return open(self.path(sha256), 'rb')
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def delete(self, sha256: str) -> None:
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def modified_time(self, sha256: str) -> float:
+        return os.path.getmtime(self.path(sha256))
+
+
+@lru_cache(maxsize=None)
+def get_blob_storage() -> BaseBlobStorage:
+    config = settings.BLOB_STORAGE
+    backend_class = import_string(config['BACKEND'])
+    return backend_class(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_blob_storage(setting, **kwargs):
+    # Нужно для override_settings в тестах
+    if setting == 'BLOB_STORAGE':
+        get_blob_storage.cache_clear()
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ChangeLog, PerevalAdded, PerevalImage
+from .serializers import PerevalAddedSerializer
+
+
+''' Дельта-синхронизация для офлайн-клиентов: GET /sync/?since=<курсор> возвращает только перевалы
+и фото, созданные, измененные или удаленные после курсора, и новый курсор. Источник - журнал
+ChangeLog: создание и изменение записываются там же, где сохраняются данные (save(), bulk_create
+в сериализаторе и импорте), удаление - сигналом post_delete, так как записи удаляются и каскадно '''
+
+@receiver(post_delete, sender=PerevalAdded)
+def log_pereval_delete(sender, instance, **kwargs):
+    ChangeLog.objects.record('pereval', [instance.pk], action='delete')
+
+
+@receiver(post_delete, sender=PerevalImage)
+def log_image_delete(sender, instance, **kwargs):
+    ChangeLog.objects.record('image', [instance.pk], action='delete')
+
+
+def changes_since(since, limit=None):
+    """ Изменения после курсора since, не больше limit записей журнала. Повторные изменения одного
+    объекта схлопываются: важно только последнее действие и текущее состояние объекта """
+    limit = min(limit or settings.FSTR_SYNC_BATCH_SIZE, settings.FSTR_SYNC_MAX_BATCH_SIZE)
+    entries = list(
+        ChangeLog.objects.committed(since).values_list('id', 'entity', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    last_action = {'pereval': {}, 'image': {}}
+    for _, entity, object_id, action in entries:
+        last_action[entity][object_id] = action
+
+    def split(entity):
+        actions = last_action[entity]
+        return (sorted(pk for pk, action in actions.items() if action == 'upsert'),
+                sorted(pk for pk, action in actions.items() if action == 'delete'))
+
+    pereval_ids, deleted_perevals = split('pereval')
+    perevals = PerevalAddedSerializer.query_plan.apply(PerevalAdded.objects.all()).in_bulk(pereval_ids)
+    image_ids, deleted_images = split('image')
+    images = PerevalImage.objects.filter(id__in=image_ids).order_by('id').values('id', 'title', 'sha256', 'size', 'mime_type')
+
+    # Объект, которого уже нет, удален позже: запись об удалении придет в следующей порции
+    return {
+        'cursor': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'perevals': {
+            'upserted': [{'id': pk, **PerevalAddedSerializer(perevals[pk]).data} for pk in pereval_ids if pk in perevals],
+            'deleted': deleted_perevals,
+        },
+        'images': {
+            'upserted': list(images),
+            'deleted': deleted_images,
+        },
+    }
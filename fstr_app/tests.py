@@ -1,13 +1,49 @@
+import gc
+import hashlib
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import skipIf
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-from django.test import TestCase
+from django.db import connection, connections, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.conf import settings
 
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.test import  APIClient, APITestCase
+from rest_framework.renderers import JSONRenderer
+
+from .models import ChangeLog, PerevalAdded, PerevalArea, PerevalImage, Job, User, subtree_filter
+from .area_tree import get_area_tree
+from . import search
+from . import jobs
+from .storage import get_blob_storage, BlobTooLarge
+from .uploads import StagedBlobUploadHandler
+from .renditions import RenditionError, render, rendition_path
+from .ingest import import_passes
+from .image_gc import collect_orphans
+from .decoders import Base64DecodeError, iter_base64_chunks, decode_base64_to_storage
+from .views import PerevalExportView, image_to_base64
+from . import metrics
+from .serializers import PerevalAddedSerializer, atomic_with_blobs
+from . import geo
+from . import projection
+from . import moderation
+from . import stats
+from . import async_views
+import base64
+from base64 import b64decode
+from io import BytesIO
+from PIL import Image
 
-from .models import PerevalAdded
-from .views import image_to_base64
-from .serializers import PerevalAddedSerializer
 from .factories import UserFactory, CoordsFactory, PerevalAddedFactory, PerevalImageFactory, PerevalAddedImageFactory
 
 
@@ -23,6 +59,50 @@ def test_pereval_creation():
     assert pereval_image.pereval == pereval
     assert bytes(pereval_image.image.img)[10:20] == b'\x00\x01\x01\x01\x00H\x00H\x00\x00'
 
+
+@pytest.mark.django_db
+def test_identical_images_stored_once():
+    first = PerevalImageFactory()
+    second = PerevalImageFactory(title="Копия")
+
+    # Одинаковые фото адресуются одним хэшем, т.е. в хранилище лежат в одном файле
+    assert first.sha256 == second.sha256
+    assert first.mime_type == 'image/jpeg'
+    assert first.size == len(first.img)
+    assert get_blob_storage().exists(first.sha256)
+    assert PerevalImage.objects.filter(sha256=first.sha256).count() == 2
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='профиль SQLite')
+def test_sqlite_profile_pragmas():
+    with connection.cursor() as cursor:
+        assert cursor.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert cursor.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        assert cursor.execute('PRAGMA busy_timeout').fetchone()[0] > 0
+    assert connection.transaction_mode == 'IMMEDIATE'
+
+
+def test_chunked_base64_matches_b64decode():
+    raw = b64decode(image_to_base64('image.jpg'))
+    encoded = 'data:image/jpeg;base64,' + image_to_base64('image.jpg')
+    start = len('data:image/jpeg;base64,')
+    for chunk_size in (4, 1000, 64 * 1024):
+        assert b''.join(iter_base64_chunks(encoded, start, chunk_size)) == raw
+
+    # Переносы строк внутри base64 отбрасываются, как в base64.b64decode
+    assert b''.join(iter_base64_chunks('/9j/\n4AAQ', chunk_size=4)) == b64decode('/9j/4AAQ')
+    with pytest.raises(Base64DecodeError):
+        list(iter_base64_chunks('invalid'))
+
+
+@pytest.mark.django_db
+def test_decode_base64_rejects_bad_header_and_oversize():
+    with pytest.raises(Base64DecodeError):
+        decode_base64_to_storage('data:text/html;base64,AAAA', get_blob_storage())
+    with pytest.raises(BlobTooLarge):
+        decode_base64_to_storage('data:image/png;base64,' + 'A' * 4000, get_blob_storage(), max_size=1000)
+
+
 #
 class TestSerializers(TestCase):
     def setUp(self):
@@ -102,8 +182,29 @@ class TestSerializers(TestCase):
         self.assertEqual(updated_instance.title, "Updated Title")
         self.assertEqual(updated_instance.coords.latitude, new_coords.latitude)
         self.assertEqual(updated_instance.pereval_images.count(), 2)
+
+    def test_update_after_claim_rejected(self):
+        # Модератор берет перевал в работу уже после того, как представление загрузило instance
+        PerevalAdded.objects.filter(pk=self.pereval.pk).update(status='pending', moderator='anna')
+        serializer = PerevalAddedSerializer(instance=self.pereval, data={'title': 'Поздно'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save()
+        claimed = PerevalAdded.objects.get(pk=self.pereval.pk)
+        self.assertEqual((claimed.status, claimed.moderator, claimed.title), ('pending', 'anna', self.pereval.title))
 #
 #
+# Сборщик мусора в тестах удаляет файлы, поэтому хранилище для TestAPI - во временном каталоге
+TEST_MEDIA_ROOT = Path(tempfile.mkdtemp(prefix='fstr-test-media-'))
+
+
+@override_settings(
+    BLOB_STORAGE={
+        'BACKEND': 'fstr_app.storage.FileSystemBlobStorage',
+        'OPTIONS': {'location': TEST_MEDIA_ROOT / 'blobs'},
+    },
+    FSTR_RENDITION_ROOT=TEST_MEDIA_ROOT / 'renditions',
+)
 class TestAPI(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -228,10 +329,387 @@ class TestAPI(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['user']['email'], self.user_data['email'])
-        self.assertEqual(response.data[0]['other_titles'], "Вьючная API")
+        results = response.data['results']  # список перевалов теперь разбит на страницы
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['user']['email'], self.user_data['email'])
+        self.assertEqual(results[0]['other_titles'], "Вьючная API")
+        self.assertIsNone(response.data['next'])
+
+    def test_get_pereval_by_email_cursor_pages(self):
+        for i in range(4):
+            self.client.post(reverse('submitData'), {**self.pereval_data, 'title': f'Перевал {i}'}, format='json')
+
+        url = reverse('submitData') + f"?user__email={self.user_data['email']}&page_size=2"
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            titles += [row['title'] for row in response.data['results']]
+            url = response.data['next']
+
+        # Все 5 перевалов в порядке добавления, без пропусков и повторов
+        self.assertEqual(titles, ["Апишный тракт"] + [f'Перевал {i}' for i in range(4)])
+    def test_upload_image_multipart(self):
+        url = reverse('pereval-images', kwargs={'pk': self.pk})
+        with open('image2.jpg', 'rb') as f:
+            upload = SimpleUploadedFile('image2.jpg', f.read(), content_type='image/jpeg')
+        response = self.client.post(url, {'image': upload, 'title': 'Multipart'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        image = PerevalImage.objects.get(pk=response.data['id'])
+        self.assertEqual(image.title, 'Multipart')
+        self.assertEqual(image.mime_type, 'image/jpeg')
+        self.assertEqual(image.img, open('image2.jpg', 'rb').read())
+        self.assertEqual(PerevalAdded.objects.get(pk=self.pk).pereval_images.count(), 2)
+
+    def test_upload_image_raw(self):
+        url = reverse('pereval-images', kwargs={'pk': self.pk}) + '?title=Raw'
+        data = open('image2.jpg', 'rb').read()
+        response = self.client.generic('POST', url, data, content_type='image/jpeg')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(PerevalImage.objects.get(pk=response.data['id']).size, len(data))
+
+    def test_image_renditions(self):
+        upload_url = reverse('pereval-images', kwargs={'pk': self.pk})
+        response = self.client.generic('POST', upload_url, open('image2.jpg', 'rb').read(), content_type='image/jpeg')
+        image = PerevalImage.objects.get(pk=response.data['id'])
+
+        # Построение превью поставлено в очередь, выполняем его как воркер
+        self.assertEqual(Job.objects.filter(idempotency_key=f'renditions:{image.sha256}').count(), 1)
+        jobs.run_pending()
+        self.assertTrue(rendition_path(image.sha256, 128, 'webp').exists())
+        self.assertTrue(rendition_path(image.sha256, 1024, 'jpeg').exists())
+
+        url = reverse('image-rendition', kwargs={'pk': image.pk, 'size': 128, 'fmt': 'webp'})
+        response = self.client.get(url, HTTP_ACCEPT='image/webp')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(max(Image.open(BytesIO(b''.join(response.streaming_content))).size), 128)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse('image-rendition', kwargs={'pk': image.pk, 'size': 100, 'fmt': 'webp'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        # Сборщик мусора удаляет превью вместе с файлом, а повторная загрузка того же фото снова ставит задание
+        kept = [{'id': pk, 'title': title} for pk, title in
+                PerevalImage.objects.filter(pereval=self.pk).exclude(pk=image.pk).values_list('pk', 'title')]
+        self.client.patch(reverse('pereval-update', kwargs={'pk': self.pk}), {'images': kept}, format='json')
+        self.assertEqual(collect_orphans(grace_seconds=0).blobs, 1)
+        self.assertFalse(rendition_path(image.sha256, 128, 'webp').exists())
+        self.client.generic('POST', upload_url, open('image2.jpg', 'rb').read(), content_type='image/jpeg')
+        self.assertEqual(Job.objects.get(idempotency_key=f'renditions:{image.sha256}').status, 'queued')
+
+    def test_rendition_decompression_bomb(self):
+        upload_url = reverse('pereval-images', kwargs={'pk': self.pk})
+        response = self.client.generic('POST', upload_url, open('image2.jpg', 'rb').read(), content_type='image/jpeg')
+        sha256 = PerevalImage.objects.get(pk=response.data['id']).sha256
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 1), self.assertRaises(RenditionError):
+            render(sha256, 128, 'webp')
+        self.assertFalse(rendition_path(sha256, 128, 'webp').exists())
+
+    @override_settings(FSTR_IMAGE_MAX_SIZE=1024)
+    def test_upload_image_too_large(self):
+        url = reverse('pereval-images', kwargs={'pk': self.pk})
+        upload = SimpleUploadedFile('big.jpg', b'\xff' * 4096, content_type='image/jpeg')
+        response = self.client.post(url, {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(PerevalAdded.objects.get(pk=self.pk).pereval_images.count(), 1)
+        # Прием прерван на первой порции сверх предела, временный файл удален, в хранилище ничего не попало
+        self.assertEqual(list((TEST_MEDIA_ROOT / 'blobs' / 'tmp').iterdir()), [])
+        self.assertFalse(get_blob_storage().exists(hashlib.sha256(b'\xff' * 4096).hexdigest()))
+
+    @override_settings(FSTR_IMAGE_MAX_SIZE=1024)
+    def test_upload_handler_stops_at_limit(self):
+        handler = StagedBlobUploadHandler()
+        handler.new_file('image', 'big.jpg', 'image/jpeg', None)
+        handler.receive_data_chunk(b'\xff' * 1000, 0)
+        # Прием прерывается сразу на порции, с которой файл превысил предел, а не после загрузки целиком
+        with self.assertRaises(BlobTooLarge):
+            handler.receive_data_chunk(b'\xff' * 1000, 1000)
+        self.assertEqual(list((TEST_MEDIA_ROOT / 'blobs' / 'tmp').iterdir()), [])
+
+    def test_bulk_create(self):
+        other_user = {**self.user_data, 'email': 'bulk@api.com'}
+        lines = [
+            json.dumps({**self.pereval_data, 'title': 'Первый'}),
+            '{не json',
+            json.dumps({**self.pereval_data, 'title': 'Второй', 'user': other_user}),
+            json.dumps({**self.pereval_data, 'images': [{"data": "invalid", "title": "Bad Image"}]}),
+            json.dumps({**self.pereval_data, 'title': 'Третий', 'user': {**self.user_data, 'phone': '+70000000000'}}),
+        ]
+        url = reverse('submitData-bulk') + '?batch_size=2'
+        response = self.client.generic('POST', url, '\n'.join(lines), content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 4])
+
+        # Пользователь из повторной записи обновлен, а не задублирован
+        self.assertEqual(User.objects.get(email='test@api.com').phone, '+70000000000')
+        pereval = PerevalAdded.objects.get(title='Второй')
+        self.assertEqual(pereval.user.email, 'bulk@api.com')
+        self.assertEqual(pereval.summer_level, '1A')
+        self.assertEqual(pereval.pereval_images.get().img, open('image.jpg', 'rb').read())
+        self.assertEqual(stats.get_stats()['total'], PerevalAdded.objects.count())
+
+    def test_unlinked_images_collected(self):
+        pereval = PerevalAdded.objects.get(pk=self.pk)
+        old_image = pereval.pereval_images.get()
+        PerevalImageFactory()  # еще одна запись с тем же файлом image.jpg
+        unique = {"data": "data:image/png;base64," + base64.b64encode(b'\x89PNG\r\n\x1a\nunique').decode(),
+                  "title": "Уникальное"}
+
+        # Заменяем фото: старое (image.jpg) не удаляется сразу, а помечается
+        url = reverse('pereval-update', kwargs={'pk': self.pk})
+        self.client.patch(url, {'images': [unique]}, format='json')
+        old_image.refresh_from_db()
+        self.assertIsNotNone(old_image.orphaned_at)
+
+        # Теперь отвязываем и второе фото
+        unique_image = pereval.pereval_images.get()
+        self.client.patch(url, {'images': []}, format='json')
+
+        # С задержкой по умолчанию помеченные фото еще не удаляются
+        self.assertEqual(collect_orphans().images, 0)
+
+        report = collect_orphans(grace_seconds=0)
+        self.assertEqual(report.images, 2)
+        self.assertFalse(PerevalImage.objects.filter(pk__in=[old_image.pk, unique_image.pk]).exists())
+
+        # Файл уникального фото удален, а файл image.jpg остался - на него ссылаются другие записи
+        self.assertEqual(report.blobs, 1)
+        self.assertEqual(report.reclaimed_bytes, unique_image.size)
+        self.assertFalse(get_blob_storage().exists(unique_image.sha256))
+
+    def test_deleted_pereval_images_collected(self):
+        image = PerevalAdded.objects.get(pk=self.pk).pereval_images.get()
+        PerevalAdded.objects.get(pk=self.pk).delete()
+        image.refresh_from_db()
+        self.assertIsNotNone(image.orphaned_at)
+        self.assertEqual(collect_orphans(grace_seconds=0).images, 1)
+        self.assertFalse(PerevalImage.objects.filter(pk=image.pk).exists())
+
+    def test_invalid_submission_leaves_no_blobs(self):
+        raw = b'\x89PNG\r\n\x1a\nrejected'
+        image = {"data": "data:image/png;base64," + base64.b64encode(raw).decode(), "title": "Отклоненное"}
+        response = self.client.post(reverse('submitData'), {**self.pereval_data, 'coords': {}, 'images': [image]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Фото декодировано при валидации только во временный каталог, и тот уже пуст
+        gc.collect()
+        self.assertFalse(get_blob_storage().exists(hashlib.sha256(raw).hexdigest()))
+        self.assertEqual(list((TEST_MEDIA_ROOT / 'blobs' / 'tmp').iterdir()), [])
+
+    def test_rollback_removes_promoted_blobs(self):
+        storage = get_blob_storage()
+        fresh = storage.stage_stream([b'\x89PNG\r\n\x1a\nrolled back'])
+        existing = storage.stage_stream([b64decode(image_to_base64('image.jpg'))])
+        with self.assertRaises(RuntimeError), atomic_with_blobs() as promote_blobs:
+            promote_blobs([{'data': fresh}, {'data': existing}])
+            raise RuntimeError
+        # Новый файл удален, а уже хранившийся (фото перевала из setUp) - нет
+        self.assertFalse(storage.exists(fresh.blob.sha256))
+        self.assertTrue(storage.exists(existing.blob.sha256))
+
 #
+    def test_search_updated_on_create_and_patch(self):
+        url = reverse('submitData-search')
+        # Перевал из setUp создан через POST и уже в индексе; ищем другой формой слова и латиницей
+        response = self.client.get(url, {'q': 'апишного'})
+        self.assertEqual([row['title'] for row in response.data['results']], ['Апишный тракт'])
+        self.assertEqual(self.client.get(url, {'q': 'Apishnyy trakt'}).data['count'], 1)
+
+        self.client.patch(reverse('pereval-update', kwargs={'pk': self.pk}), {'title': 'Перевал Пхия'}, format='json')
+        self.assertEqual(self.client.get(url, {'q': 'апишный'}).data['count'], 0)
+        self.assertEqual(self.client.get(url, {'q': 'Phiya'}).data['count'], 1)
+        self.assertEqual(self.client.get(url, {'q': ''}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_detail_cache_invalidated_on_change(self):
+        url = reverse('pereval-detail', kwargs={'pk': self.pk})
+        before = metrics.snapshot()
+        self.client.get(url)
+        self.client.get(url)
+        after = metrics.snapshot()
+        self.assertEqual(after['response_cache_hits_total'] - before.get('response_cache_hits_total', 0), 1)
+
+        # PATCH, загрузка фото и смена статуса модерации меняют версию, старая запись кэша не используется
+        self.client.patch(reverse('pereval-update', kwargs={'pk': self.pk}), {'title': 'Новое'}, format='json')
+        self.assertEqual(self.client.get(url).data['title'], 'Новое')
+
+        upload = SimpleUploadedFile('photo.jpg', b64decode(image_to_base64('image.jpg')), content_type='image/jpeg')
+        self.client.post(reverse('pereval-images', kwargs={'pk': self.pk}), {'image': upload, 'title': 'Еще'})
+        self.assertEqual(len(self.client.get(url).data['images']), 2)
+
+        pereval = PerevalAdded.objects.get(pk=self.pk)
+        pereval.status = 'accepted'
+        pereval.save(update_fields=['status'])
+        self.assertEqual(self.client.get(url).data['status'], 'accepted')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertIn(b'fstr_response_cache_misses_total', response.content)
+
+    def test_detail_cache_not_shared_by_reused_id(self):
+        url = reverse('pereval-detail', kwargs={'pk': self.pk})
+        etag = self.client.get(url)['ETag']
+        old = PerevalAdded.objects.get(pk=self.pk)
+        old.delete()
+        # Новый перевал с тем же id и той же версией не получает чужую запись кэша и ETag
+        PerevalAddedFactory(id=self.pk, title='Другой', user=old.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url).data['title'], 'Другой')
+
+    def test_conditional_get(self):
+        url = reverse('pereval-detail', kwargs={'pk': self.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(reverse('pereval-update', kwargs={'pk': self.pk}), {'title': 'Новое'}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        # Список: ETag из одного агрегирующего запроса, 304 до сериализации
+        list_url = reverse('submitData') + '?user__email=test@api.com'
+        etag = self.client.get(list_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        pereval = PerevalAdded.objects.get(pk=self.pk)
+        pereval.status = 'pending'
+        pereval.save(update_fields=['status'])
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.client.get(list_url + '&page_size=1')['ETag'], etag)
+
+    def assert_stats_consistent(self):
+        # Счетчики, накопленные на ходу, совпадают с пересчитанными по всему архиву
+        incremental = self.client.get(reverse('stats')).json()
+        stats.rebuild()
+        self.assertEqual(incremental, stats.get_stats())
+        return incremental
+
+    def test_stats_follow_changes(self):
+        data = self.assert_stats_consistent()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['status'], {'new': 1})
+        self.assertEqual(data['top_authors'][0]['email'], 'test@api.com')
+
+        area = PerevalArea.objects.create(id_parent=0, title='Кавказ')
+        self.client.patch(reverse('pereval-update', kwargs={'pk': self.pk}),
+                          {'summer_level': '2А', 'area': area.pk}, format='json')
+        PerevalAddedFactory(user=self.user)
+        data = self.assert_stats_consistent()
+        self.assertEqual(data['summer_level']['2А'], 1)
+        self.assertEqual(data['area'], {str(area.pk): 1, '': 1})
+
+        ids = moderation.claim('anna', 5)
+        moderation.decide('anna', ids[:1], 'accepted')
+        self.assertEqual(self.assert_stats_consistent()['status'], {'accepted': 1, 'pending': 1})
+
+        area.delete()
+        PerevalAdded.objects.get(pk=self.pk).delete()
+        data = self.assert_stats_consistent()
+        self.assertEqual((data['total'], data['area']), (1, {'': 1}))
+
+        # Ответ - несколько запросов к таблице счетчиков, без GROUP BY по перевалам
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('stats'))
+        self.assertTrue(all('pereval_added' not in query['sql'] for query in ctx.captured_queries))
+
+    def test_sync_since_cursor(self):
+        url = reverse('sync')
+        response = self.client.get(url, {'since': 0})
+        self.assertEqual([p['id'] for p in response.data['perevals']['upserted']], [self.pk])
+        self.assertEqual(len(response.data['images']['upserted']), 1)
+        cursor = response.data['cursor']
+
+        # Без изменений - пустой ответ с тем же курсором
+        response = self.client.get(url, {'since': cursor})
+        self.assertEqual(response.data['perevals']['upserted'], [])
+        self.assertEqual(response.data['cursor'], cursor)
+
+        pereval = PerevalAdded.objects.get(pk=self.pk)
+        pereval.status = 'accepted'
+        pereval.save()
+        other = PerevalAddedFactory(user=User.objects.get(email='test@api.com'))
+        response = self.client.get(url, {'since': cursor, 'limit': 1})
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(response.data['perevals']['upserted'][0]['status'], 'accepted')
+
+        other_id = other.id
+        other.delete()
+        response = self.client.get(url, {'since': response.data['cursor']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(response.data['perevals']['deleted'], [other_id])
+        self.assertEqual(response.data['perevals']['upserted'], [])
+        self.assertEqual(self.client.get(url, {'since': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_log_in_transaction_order(self):
+        # Запись с меньшим id, но из транзакции с большим номером (зафиксированной позже), идет после курсора
+        cursor = ChangeLog.objects.order_by('-id').values_list('id', flat=True).first()
+        late = ChangeLog.objects.create(entity='pereval', object_id=self.pk, txid=200)
+        early = ChangeLog.objects.create(entity='pereval', object_id=self.pk, txid=100)
+        self.assertEqual(list(ChangeLog.objects.committed(cursor).values_list('id', flat=True)), [early.pk, late.pk])
+        self.assertEqual(list(ChangeLog.objects.committed(early.pk).values_list('id', flat=True)), [late.pk])
+
+    def test_list_summary_and_fields(self):
+        url = reverse('submitData') + '?user__email=test@api.com'
+        response = self.client.get(url + '&view=summary')
+        row = response.data['results'][0]
+        self.assertEqual(row['id'], self.pk)
+        self.assertEqual(row['coords'], self.coords_data)
+        self.assertNotIn('user', row)
+        image = PerevalImage.objects.get()
+        self.assertEqual(row['images'], [{'id': image.id, 'title': 'Test Image',
+                                          'url': reverse('image-rendition', kwargs={'pk': image.id, 'size': 128,
+                                                                                    'fmt': 'webp'})}])
+
+        # Выбираются только нужные колонки
+        add_time = self.client.get(url).data['results'][0]['add_time']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url + '&fields=title,add_time')
+        self.assertEqual(response.data['results'], [{'title': 'Апишный тракт', 'add_time': add_time}])
+        self.assertNotIn('other_titles', ctx.captured_queries[-1]['sql'])
+
+        self.assertEqual(self.client.get(url + '&fields=title,bytes').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_streams_jsonl_and_array(self):
+        url = reverse('submitData-export')
+        listed = self.client.get(reverse('submitData') + '?user__email=test@api.com').data['results'][0]
+
+        response = self.client.get(url, {'user__email': 'test@api.com', 'status': 'new,pending'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'id': self.pk, **listed}])
+
+        # Порции по одной строке склеиваются в корректный JSON-массив
+        PerevalAddedFactory(user=self.user)
+        with override_settings(FSTR_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(url, {'fmt': 'json'})
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['id'], self.pk)
+
+        response = self.client.get(url, {'fmt': 'json', 'date_to': '2000-01-01'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+        for params in ({'status': 'done'}, {'date_from': '2024-13-01'}, {'fmt': 'xml'}, {'area': '999'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_streams_asynchronously_under_asgi(self):
+        # Под ASGI ответ отдает async-итератор, а не sync-генератор, который Django собрал бы в список
+        request = AsyncRequestFactory().get(reverse('submitData-export'), {'fmt': 'json'})
+        response = PerevalExportView.as_view()(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([part async for part in response.streaming_content])
+
+        self.assertEqual([row['id'] for row in json.loads(async_to_sync(read)())], [self.pk])
+
     def test_invalid_image_data(self):
         invalid_data = self.pereval_data.copy()
         invalid_data['images'] = [{"data": "invalid", "title": "Bad Image"}]
@@ -240,3 +718,490 @@ class TestAPI(APITestCase):
         response = self.client.post(url, invalid_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['status'], status.HTTP_400_BAD_REQUEST)
+
+
+class TestGeoSearch(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        # Эльбрус, Казбек, Монблан и точка по ту сторону 180-го меридиана
+        self.points = {}
+        for name, lat, lon in [('elbrus', 43.3499, 42.4453), ('kazbek', 42.6968, 44.5176),
+                               ('montblanc', 45.8326, 6.8652), ('chukotka', 65.0, 179.9),
+                               ('alaska', 65.0, -179.9)]:
+            self.points[name] = PerevalAddedFactory(
+                user=self.user, title=name, coords=CoordsFactory(latitude=lat, longitude=lon))
+
+    def test_geohash_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.points['montblanc'].coords.geohash, geo.encode(45.8326, 6.8652))
+
+    def test_nearby_sorted_by_distance(self):
+        response = self.client.get(reverse('submitData-nearby'), {'lat': 43.35, 'lon': 42.44, 'radius_km': 200})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['title'] for row in response.data['results']], ['elbrus', 'kazbek'])
+        self.assertLess(response.data['results'][0]['distance_km'], 1)
+        self.assertAlmostEqual(response.data['results'][1]['distance_km'], 184, delta=1)
+
+        response = self.client.get(reverse('submitData-nearby'), {'lat': 65.0, 'lon': 179.95, 'radius_km': 50})
+        self.assertEqual({row['title'] for row in response.data['results']}, {'chukotka', 'alaska'})
+
+    def test_nearby_bad_params(self):
+        response = self.client.get(reverse('submitData-nearby'), {'lat': 'abc', 'lon': 42, 'radius_km': 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('submitData-nearby'), {'lat': 43, 'lon': 42, 'radius_km': 100000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bbox(self):
+        response = self.client.get(reverse('submitData-bbox'),
+                                   {'min_lat': 40, 'min_lon': 40, 'max_lat': 46, 'max_lon': 50})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({row['title'] for row in response.data['results']}, {'elbrus', 'kazbek'})
+
+        response = self.client.get(reverse('submitData-bbox'),
+                                   {'min_lat': 60, 'min_lon': 170, 'max_lat': 70, 'max_lon': -170})
+        self.assertEqual({row['title'] for row in response.data['results']}, {'chukotka', 'alaska'})
+
+
+class TestSearch(APITestCase):
+    def test_normalize(self):
+        self.assertEqual(search.normalize('Пхия'), search.normalize('Phiya'))
+        self.assertEqual(search.normalize('Хан-Тенгри'), search.normalize('Khan-Tengri'))
+        self.assertEqual(search.normalize('перевала Ледового'), search.normalize('перевал ледовый'))
+
+    def test_ranking_and_rebuild(self):
+        user = UserFactory()
+        by_title = PerevalAddedFactory(user=user, title='Ледовый', other_titles='', connect='')
+        by_connect = PerevalAddedFactory(user=user, title='Безымянный', other_titles='', connect='к леднику Ледовому')
+        PerevalAddedFactory(user=user, title='Снежный', other_titles='', connect='')
+        self.assertEqual(search.rebuild_index(), 3)
+
+        response = self.client.get(reverse('submitData-search'), {'q': 'ледов'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([row['title'] for row in response.data['results']], [by_title.title, by_connect.title])
+        self.assertGreater(response.data['results'][0]['score'], response.data['results'][1]['score'])
+
+        # Удаленный перевал пропадает из результатов и из count
+        by_connect.delete()
+        response = self.client.get(reverse('submitData-search'), {'q': 'ледов'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([row['title'] for row in response.data['results']], [by_title.title])
+
+
+class TestPerevalAreas(APITestCase):
+    def setUp(self):
+        self.earth = PerevalArea.objects.create(id_parent=0, title='Земля')
+        self.andes = PerevalArea.objects.create(id_parent=self.earth.id, title='Анды')
+        self.machu = PerevalArea.objects.create(id_parent=self.andes.id, title='Мачу Пикчу')
+        self.alps = PerevalArea.objects.create(id_parent=self.earth.id, title='Альпы')
+
+    def test_paths_and_move(self):
+        self.assertEqual(self.machu.path, f'/{self.earth.id}/{self.andes.id}/{self.machu.id}/')
+        self.assertEqual(self.machu.depth, 2)
+
+        # Переносим Анды вместе с подрайонами в Альпы
+        self.andes.id_parent = self.alps.id
+        self.andes.save()
+        self.machu.refresh_from_db()
+        self.assertEqual(self.machu.path, f'{self.alps.path}{self.andes.id}/{self.machu.id}/')
+        self.assertEqual(self.machu.depth, 3)
+        self.assertEqual([area.title for area in self.machu.get_ancestors()], ['Земля', 'Альпы', 'Анды'])
+
+        self.andes.id_parent = self.machu.id
+        with self.assertRaises(ValueError):
+            self.andes.save()
+
+    def test_subtree_and_perevals_single_query(self):
+        PerevalAddedFactory(title='В Андах', area=self.machu)
+        PerevalAddedFactory(title='В Альпах', area=self.alps, user=User.objects.get())
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.andes.get_descendants()), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual([p.title for p in self.andes.get_perevals()], ['В Андах'])
+
+        response = self.client.get(reverse('area-perevals', kwargs={'pk': self.earth.id}))
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['area'], self.machu.id)
+
+    def test_subtree_is_prefix_match(self):
+        # Префиксное условие не зависит от collation БД: "/91/" не захватывает "/910/", а "/91/2/" захватывает
+        PerevalArea.objects.filter(pk=self.andes.pk).update(path='/91/')
+        PerevalArea.objects.filter(pk=self.machu.pk).update(path='/91/2/')
+        PerevalArea.objects.filter(pk=self.alps.pk).update(path='/910/')
+        subtree = PerevalArea.objects.filter(subtree_filter('/91/'))
+        self.assertEqual(set(subtree.values_list('pk', flat=True)), {self.andes.pk, self.machu.pk})
+        self.assertIn('LIKE', str(subtree.query))
+
+    def test_area_detail_and_cache(self):
+        response = self.client.get(reverse('area-detail', kwargs={'pk': self.andes.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([node['title'] for node in response.data['breadcrumbs']], ['Земля', 'Анды'])
+        self.assertEqual(response.data['children'][0]['title'], 'Мачу Пикчу')
+
+        # Пока дерево не менялось, берется из кэша - только проверка версии
+        tree = get_area_tree()
+        with self.assertNumQueries(1):
+            self.assertIs(get_area_tree(), tree)
+
+        PerevalArea.objects.create(id_parent=self.alps.id, title='Монблан')
+        self.assertIsNot(get_area_tree(), tree)
+        response = self.client.get(reverse('areas'))
+        self.assertEqual([child['title'] for child in response.data[0]['children']], ['Анды', 'Альпы'])
+        self.assertEqual(response.data[0]['children'][1]['children'][0]['title'], 'Монблан')
+
+        self.assertEqual(self.client.get(reverse('area-detail', kwargs={'pk': 999})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class TestQueryPlan(APITestCase):
+    """Число запросов при чтении списка не должно зависеть от количества перевалов"""
+
+    def setUp(self):
+        self.user = UserFactory()
+
+    def add_perevals(self, count):
+        for _ in range(count):
+            pereval = PerevalAddedFactory(user=self.user)
+            pereval.pereval_images.add(PerevalImageFactory(), PerevalImageFactory())
+
+    def count_list_queries(self):
+        url = reverse('submitData') + f"?user__email={self.user.email}"
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_list_queries_constant(self):
+        self.add_perevals(1)
+        one = self.count_list_queries()
+        self.add_perevals(4)
+        five = self.count_list_queries()
+        self.assertEqual(one, five)
+
+    def test_detail_queries(self):
+        self.add_perevals(1)
+        pereval = PerevalAdded.objects.get()
+        # версия + перевал вместе с user и coords + фото; повторно - только версия, остальное из кэша
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('pereval-detail', kwargs={'pk': pereval.pk}))
+        self.assertEqual(len(response.data['images']), 2)
+        with self.assertNumQueries(1):
+            cached = self.client.get(reverse('pereval-detail', kwargs={'pk': pereval.pk}))
+        self.assertEqual(cached.data, response.data)
+
+    def test_compiled_rows_match_serializer(self):
+        self.add_perevals(3)
+        area = PerevalArea.objects.create(id_parent=0, title='Кавказ')
+        PerevalAdded.objects.filter(pk=PerevalAdded.objects.first().pk).update(area=area, other_titles=None)
+        User.objects.filter(pk=self.user.pk).update(middle_name=None)
+
+        queryset = PerevalAdded.objects.order_by('add_time', 'id')
+        expected = JSONRenderer().render(PerevalAddedSerializer(queryset, many=True).data)
+        rows = projection.build_rows(projection.project(queryset, projection.FULL_FIELDS), projection.FULL_FIELDS)
+        self.assertEqual(JSONRenderer().render(rows), expected)
+
+
+class TestAsyncViews(TestCase):
+    """Async-представления отвечают так же, как sync-представления DRF"""
+
+    def setUp(self):
+        self.user = UserFactory()
+        for _ in range(3):
+            PerevalAddedFactory(user=self.user).pereval_images.add(PerevalImageFactory(), PerevalImageFactory())
+        self.pk = PerevalAdded.objects.order_by('id').first().pk
+        self.factory = AsyncRequestFactory()
+
+    async def assert_same_response(self, view, path, **kwargs):
+        expected = await sync_to_async(self.client.get)(path)
+        response = await view(self.factory.get(path), **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+        # Тот же ETag в If-None-Match - 304
+        not_modified = await view(self.factory.get(path, headers={'if-none-match': response['ETag']}), **kwargs)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_reads_match_sync_views(self):
+        list_view = async_views.AsyncPerevalListCreateView.as_view()
+        base = reverse('submitData') + f'?user__email={self.user.email}'
+        await self.assert_same_response(list_view, base)
+        await self.assert_same_response(list_view, base + '&view=summary&page_size=2')
+
+        detail_view = async_views.AsyncPerevalDetailView.as_view()
+        path = reverse('pereval-detail', kwargs={'pk': self.pk})
+        await self.assert_same_response(detail_view, path, pk=self.pk)
+        # Второй раз - из кэша ответов
+        await self.assert_same_response(detail_view, path, pk=self.pk)
+
+        missing = await detail_view(self.factory.get('/'), pk=0)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_create_and_update(self):
+        body = {
+            "beautyTitle": "пер.", "title": "Асинхронный", "other_titles": "", "connect": "",
+            "user": {"email": "async@example.com", "fam": "Петров", "name": "Петр", "otc": "", "phone": "+7 555"},
+            "coords": {"latitude": "45.1", "longitude": "7.2", "height": "1500"},
+            "level": {"summer": "1А"},
+            "images": [{"data": f"data:image/jpeg;base64,{image_to_base64('image.jpg')}", "title": "Седловина"}],
+        }
+        view = async_views.AsyncPerevalListCreateView.as_view()
+        response = await view(self.factory.post('/', body, content_type='application/json'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pk = json.loads(response.content)['id']
+        pereval = await PerevalAdded.objects.select_related('user').aget(pk=pk)
+        self.assertEqual((pereval.title, pereval.user.email), ("Асинхронный", "async@example.com"))
+        self.assertEqual(await pereval.pereval_images.acount(), 1)
+
+        invalid = await view(self.factory.post('/', b'{', content_type='application/json'))
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        update = async_views.AsyncPerevalUpdateView.as_view()
+        response = await update(self.factory.patch('/', {'title': 'Новое название'}, content_type='application/json'),
+                                pk=pk)
+        self.assertEqual(json.loads(response.content), {'state': 1, 'message': 'Запись успешно обновлена'})
+        self.assertEqual((await PerevalAdded.objects.aget(pk=pk)).title, 'Новое название')
+
+
+class TestImageQueries(APITestCase):
+    """Число запросов при добавлении и редактировании фото не зависит от их количества"""
+
+    def setUp(self):
+        self.image = {"data": f"data:image/jpeg;base64,{image_to_base64('image2.jpg')}", "title": "Фото"}
+        self.data = {
+            "beautyTitle": "пер.", "title": "Много фото", "other_titles": "", "connect": "",
+            "user": {"email": "photos@example.com", "fam": "Иванов", "name": "Иван", "otc": "", "phone": "1"},
+            "coords": {"latitude": 45.0, "longitude": 7.0, "height": 1000},
+            "level": {"winter": "", "summer": "1A", "autumn": "", "spring": ""},
+        }
+
+    def post_with_images(self, count):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('submitData'), {**self.data, 'images': [self.image] * count},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['id'], len(ctx.captured_queries)
+
+    def patch_with_images(self, pk, count):
+        kept = [{"id": img.id, "title": f"Новое название {img.id}"}
+                for img in PerevalAdded.objects.get(pk=pk).pereval_images.all()]
+        url = reverse('pereval-update', kwargs={'pk': pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {'images': kept + [self.image] * count}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_create_and_update_queries_constant(self):
+        pk_one, create_one = self.post_with_images(1)
+        pk_five, create_five = self.post_with_images(5)
+        self.assertEqual(create_one, create_five)
+
+        self.assertEqual(self.patch_with_images(pk_one, 1), self.patch_with_images(pk_five, 5))
+        self.assertEqual(PerevalAdded.objects.get(pk=pk_five).pereval_images.count(), 10)
+
+
+@jobs.job('tests.echo')
+def echo_job(value, fail_times=0):
+    if Job.objects.filter(kind='tests.echo', attempts__lte=fail_times).exists():
+        raise RuntimeError('Сбой для проверки повтора')
+
+
+class TestJobQueue(TestCase):
+    def test_idempotency_key(self):
+        first = jobs.enqueue('tests.echo', {'value': 1}, idempotency_key='echo-1')
+        second = jobs.enqueue('tests.echo', {'value': 1}, idempotency_key='echo-1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    @override_settings(FSTR_JOB_RETRY_DELAY=0)
+    def test_retry_then_fail(self):
+        jobs.enqueue('tests.echo', {'value': 1, 'fail_times': 1}, max_attempts=3)
+        jobs.run_pending()
+        job_obj = Job.objects.get()
+        self.assertEqual((job_obj.status, job_obj.attempts), ('queued', 1))
+        self.assertIn('RuntimeError', job_obj.last_error)
+
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, 'done')
+
+        jobs.enqueue('tests.unknown', max_attempts=1)
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get(kind='tests.unknown').status, 'failed')
+
+    def test_claim_does_not_double_claim(self):
+        jobs.enqueue('tests.echo', {'value': 1})
+        self.assertEqual(len(jobs.claim('worker-a')), 1)
+        self.assertEqual(jobs.claim('worker-b'), [])
+
+
+class TestUserUpsert(TransactionTestCase):
+    def test_upsert_rewrites_only_changed_rows(self):
+        # Внутри транзакции (как в запросе): INSERT ... ON CONFLICT и выборка перевалов / id пользователя
+        with transaction.atomic(), self.assertNumQueries(2):
+            user = User.objects.upsert(email='a@example.com', first_name='Иван', last_name='Иванов', phone='1')
+        pereval = PerevalAddedFactory(user=user)
+
+        # Те же данные - строка не перезаписывается, версия перевала прежняя
+        with transaction.atomic(), self.assertNumQueries(2):
+            same = User.objects.upsert(email='a@example.com', phone='1')
+        self.assertEqual(user.pk, same.pk)
+        pereval.refresh_from_db()
+        self.assertEqual(pereval.version, 1)
+
+        User.objects.upsert(email='a@example.com', phone='2')
+        self.assertEqual(User.objects.get().phone, '2')
+        self.assertEqual(User.objects.get().first_name, 'Иван')
+        pereval.refresh_from_db()
+        self.assertEqual(pereval.version, 2)
+
+    def test_detail_shows_updated_user(self):
+        data = {
+            "beautyTitle": "пер.", "title": "Первый", "other_titles": "", "connect": "",
+            "user": {"email": "same@example.com", "fam": "Иванов", "name": "Иван", "otc": "", "phone": "1"},
+            "coords": {"latitude": 45.0, "longitude": 7.0, "height": 1000},
+            "level": {"winter": "", "summer": "1A", "autumn": "", "spring": ""},
+            "images": [],
+        }
+        client = APIClient()
+        pk = client.post(reverse('submitData'), data, format='json').data['id']
+        url = reverse('pereval-detail', kwargs={'pk': pk})
+        etag = client.get(url)['ETag']
+
+        # Новый перевал с тем же email и другим телефоном меняет пользователя в ответе первого
+        client.post(reverse('submitData'), {**data, 'title': 'Второй', 'user': {**data['user'], 'phone': '2'}},
+                    format='json')
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(client.get(url).data['user']['phone'], '2')
+
+    def test_parallel_submissions_same_email(self):
+        data = {
+            "beautyTitle": "пер.", "title": "Параллельный", "other_titles": "", "connect": "",
+            "user": {"email": "race@example.com", "fam": "Иванов", "name": "Иван", "otc": "", "phone": "1"},
+            "coords": {"latitude": 45.0, "longitude": 7.0, "height": 1000},
+            "level": {"winter": "", "summer": "1A", "autumn": "", "spring": ""},
+            "images": [],
+        }
+
+        workers = 8
+        start = threading.Barrier(workers)
+
+        def submit(_):
+            try:
+                start.wait()  # все потоки отправляют запрос одновременно
+                return APIClient().post(reverse('submitData'), data, format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            codes = list(pool.map(submit, range(workers)))
+
+        self.assertEqual(codes, [status.HTTP_200_OK] * workers)
+        self.assertEqual(User.objects.filter(email='race@example.com').count(), 1)
+        self.assertEqual(PerevalAdded.objects.filter(user__email='race@example.com').count(), workers)
+
+
+@skipIf(connection.vendor != 'sqlite', 'реплика - копия файла SQLite')
+@override_settings(FSTR_DB_REPLICAS=['replica1'], FSTR_DB_REPLICA_MAX_LAG=3600, FSTR_DB_REPLICA_LAG_CHECK_INTERVAL=0)
+class TestReplicaRouting(TransactionTestCase):
+    """ Реплика - вторая БД SQLite (псевдоним replica1 из sprintProject/test_settings.py), снимок основной. Перевал, созданный
+    после снимка, на реплике не виден, поэтому по ответу понятно, с какой БД шло чтение """
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        self.old = PerevalAddedFactory()
+        replica = connections['replica1']
+        connection.ensure_connection()
+        replica.ensure_connection()
+        connection.connection.backup(replica.connection)
+
+        self.writer = APIClient()
+        data = {
+            "beautyTitle": "пер.", "title": "Новый", "other_titles": "", "connect": "",
+            "user": {"email": "writer@example.com", "fam": "Петров", "name": "Петр", "otc": "", "phone": "+7 555"},
+            "coords": {"latitude": "45.1", "longitude": "7.2", "height": "1500"},
+            "level": {"summer": "1А"}, "images": [],
+        }
+        self.new = self.writer.post(reverse('submitData'), data, format='json').data['id']
+
+    def detail(self, client, pk, **kwargs):
+        return client.get(reverse('pereval-detail', kwargs={'pk': pk}), **kwargs).status_code
+
+    def test_reads_go_to_replica_except_after_write(self):
+        reader = APIClient()
+        with CaptureQueriesContext(connections['replica1']) as replica_queries:
+            self.assertEqual(self.detail(reader, self.old.pk), status.HTTP_200_OK)
+        self.assertTrue(replica_queries.captured_queries)
+        self.assertEqual(self.detail(reader, self.new), status.HTTP_404_NOT_FOUND)
+
+        url = reverse('submitData') + '?user__email=writer@example.com'
+        self.assertEqual(reader.get(url).data['results'], [])
+        view = async_views.AsyncPerevalDetailView.as_view()
+        self.assertEqual(async_to_sync(view)(AsyncRequestFactory().get('/'), pk=self.new).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        # Клиент, который только что записал, и клиент с заголовком X-Read-Your-Writes читают с основной БД
+        self.assertIn(settings.FSTR_DB_PRIMARY_COOKIE, self.writer.cookies)
+        self.assertEqual(self.detail(self.writer, self.new), status.HTTP_200_OK)
+        self.assertEqual(len(self.writer.get(url).data['results']), 1)
+        self.assertEqual(self.detail(reader, self.new, headers={'X-Read-Your-Writes': '1'}), status.HTTP_200_OK)
+
+        # Реплика отстает больше допустимого - чтение с основной БД
+        with override_settings(FSTR_DB_REPLICA_MAX_LAG=0):
+            self.assertEqual(self.detail(reader, self.new), status.HTTP_200_OK)
+
+        counters = metrics.snapshot()
+        for reason, target in [('replica', 'replica1'), ('read_your_writes', 'default'), ('replica_lag', 'default')]:
+            self.assertGreater(counters.get(f'db_read_routing_total{{reason="{reason}",target="{target}"}}', 0), 0)
+        self.assertGreater(counters['db_replica_lag_seconds{alias="replica1"}'], 0)
+        self.assertIn('fstr_db_replica_up{alias="replica1"} 1', self.client.get(reverse('metrics')).content.decode())
+
+
+class TestModeration(TransactionTestCase):
+    def setUp(self):
+        user = UserFactory()
+        self.ids = [PerevalAddedFactory(user=user).pk for _ in range(6)]
+
+    def claim(self, moderator, limit):
+        response = self.client.get(reverse('moderation-queue'), {'moderator': moderator, 'limit': limit})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_claim_and_decide(self):
+        anna = self.claim('anna', 2)
+        self.assertEqual(anna, self.ids[:2])
+        self.assertEqual(self.claim('boris', 2), self.ids[2:4])
+        # Повторный запрос возвращает уже взятые перевалы, а не новые
+        self.assertEqual(self.claim('anna', 2), anna)
+        self.assertEqual(set(PerevalAdded.objects.filter(id__in=self.ids[:4]).values_list('status', flat=True)),
+                         {'pending'})
+
+        version = PerevalAdded.objects.get(pk=anna[0]).version
+        response = self.client.post(reverse('moderation-accept'), {'moderator': 'anna', 'ids': [anna[0], self.ids[2]]},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['updated'], [anna[0]])
+        self.assertEqual(response.json()['skipped'], [self.ids[2]])
+        accepted = PerevalAdded.objects.get(pk=anna[0])
+        self.assertEqual((accepted.status, accepted.version), ('accepted', version + 1))
+
+        # Не решенный вовремя перевал возвращается в очередь
+        PerevalAdded.objects.filter(pk=anna[1]).update(claimed_at=accepted.add_time.replace(year=2000))
+        self.assertEqual(self.claim('boris', 3), [*self.ids[2:4], anna[1]])
+
+        self.assertEqual(self.client.get(reverse('moderation-queue')).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('moderation-reject'), {'ids': 'all'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_parallel_claims_do_not_overlap(self):
+        workers = 6
+        start = threading.Barrier(workers)
+
+        def claim(number):
+            try:
+                start.wait()
+                return moderation.claim(f'moderator-{number}', 1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            claimed = [pk for ids in pool.map(claim, range(workers)) for pk in ids]
+        self.assertEqual(sorted(claimed), self.ids)
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .storage import CHUNK_SIZE, get_blob_storage
+
+
+''' Прием файлов multipart/form-data для POST /submitData/<id>/images/. Стандартные обработчики Django
+сначала принимают файл целиком (в память или во временный файл), и только потом представление
+видит его и может проверить размер. StagedBlobUploadHandler пишет порции во временный каталог
+хранилища по мере поступления, с подсчетом SHA-256, и прерывает прием (BlobTooLarge), как только
+файл превысит FSTR_IMAGE_MAX_SIZE. В хранилище файл переносится при сохранении (atomic_with_blobs) '''
+
+
+class StagedUploadedFile(UploadedFile):
+    """Файл из multipart, уже записанный во временный каталог хранилища. staged - StagedBlob"""
+
+    def __init__(self, staged, **kwargs):
+        super().__init__(None, size=staged.blob.size, **kwargs)
+        self.staged = staged
+
+    def close(self):
+        # Открытого файла нет; временный файл удаляет StagedBlob, если его не перенесли в хранилище
+        pass
+
+
+class StagedBlobUploadHandler(FileUploadHandler):
+    chunk_size = CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.staging = get_blob_storage().open_staging(max_size=settings.FSTR_IMAGE_MAX_SIZE)
+
+    def receive_data_chunk(self, raw_data, start):
+        # BlobTooLarge прерывает разбор тела и доходит до представления при обращении к request.FILES
+        self.staging.write(raw_data)
+
+    def file_complete(self, file_size):
+        return StagedUploadedFile(
+            self.staging.finish(), name=self.file_name, content_type=self.content_type,
+            charset=self.charset, content_type_extra=self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        self.staging.abort()
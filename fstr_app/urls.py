@@ -1,12 +1,53 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     PerevalListCreateView,
     PerevalDetailView,
     PerevalUpdateView,
+    PerevalImageUploadView,
+    PerevalImageRenditionView,
+    PerevalBulkCreateView,
+    PerevalExportView,
+    PerevalNearbyView,
+    PerevalBBoxView,
+    PerevalSearchView,
+    AreaTreeView,
+    AreaDetailView,
+    AreaPerevalListView,
+    MetricsView,
+    SyncView,
+    StatsView,
+    ModerationQueueView,
+    ModerationDecisionView,
 )
 
+if settings.FSTR_ASYNC_VIEWS:
+    # Под ASGI основные эндпоинты перевалов обслуживаются async-представлениями
+    from .async_views import (
+        AsyncPerevalListCreateView as PerevalListCreateView,
+        AsyncPerevalDetailView as PerevalDetailView,
+        AsyncPerevalUpdateView as PerevalUpdateView,
+    )
+
 urlpatterns = [
     path('submitData/', PerevalListCreateView.as_view(), name='submitData'),
+    path('submitData/bulk/', PerevalBulkCreateView.as_view(), name='submitData-bulk'),
+    path('submitData/export/', PerevalExportView.as_view(), name='submitData-export'),
+    path('submitData/nearby/', PerevalNearbyView.as_view(), name='submitData-nearby'),
+    path('submitData/bbox/', PerevalBBoxView.as_view(), name='submitData-bbox'),
+    path('submitData/search/', PerevalSearchView.as_view(), name='submitData-search'),
     path('submitData/<int:pk>/', PerevalDetailView.as_view(), name='pereval-detail'),
     path('submitData/<int:pk>', PerevalUpdateView.as_view(), name='pereval-update'),
+    path('submitData/<int:pk>/images/', PerevalImageUploadView.as_view(), name='pereval-images'),
+    path('images/<int:pk>/rendition/<int:size>.<str:fmt>', PerevalImageRenditionView.as_view(),
+         name='image-rendition'),
+    path('areas/', AreaTreeView.as_view(), name='areas'),
+    path('areas/<int:pk>/', AreaDetailView.as_view(), name='area-detail'),
+    path('areas/<int:pk>/perevals/', AreaPerevalListView.as_view(), name='area-perevals'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('moderation/queue/', ModerationQueueView.as_view(), name='moderation-queue'),
+    path('moderation/accept/', ModerationDecisionView.as_view(decision='accepted'), name='moderation-accept'),
+    path('moderation/reject/', ModerationDecisionView.as_view(decision='rejected'), name='moderation-reject'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
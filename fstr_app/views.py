@@ -1,9 +1,32 @@
 from rest_framework import generics, status, serializers
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
-from .models import PerevalAdded, User
-from .serializers import PerevalAddedSerializer
-from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+from .models import PerevalAdded, PerevalImage, PerevalAddedImage, User
+from .serializers import PerevalAddedSerializer, atomic_with_blobs, prepare_submit_data, create_image
+from .query_plan import QueryPlanMixin
+from .pagination import PerevalCursorPagination, PerevalLimitOffsetPagination
+from . import geo
+from .area_tree import get_area_tree
+from .search import SearchResults
+from . import metrics, response_cache
+from .sync import changes_since
+from .db_router import ReplicaReadMixin
+from .projection import SparseFieldsMixin
+from .conditional import ConditionalListMixin, detail_etag, not_modified, set_validators
+from .models import subtree_filter
+from .storage import get_blob_storage, BlobTooLarge, CHUNK_SIZE
+from .uploads import StagedBlobUploadHandler
+from .ingest import import_passes
+from .export import EXPORT_FORMATS, astream_export, export_queryset, stream_export
+from . import moderation, stats
+from .renditions import RENDITION_FORMATS, RenditionError, render, schedule_renditions
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter, OpenApiTypes
 
 import base64
 import os
@@ -35,7 +58,11 @@ def image_to_base64(filename: str):
             description='Email пользователя',
             required=True,
             type=str
-        )
+        ),
+        OpenApiParameter(name='view', description='summary - компактные строки (без user, connect, add_time)',
+                         required=False, type=str, enum=['summary']),
+        OpenApiParameter(name='fields', description='Только перечисленные поля, через запятую (например, id,title,status)',
+                         required=False, type=str),
     ]
 )
 @extend_schema(
@@ -78,10 +105,11 @@ def image_to_base64(filename: str):
         )
     ]
 )
-class PerevalListCreateView(generics.ListCreateAPIView):
+class PerevalListCreateView(ReplicaReadMixin, ConditionalListMixin, SparseFieldsMixin, QueryPlanMixin,
+                            generics.ListCreateAPIView):
     queryset = PerevalAdded.objects.all()
     serializer_class = PerevalAddedSerializer
-    pagination_class = None  # убираем пока пагинацию
+    pagination_class = PerevalCursorPagination
 
     def get(self, request, *args, **kwargs):
         """Обработка GET запроса для фильтрации по email"""
@@ -97,25 +125,7 @@ class PerevalListCreateView(generics.ListCreateAPIView):
     def post(self, request, *args, **kwargs):
         try:
             # Преобразуем входные данные в формат, ожидаемый сериализатором
-            data = request.data.copy()
-            data['beautyTitle'] = data.pop('beautyTitle', '')
-
-            # Обрабатываем уровень сложности
-            level_data = data.pop('level', {})
-            data['winter_level'] = level_data.get('winter', '')
-            data['summer_level'] = level_data.get('summer', '')
-            data['autumn_level'] = level_data.get('autumn', '')
-            data['spring_level'] = level_data.get('spring', '')
-
-            # Обрабатываем пользователя
-            user_data = data.pop('user', {})
-            data['user'] = {
-                'email': user_data.get('email', ''),
-                'first_name': user_data.get('name', ''),
-                'last_name': user_data.get('fam', ''),
-                'middle_name': user_data.get('otc', ''),
-                'phone': user_data.get('phone', '')
-            }
+            data = prepare_submit_data(request.data)
 
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
@@ -146,15 +156,337 @@ class PerevalListCreateView(generics.ListCreateAPIView):
             )
 
 
+@extend_schema(
+    summary='Массовая загрузка перевалов',
+    description="""Тело запроса - JSON Lines (`Content-Type: application/x-ndjson`): каждая строка - перевал
+                в том же формате, что и для `POST /submitData/`. Записи сохраняются пачками
+                (параметр `batch_size`, по умолчанию 500), ошибочные строки пропускаются и перечисляются в отчете.""",
+    request={'application/x-ndjson': OpenApiTypes.STR},
+    responses={200: OpenApiTypes.OBJECT},
+    parameters=[
+        OpenApiParameter(name='batch_size', description='Размер пачки записей', required=False, type=int)
+    ],
+)
+class PerevalBulkCreateView(generics.GenericAPIView):
+    parser_classes = []  # тело читается построчно, без разбора целиком в память
+
+    def post(self, request, *args, **kwargs):
+        try:
+            batch_size = int(request.query_params.get('batch_size', 500))
+        except ValueError:
+            batch_size = 0
+        if batch_size < 1:
+            return Response(
+                data={'status': status.HTTP_400_BAD_REQUEST,
+                      'message': 'Параметр batch_size должен быть положительным числом'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        lines = request.stream if request.stream is not None else []
+        report = import_passes(lines, batch_size=batch_size)
+        return Response(
+            data={'status': status.HTTP_200_OK,
+                  'message': f'Загружено перевалов: {report.created}, строк с ошибками: {len(report.errors)}',
+                  **report.as_dict()},
+            status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    summary='Выгрузка перевалов потоком',
+    description="""Все перевалы, подходящие под фильтры, одним потоковым ответом: JSON Lines (`fmt=jsonl`,
+                по умолчанию - перевал на строку) или JSON-массив (`fmt=json`). Записи в том же виде, что и
+                в списках, плюс `id`, в порядке id. Память сервера не зависит от объема выгрузки.""",
+    parameters=[
+        OpenApiParameter(name='fmt', description='Формат выгрузки', required=False, type=str, enum=list(EXPORT_FORMATS)),
+        OpenApiParameter(name='user__email', description='Email автора', required=False, type=str),
+        OpenApiParameter(name='status', description='Статусы через запятую (new,pending,accepted,rejected)',
+                         required=False, type=str),
+        OpenApiParameter(name='area', description='id района (вместе с подрайонами)', required=False, type=int),
+        OpenApiParameter(name='date_from', description='Добавлены не раньше даты (ГГГГ-ММ-ДД)', required=False,
+                         type=OpenApiTypes.DATE),
+        OpenApiParameter(name='date_to', description='Добавлены не позже даты (ГГГГ-ММ-ДД)', required=False,
+                         type=OpenApiTypes.DATE),
+    ],
+    responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'application/json'): OpenApiTypes.OBJECT,
+               400: OpenApiTypes.OBJECT},
+)
+class PerevalExportView(generics.GenericAPIView):
+    def get(self, request, *args, **kwargs):
+        fmt = request.query_params.get('fmt', 'jsonl')
+        try:
+            if fmt not in EXPORT_FORMATS:
+                raise serializers.ValidationError(f"Параметр fmt может быть: {', '.join(EXPORT_FORMATS)}")
+            queryset = export_queryset(request.query_params)
+        except serializers.ValidationError as e:
+            return Response({"error": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Под ASGI - async-итератор, иначе Django собрал бы всю выгрузку в память перед отправкой
+        stream = astream_export if isinstance(request._request, ASGIRequest) else stream_export
+        response = StreamingHttpResponse(stream(queryset, fmt), content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="perevals.{fmt}"'
+        return response
+
+
+def float_param(request, name, min_value, max_value):
+    """Числовой параметр запроса в заданных пределах, иначе ValidationError"""
+    try:
+        value = float(request.query_params[name])
+    except KeyError:
+        raise serializers.ValidationError(f"Параметр {name} обязателен")
+    except ValueError:
+        raise serializers.ValidationError(f"Параметр {name} должен быть числом")
+    if not min_value <= value <= max_value:
+        raise serializers.ValidationError(f"Параметр {name} должен быть в пределах от {min_value} до {max_value}")
+    return value
+
+
+@extend_schema(
+    summary='Перевалы рядом с точкой',
+    description='Перевалы в радиусе `radius_km` от точки (`lat`, `lon`), отсортированные по расстоянию. '
+                'В каждой записи есть поле `distance_km`. Постраничный вывод - параметры `limit` и `offset`.',
+    parameters=[
+        OpenApiParameter(name='lat', description='Широта', required=True, type=float),
+        OpenApiParameter(name='lon', description='Долгота', required=True, type=float),
+        OpenApiParameter(name='radius_km', description='Радиус поиска, км', required=True, type=float),
+    ],
+)
+class PerevalNearbyView(QueryPlanMixin, generics.ListAPIView):
+    queryset = PerevalAdded.objects.all()
+    serializer_class = PerevalAddedSerializer
+    pagination_class = PerevalLimitOffsetPagination
+
+    def list(self, request, *args, **kwargs):
+        try:
+            lat = float_param(request, 'lat', -90, 90)
+            lon = float_param(request, 'lon', -180, 180)
+            radius_km = float_param(request, 'radius_km', 0, settings.FSTR_NEARBY_MAX_RADIUS_KM)
+        except serializers.ValidationError as e:
+            return Response({"error": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Сначала только id и расстояния, полные записи - лишь для текущей страницы
+        found = geo.nearby(self.get_queryset(), lat, lon, radius_km)
+        page = self.paginate_queryset(found)
+        perevals = self.filter_queryset(self.get_queryset()).in_bulk([pk for pk, _ in page])
+
+        data = []
+        for pk, distance in page:
+            row = self.get_serializer(perevals[pk]).data
+            row['distance_km'] = round(distance, 3)
+            data.append(row)
+        return self.get_paginated_response(data)
+
+
+@extend_schema(
+    summary='Перевалы в прямоугольной области',
+    description='Перевалы, координаты которых попадают в прямоугольник. Если `min_lon` больше `max_lon`, '
+                'область считается пересекающей 180-й меридиан.',
+    parameters=[
+        OpenApiParameter(name='min_lat', required=True, type=float),
+        OpenApiParameter(name='min_lon', required=True, type=float),
+        OpenApiParameter(name='max_lat', required=True, type=float),
+        OpenApiParameter(name='max_lon', required=True, type=float),
+    ],
+)
+class PerevalBBoxView(ConditionalListMixin, SparseFieldsMixin, QueryPlanMixin, generics.ListAPIView):
+    queryset = PerevalAdded.objects.all()
+    serializer_class = PerevalAddedSerializer
+    pagination_class = PerevalCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        try:
+            min_lat = float_param(request, 'min_lat', -90, 90)
+            max_lat = float_param(request, 'max_lat', min_lat, 90)
+            min_lon = float_param(request, 'min_lon', -180, 180)
+            max_lon = float_param(request, 'max_lon', -180, 180)
+        except serializers.ValidationError as e:
+            return Response({"error": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.queryset = self.queryset.filter(geo.bbox_filter(min_lat, min_lon, max_lat, max_lon))
+        return super().list(request, *args, **kwargs)
+
+
+@extend_schema(
+    summary='Поиск перевалов по названию',
+    description='Полнотекстовый поиск по названию, другим названиям и полю `connect`. Русские и латинские '
+                'написания равнозначны ("Пхия" / "Phiya"), окончания слов не учитываются, последнее слово может '
+                'быть началом слова. Результаты упорядочены по релевантности (поле `score`), '
+                'постранично - параметры `limit` и `offset`.',
+    parameters=[OpenApiParameter(name='q', description='Поисковый запрос', required=True, type=str)],
+)
+class PerevalSearchView(QueryPlanMixin, generics.ListAPIView):
+    queryset = PerevalAdded.objects.all()
+    serializer_class = PerevalAddedSerializer
+    pagination_class = PerevalLimitOffsetPagination
+
+    def list(self, request, *args, **kwargs):
+        results = SearchResults(request.query_params.get('q', ''))
+        if not results.terms:
+            return Response({"error": "Параметр q обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(results)
+        perevals = self.filter_queryset(self.get_queryset()).in_bulk([pk for pk, _ in page])
+
+        data = []
+        for pk, score in page:
+            if pk not in perevals:
+                continue  # перевал удален, а индекс еще не перестроен
+            row = self.get_serializer(perevals[pk]).data
+            row['score'] = score
+            data.append(row)
+        return self.get_paginated_response(data)
+
+
 @extend_schema(description='Получение данных перевала по ID (включая статус модерации).')
-class PerevalDetailView(generics.RetrieveAPIView):
+class PerevalDetailView(ReplicaReadMixin, QueryPlanMixin, generics.RetrieveAPIView):
     queryset = PerevalAdded.objects.all()
     serializer_class = PerevalAddedSerializer
 
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        # Версия записи - один легкий запрос; по ней отвечаем 304, а сам перевал с фото
+        # сериализуется только при промахе кэша
+        state = PerevalAdded.objects.filter(pk=self.kwargs['pk']).values_list('row_token', 'version', 'updated_at').first()
+        if state is None:
+            raise Http404
+        row_token, version, updated_at = state
+        etag = detail_etag(request, self.kwargs['pk'], row_token, version)
+        response = not_modified(request, etag, updated_at)
+        if response is not None:
+            return response
+
+        data = response_cache.get_or_build(
+            response_cache.detail_key(self.kwargs['pk'], row_token, version),
+            lambda: self.get_serializer(self.get_object()).data,
+        )
+        return set_validators(Response(data), etag, updated_at)
+
+
+@extend_schema(
+    summary='Загрузить фото к перевалу',
+    description="""Альтернатива передаче фото строкой base64 внутри JSON. Принимает либо `multipart/form-data`
+                (файл в поле `image`, название в поле `title`), либо сами байты фото в теле запроса
+                (`Content-Type: image/jpeg` и т.п., название в параметре `?title=`).
+                Файл пишется порциями по мере приема, целиком в памяти не держится; слишком большой
+                файл отклоняется (413), не дожидаясь конца загрузки.""",
+    request={
+        'multipart/form-data': {
+            'type': 'object',
+            'properties': {'image': {'type': 'string', 'format': 'binary'}, 'title': {'type': 'string'}},
+        },
+        'image/*': OpenApiTypes.BINARY,
+    },
+    responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT, 413: OpenApiTypes.OBJECT},
+    parameters=[
+        OpenApiParameter(name='title', description='Название фото (для загрузки байтами)', required=False, type=str)
+    ],
+)
+class PerevalImageUploadView(generics.GenericAPIView):
+    queryset = PerevalAdded.objects.all()
+    parser_classes = [MultiPartParser]  # для "сырых" байтов парсер не нужен, тело читается потоком
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Обработчик нужно задать до разбора тела: файл multipart сразу пишется во временный каталог хранилища
+        request.upload_handlers = [StagedBlobUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        pereval = self.get_object()
+
+        try:
+            # Быстрая проверка до приема тела; окончательная - на заблокированной строке при сохранении
+            if pereval.status != 'new':
+                raise serializers.ValidationError("Редактирование запрещено. Поменялся статус записи")
+
+            max_size = settings.FSTR_IMAGE_MAX_SIZE
+            if request.content_type.startswith('multipart/form-data'):
+                upload = request.FILES.get('image')
+                if upload is None:
+                    raise serializers.ValidationError("Не передан файл в поле 'image'")
+                title = request.POST.get('title') or upload.name
+                staged = upload.staged
+            else:
+                # Проверяем заявленный размер до чтения тела
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+                if not content_length:
+                    raise serializers.ValidationError("Пустое тело запроса")
+                if content_length > max_size:
+                    raise BlobTooLarge(f'Размер файла превышает {max_size} байт')
+                title = request.query_params.get('title', 'Без названия')
+                staged = get_blob_storage().stage_stream(
+                    iter(lambda: request.stream.read(CHUNK_SIZE), b''), max_size=max_size
+                )
+
+            if len(title) > PerevalImage._meta.get_field('title').max_length:
+                raise serializers.ValidationError("Слишком длинное название фото")
+
+            with atomic_with_blobs() as promote_blobs:
+                # Модератор мог взять перевал в работу, пока фото загружалось
+                if PerevalAdded.objects.select_for_update().get(pk=pereval.pk).status != 'new':
+                    raise serializers.ValidationError("Редактирование запрещено. Поменялся статус записи")
+                [image_data] = promote_blobs([{'data': staged}])
+                image = create_image(image_data['data'], title)
+                PerevalAddedImage.objects.create(pereval=pereval, image=image)
+                PerevalAdded.objects.bump_version([pereval.pk])
+                schedule_renditions([image.sha256])
+
+            return Response(
+                data={'status': status.HTTP_200_OK,
+                      'message': 'Фото загружено',
+                      'id': image.id},
+                status=status.HTTP_200_OK)
+        except BlobTooLarge as e:
+            return Response(
+                data={'status': status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                      'message': str(e),
+                      'id': None},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except serializers.ValidationError as e:
+            return Response(
+                data={'status': status.HTTP_400_BAD_REQUEST,
+                      'message': str(e.detail),
+                      'id': None},
+                status=status.HTTP_400_BAD_REQUEST)
+
+
+class BinaryContentNegotiation(BaseContentNegotiation):
+    """ Представление отдает файл, а не данные для рендерера DRF, поэтому заголовок Accept
+    (например, Accept: image/webp) не должен приводить к ответу 406 """
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+@extend_schema(
+    summary='Получить превью фото',
+    description="""Превью фото заданного размера по длинной стороне (`size` из настройки FSTR_RENDITION_SIZES,
+                по умолчанию 128, 512 или 1024) в формате `webp` или `jpeg`. Ответ содержит строгий ETag,
+                при совпадении с заголовком `If-None-Match` возвращается 304 без тела.""",
+    responses={(200, 'image/*'): OpenApiTypes.BINARY, 304: None, 404: None},
+)
+class PerevalImageRenditionView(generics.GenericAPIView):
+    queryset = PerevalImage.objects.only('id', 'sha256')
+    content_negotiation_class = BinaryContentNegotiation
+
+    def get(self, request, pk, size, fmt):
+        if size not in settings.FSTR_RENDITION_SIZES or fmt not in RENDITION_FORMATS:
+            raise Http404('Такого размера или формата превью нет')
+        image = self.get_object()
+
+        # Оригинал по id не меняется, поэтому ETag однозначно задается хэшем, размером и форматом
+        etag = f'"{image.sha256}-{size}.{fmt}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                path = render(image.sha256, size, fmt)
+            except RenditionError:
+                raise Http404('Невозможно построить превью для этого файла')
+            response = FileResponse(open(path, 'rb'), content_type=RENDITION_FORMATS[fmt][1])
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
 
 
 @extend_schema(
@@ -270,8 +602,10 @@ class PerevalUpdateView(generics.UpdateAPIView):
         )
     ]
 )
-class PerevalUserListView(generics.ListAPIView):
+class PerevalUserListView(ReplicaReadMixin, ConditionalListMixin, SparseFieldsMixin, QueryPlanMixin,
+                          generics.ListAPIView):
     serializer_class = PerevalAddedSerializer
+    pagination_class = PerevalCursorPagination
 
     def get_queryset(self):
         try:
@@ -280,4 +614,160 @@ class PerevalUserListView(generics.ListAPIView):
                 raise serializers.ValidationError("Параметр user__email обязателен")
             return PerevalAdded.objects.filter(user__email=email)
         except serializers.ValidationError as e:
-            raise serializers.ValidationError(f"{str(e)}")
\ No newline at end of file
+            raise serializers.ValidationError(f"{str(e)}")
+
+
+class AreaTreeView(generics.GenericAPIView):
+    @extend_schema(
+        summary='Дерево районов',
+        description='Все районы (горные системы, хребты и т.п.) с вложенными подрайонами.',
+        operation_id='areas_tree',
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(get_area_tree().as_list())
+
+
+@extend_schema(
+    summary='Район с подрайонами',
+    description='Район со всем поддеревом (`children`) и путем от корня (`breadcrumbs`).',
+    responses={200: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT},
+)
+class AreaDetailView(generics.GenericAPIView):
+    def get(self, request, pk, *args, **kwargs):
+        tree = get_area_tree()
+        if pk not in tree:
+            raise Http404
+        data = tree.subtree(pk).as_dict()
+        data['breadcrumbs'] = [node.as_dict(with_children=False) for node in tree.breadcrumbs(pk)]
+        return Response(data)
+
+
+@extend_schema(
+    summary='Перевалы района',
+    description='Перевалы района и всех его подрайонов (курсорная пагинация).',
+)
+class AreaPerevalListView(ConditionalListMixin, SparseFieldsMixin, QueryPlanMixin, generics.ListAPIView):
+    serializer_class = PerevalAddedSerializer
+    pagination_class = PerevalCursorPagination
+
+    def get_queryset(self):
+        tree = get_area_tree()
+        if self.kwargs['pk'] not in tree:
+            raise Http404
+        return PerevalAdded.objects.filter(subtree_filter(tree.subtree(self.kwargs['pk']).path, field='area__path'))
+
+
+@extend_schema(exclude=True)
+class MetricsView(generics.GenericAPIView):
+    """Счетчики приложения в текстовом формате Prometheus"""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SyncView(generics.GenericAPIView):
+    @extend_schema(
+        summary='Изменения после курсора (синхронизация)',
+        description='Перевалы и фото, созданные, измененные (`upserted`) или удаленные (`deleted`) после курсора '
+                    '`since`. В ответе новый курсор `cursor` для следующего запроса; `has_more=true` означает, '
+                    'что изменений больше, чем поместилось в ответ, и нужно сразу запросить следующую порцию. '
+                    'Первая синхронизация - с `since=0`.',
+        parameters=[
+            OpenApiParameter(name='since', description='Курсор из предыдущего ответа', required=False, type=int),
+            OpenApiParameter(name='limit', description='Максимум записей журнала в ответе', required=False, type=int),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', 0)) or None
+            if since < 0 or (limit is not None and limit < 0):
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Параметры since и limit должны быть неотрицательными целыми числами"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(since, limit))
+
+
+
+class StatsView(generics.GenericAPIView):
+    @extend_schema(
+        summary='Статистика архива',
+        description='Число перевалов всего (`total`), по статусу, уровням сложности (пустой уровень - ключ `""`), '
+                    'районам (id района, без района - `""`) и самые активные авторы (`top_authors`). Счетчики '
+                    'поддерживаются при каждом изменении данных, время ответа не зависит от размера архива.',
+        parameters=[
+            OpenApiParameter(name='top', description='Сколько авторов вернуть (по умолчанию 20, максимум 100)',
+                             required=False, type=int),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            top = int(request.query_params.get('top', stats.TOP_AUTHORS))
+            if not 0 <= top <= 100:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Параметр top должен быть целым числом от 0 до 100"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats.get_stats(top))
+
+
+class ModerationQueueView(generics.GenericAPIView):
+    @extend_schema(
+        summary='Очередь модерации: взять перевалы в работу',
+        description='Закрепляет за модератором до `limit` новых перевалов (статус меняется на `pending`) и '
+                    'возвращает их вместе с уже взятыми им ранее, в порядке поступления. Параллельные '
+                    'модераторы получают разные перевалы. Не решенный за `FSTR_MODERATION_CLAIM_TIMEOUT` '
+                    'секунд перевал возвращается в очередь.',
+        parameters=[
+            OpenApiParameter(name='moderator', description='Имя (логин) модератора', required=True, type=str),
+            OpenApiParameter(name='limit', description='Сколько перевалов взять', required=False, type=int),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, *args, **kwargs):
+        moderator = request.query_params.get('moderator', '').strip()
+        if not moderator:
+            return Response({"error": "Параметр moderator обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+            if limit is not None and limit < 0:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Параметр limit должен быть положительным целым числом"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ids = moderation.claim(moderator[:100], limit)
+        return Response({'moderator': moderator, 'results': moderation.queue_rows(ids)})
+
+
+@extend_schema(
+    summary='Принять или отклонить перевалы',
+    description='Меняет статус перевалов, взятых модератором из очереди, одним запросом к БД. '
+                'В ответе `updated` - измененные перевалы, `skipped` - не взятые этим модератором.',
+    request={'application/json': {'type': 'object', 'properties': {
+        'moderator': {'type': 'string'}, 'ids': {'type': 'array', 'items': {'type': 'integer'}}}}},
+    responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+)
+class ModerationDecisionView(generics.GenericAPIView):
+    decision = None  # accepted / rejected, задается в urls.py
+
+    def post(self, request, *args, **kwargs):
+        moderator = str(request.data.get('moderator') or '').strip()
+        ids = request.data.get('ids')
+        if not moderator or not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response(
+                data={'status': status.HTTP_400_BAD_REQUEST,
+                      'message': 'Нужны поля moderator (строка) и ids (список id перевалов)'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        decided = moderation.decide(moderator[:100], ids, self.decision)
+        return Response(
+            data={'status': status.HTTP_200_OK,
+                  'message': f'Изменено перевалов: {len(decided)}',
+                  'updated': decided,
+                  'skipped': sorted(set(ids) - set(decided))},
+            status=status.HTTP_200_OK)
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sprintProject.settings')
+    # Автотесты идут с sprintProject.test_settings: там объявлена вторая БД для теста реплик
+    test_run = sys.argv[1:2] == ['test']
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sprintProject.test_settings' if test_run else 'sprintProject.settings')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,3 +1,4 @@
+import copy
 import os
 from dotenv import load_dotenv, find_dotenv
 
@@ -37,6 +38,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fstr_app.db_router.read_your_writes_middleware',
 ]
 
 ROOT_URLCONF = 'sprintProject.urls'
@@ -64,22 +66,130 @@ STATIC_URL = '/static/'
 
 WSGI_APPLICATION = 'sprintProject.wsgi.application'
 
-# Настройки для SQLite
-DATABASES = {
-    # Настройки при использовании SQLite
-    'default':
-        {'ENGINE': 'django.db.backends.sqlite3',
-         'NAME': BASE_DIR / 'sqlite3.db'}
-
-    # Настройки при использовании PostqreSQL
-    # 'default': {
-    #     'ENGINE': 'django.db.backends.postgresql',
-    #     'HOST': os.getenv('FSTR_DB_HOST'),
-    #     'PORT': os.getenv('FSTR_DB_PORT'),
-    #     'NAME': os.getenv('FSTR_DB_NAME'),
-    #     'USER': os.getenv('FSTR_DB_LOGIN'),
-    #     'PASSWORD': os.getenv('FSTR_DB_PASS'),
-    # }
+# Профиль БД задается переменной FSTR_DB_ENGINE: sqlite (по умолчанию, установка на одном узле)
+# или postgresql (несколько воркеров пишут одновременно)
+FSTR_DB_ENGINE = os.getenv('FSTR_DB_ENGINE', 'sqlite')
+
+if FSTR_DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'HOST': os.getenv('FSTR_DB_HOST', 'localhost'),
+            'PORT': os.getenv('FSTR_DB_PORT', '5432'),
+            'NAME': os.getenv('FSTR_DB_NAME', 'fstr'),
+            'USER': os.getenv('FSTR_DB_LOGIN', 'fstr'),
+            'PASSWORD': os.getenv('FSTR_DB_PASS', ''),
+            # Соединение проверяется перед повторным использованием, разорванное открывается заново
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    FSTR_DB_POOL_SIZE = int(os.getenv('FSTR_DB_POOL_SIZE', 10))
+    if FSTR_DB_POOL_SIZE:
+        # Пул соединений psycopg 3 в каждом процессе: запрос берет соединение из пула и возвращает его.
+        # Подходит и для ASGI, где постоянные соединения Django не переиспользуются. CONN_MAX_AGE с пулом - 0
+        DATABASES['default']['OPTIONS'] = {'pool': {
+            'min_size': 1,
+            'max_size': FSTR_DB_POOL_SIZE,
+            'timeout': int(os.getenv('FSTR_DB_POOL_TIMEOUT', 10)),  # секунд ожидания свободного соединения
+        }}
+    else:
+        # Без пула - постоянные соединения (по одному на поток), живут FSTR_DB_CONN_MAX_AGE секунд
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('FSTR_DB_CONN_MAX_AGE', 60))
+else:
+    DATABASES = {
+        'default':
+            {'ENGINE': 'django.db.backends.sqlite3',
+             'NAME': os.getenv('FSTR_SQLITE_PATH', BASE_DIR / 'sqlite3.db'),
+             # Тестовая БД в файле, а не в памяти: иначе потоки в тестах на параллельные запросы
+             # упираются в табличные блокировки shared cache ("database table is locked")
+             'TEST': {'NAME': BASE_DIR / 'test_sqlite3.db'}}
+    }
+    if os.getenv('FSTR_SQLITE_TUNED', '1') == '1':
+        # WAL: чтение не ждет записи, а запись - чтения. synchronous=NORMAL в режиме WAL не нарушает
+        # целостность (при отключении питания теряются только последние транзакции) и не делает fsync
+        # на каждый COMMIT. busy_timeout - сколько миллисекунд ждать занятую БД вместо ошибки
+        # "database is locked", mmap_size - страницы БД читаются через отображение файла в память.
+        # Транзакции IMMEDIATE берут блокировку записи сразу в BEGIN: две транзакции не упираются
+        # друг в друга при повышении блокировки с чтения до записи, а ждут по busy_timeout
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f"PRAGMA busy_timeout={int(os.getenv('FSTR_SQLITE_BUSY_TIMEOUT', 20000))};"
+                f"PRAGMA mmap_size={int(os.getenv('FSTR_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+# Реплики для чтения (fstr_app/db_router.py). FSTR_DB_REPLICAS - через запятую адреса серверов-реплик PostgreSQL
+# (host или host:port) или, в профиле sqlite, пути к копиям файла БД. Псевдонимы - replica1, replica2, ...
+FSTR_DB_REPLICAS = []
+for index, location in enumerate(filter(None, map(str.strip, os.getenv('FSTR_DB_REPLICAS', '').split(','))), start=1):
+    replica = copy.deepcopy(DATABASES['default'])
+    if FSTR_DB_ENGINE == 'postgresql':
+        host, _, port = location.partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    else:
+        replica['NAME'] = location
+    # В тестах реплика - та же тестовая БД
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{index}'] = replica
+    FSTR_DB_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['fstr_app.db_router.ReplicaRouter']
+# Реплика, отстающая больше чем на столько секунд, не используется; как часто замерять отставание, с
+FSTR_DB_REPLICA_MAX_LAG = float(os.getenv('FSTR_DB_REPLICA_MAX_LAG', 5))
+FSTR_DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('FSTR_DB_REPLICA_LAG_CHECK_INTERVAL', 2))
+# Сколько секунд после записи клиент читает с основной БД (cookie FSTR_DB_PRIMARY_COOKIE)
+FSTR_DB_READ_YOUR_WRITES_SECONDS = int(os.getenv('FSTR_DB_READ_YOUR_WRITES_SECONDS', 15))
+FSTR_DB_PRIMARY_COOKIE = 'fstr_primary'
+
+# Хранилище фотографий перевалов (файлы адресуются по SHA-256, см. fstr_app/storage.py)
+BLOB_STORAGE = {
+    'BACKEND': 'fstr_app.storage.FileSystemBlobStorage',
+    'OPTIONS': {
+        'location': os.getenv('FSTR_BLOB_ROOT', BASE_DIR / 'media' / 'blobs'),
+    },
+}
+
+# Максимальный размер одного фото в байтах
+FSTR_IMAGE_MAX_SIZE = int(os.getenv('FSTR_IMAGE_MAX_SIZE', 20 * 1024 * 1024))
+
+# Превью фото (fstr_app/renditions.py): каталог кэша, размеры по длинной стороне и число фоновых потоков
+FSTR_RENDITION_ROOT = os.getenv('FSTR_RENDITION_ROOT', BASE_DIR / 'media' / 'renditions')
+FSTR_RENDITION_SIZES = [128, 512, 1024]
+FSTR_RENDITION_WORKERS = int(os.getenv('FSTR_RENDITION_WORKERS', 2))
+
+# Очередь фоновых заданий в БД (fstr_app/jobs.py, воркер - manage.py run_jobs)
+FSTR_JOB_QUEUE_ENABLED = os.getenv('FSTR_JOB_QUEUE_ENABLED', '1') == '1'
+FSTR_JOB_MAX_ATTEMPTS = 5
+FSTR_JOB_RETRY_DELAY = 10  # секунд перед первым повтором, далее задержка удваивается
+FSTR_JOB_LOCK_TIMEOUT = 600  # через сколько секунд задание "зависшего" воркера снова попадает в очередь
+
+# Через сколько секунд после отвязки от перевала фото может удалить сборщик (manage.py gc_images)
+FSTR_IMAGE_GC_GRACE = int(os.getenv('FSTR_IMAGE_GC_GRACE', 3600))
+
+# Кэш ответов GET /submitData/<id>/ (fstr_app/response_cache.py). FSTR_RESPONSE_CACHE: locmem (LRU в памяти
+# процесса, не больше FSTR_RESPONSE_CACHE_MAX_ENTRIES записей), file (каталог media/response_cache) или redis://...
+FSTR_RESPONSE_CACHE = os.getenv('FSTR_RESPONSE_CACHE', 'locmem')
+FSTR_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('FSTR_RESPONSE_CACHE_MAX_ENTRIES', 10000))
+FSTR_RESPONSE_CACHE_TIMEOUT = int(os.getenv('FSTR_RESPONSE_CACHE_TIMEOUT', 3600))
+
+if FSTR_RESPONSE_CACHE.startswith(('redis://', 'rediss://')):
+    # Redis сам вытесняет записи по своей настройке maxmemory-policy
+    RESPONSE_CACHE = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': FSTR_RESPONSE_CACHE}
+elif FSTR_RESPONSE_CACHE == 'file':
+    RESPONSE_CACHE = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                      'LOCATION': os.getenv('FSTR_RESPONSE_CACHE_DIR', BASE_DIR / 'media' / 'response_cache'),
+                      'OPTIONS': {'MAX_ENTRIES': FSTR_RESPONSE_CACHE_MAX_ENTRIES}}
+else:
+    RESPONSE_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fstr-responses',
+                      'OPTIONS': {'MAX_ENTRIES': FSTR_RESPONSE_CACHE_MAX_ENTRIES}}
+RESPONSE_CACHE.update({'TIMEOUT': FSTR_RESPONSE_CACHE_TIMEOUT, 'KEY_PREFIX': 'fstr'})
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': RESPONSE_CACHE,
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -121,6 +231,29 @@ REST_FRAMEWORK = {
     # 'PAGE_SIZE': 10
 }
 
+# Размер страницы списков перевалов (fstr_app.pagination.PerevalCursorPagination)
+FSTR_PAGE_SIZE = int(os.getenv('FSTR_PAGE_SIZE', 20))
+FSTR_MAX_PAGE_SIZE = int(os.getenv('FSTR_MAX_PAGE_SIZE', 100))
+
+# Максимальный радиус поиска перевалов рядом с точкой (GET /submitData/nearby/), км
+FSTR_NEARBY_MAX_RADIUS_KM = 500
+
+# Сколько записей журнала изменений отдает GET /sync/ за один запрос (по умолчанию и максимум)
+FSTR_SYNC_BATCH_SIZE = int(os.getenv('FSTR_SYNC_BATCH_SIZE', 500))
+FSTR_SYNC_MAX_BATCH_SIZE = 2000
+
+# Очередь модерации (fstr_app.moderation): сколько перевалов модератор получает за раз (по умолчанию и максимум)
+# и через сколько секунд взятый, но не решенный перевал возвращается в очередь
+FSTR_MODERATION_BATCH_SIZE = int(os.getenv('FSTR_MODERATION_BATCH_SIZE', 20))
+FSTR_MODERATION_MAX_BATCH_SIZE = 100
+FSTR_MODERATION_CLAIM_TIMEOUT = int(os.getenv('FSTR_MODERATION_CLAIM_TIMEOUT', 1800))
+
+# По сколько строк выгрузка GET /submitData/export/ читает из БД (размер порции серверного курсора)
+FSTR_EXPORT_CHUNK_SIZE = int(os.getenv('FSTR_EXPORT_CHUNK_SIZE', 2000))
+
+# Async-варианты GET/POST /submitData/ и GET/PATCH /submitData/<id> (fstr_app/async_views.py) - для запуска под ASGI
+FSTR_ASYNC_VIEWS = os.getenv('FSTR_ASYNC_VIEWS', '0') == '1'
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'FTSR API - service',
     'DESCRIPTION': 'API для работы с БД федерации спорт туризма',
@@ -0,0 +1,18 @@
+import copy
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, FSTR_DB_ENGINE
+
+
+''' Настройки для автотестов: manage.py test и pytest (pytest.ini) берут их вместо sprintProject.settings.
+Добавляют псевдоним replica1 для теста маршрутизации чтений (fstr_app.tests.TestReplicaRouting), если реплики
+не заданы через FSTR_DB_REPLICAS. Чтения на него не идут, пока его нет в FSTR_DB_REPLICAS - тест включает его
+через override_settings. В SQLite его тестовая БД - отдельный файл (схему и данные тест копирует из основной,
+поэтому без миграций), в PostgreSQL тест пропускается, а тестовая БД - зеркало основной '''
+
+if 'replica1' not in DATABASES:
+    DATABASES['replica1'] = copy.deepcopy(DATABASES['default'])
+    DATABASES['replica1']['TEST'] = (
+        {'NAME': BASE_DIR / 'test_replica_sqlite3.db', 'MIGRATE': False} if FSTR_DB_ENGINE == 'sqlite'
+        else {'MIRROR': 'default'}
+    )